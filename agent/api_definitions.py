@@ -0,0 +1,224 @@
+"""Cache of the API definitions scanned by the api profile, keyed by the hash of their content."""
+
+import dataclasses
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import re
+import shutil
+from urllib import error, parse, request
+
+import yaml
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = datetime.timedelta(minutes=1)
+HTTP_METHODS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+# Files of a ZAP session that are not part of its content.
+SESSION_TRANSIENT_SUFFIXES = (".lck", ".tmp")
+
+
+class Error(Exception):
+    """Base API definition error."""
+
+
+class ApiDefinitionError(Error):
+    """The API definition could not be fetched or parsed."""
+
+
+@dataclasses.dataclass
+class ApiDefinition:
+    """API definition stored in the cache.
+
+    Attributes:
+        digest: SHA-256 of the definition content.
+        path: Path of the cached definition, passed to the scan script instead of the definition URL.
+        endpoints_path: Path of the parsed endpoints, read by the scan script hooks.
+        base_url: URL the endpoint paths are relative to.
+        endpoints: Path templates of the operations and their HTTP methods.
+        session_path: Path of the ZAP session holding the site tree imported from the definition.
+    """
+
+    digest: str
+    path: pathlib.Path
+    endpoints_path: pathlib.Path
+    base_url: str
+    endpoints: list[dict[str, str | list[str]]]
+    session_path: pathlib.Path
+
+
+def fetch(target: str, proxy: str | None = None, local_dir: str | None = None) -> bytes:
+    """Fetch an API definition from a URL or a local file.
+
+    Args:
+        target: URL of the definition, or path of the definition file.
+        proxy: Proxy URL the definition is downloaded through, the same as the scan.
+        local_dir: Directory the file paths are relative to, like the scan script does with its output directory.
+    """
+    try:
+        if parse.urlparse(target).scheme in ("http", "https"):
+            handlers = []
+            if proxy is not None:
+                handlers.append(request.ProxyHandler({"http": proxy, "https": proxy}))
+            with request.build_opener(*handlers).open(
+                target, timeout=FETCH_TIMEOUT.total_seconds()
+            ) as response:
+                return response.read()
+        if local_dir is not None:
+            return (pathlib.Path(local_dir) / target.lstrip("/")).read_bytes()
+        return pathlib.Path(target).read_bytes()
+    except (OSError, error.URLError, ValueError) as e:
+        raise ApiDefinitionError(f"could not fetch the API definition {target}") from e
+
+
+def parse_openapi(content: bytes) -> tuple[str, list[dict[str, str | list[str]]]]:
+    """Parse an OpenAPI or Swagger definition, in JSON or YAML.
+
+    Returns:
+        The server URL of the API, relative when the definition does not set the host, and the path templates of the
+        operations with their HTTP methods.
+    """
+    try:
+        definition = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        raise ApiDefinitionError("invalid API definition") from e
+    if (
+        isinstance(definition, dict) is False
+        or isinstance(definition.get("paths"), dict) is False
+    ):
+        raise ApiDefinitionError("API definition without paths")
+    if "swagger" in definition:
+        server_url = definition.get("basePath") or "/"
+        if definition.get("host") is not None:
+            scheme = (definition.get("schemes") or ["https"])[0]
+            server_url = f"{scheme}://{definition['host']}{server_url}"
+    else:
+        server_url = (definition.get("servers") or [{}])[0].get("url") or "/"
+    endpoints = []
+    for path, item in definition["paths"].items():
+        if isinstance(item, dict) is False:
+            continue
+        methods = sorted(m.upper() for m in item if m.lower() in HTTP_METHODS)
+        if len(methods) > 0:
+            endpoints.append({"path": path, "methods": methods})
+    return server_url, endpoints
+
+
+def origin(target: str) -> str | None:
+    """Scheme and host of a definition URL, the API is served from it, None for a local file."""
+    parsed_target = parse.urlparse(target)
+    if parsed_target.scheme not in ("http", "https"):
+        return None
+    return f"{parsed_target.scheme}://{parsed_target.netloc}"
+
+
+def _session_files(session_path: pathlib.Path) -> list[pathlib.Path]:
+    """Files of a ZAP session, the HSQLDB database files are named after the session file."""
+    return [
+        path
+        for path in session_path.parent.glob(f"{glob.escape(session_path.name)}*")
+        if path.suffix not in SESSION_TRANSIENT_SUFFIXES
+    ]
+
+
+def _copy(source: pathlib.Path, destination: pathlib.Path) -> None:
+    tmp_path = destination.with_name(f"{destination.name}.tmp")
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+class ApiDefinitionCache:
+    """Stores the API definitions and their parsed endpoints by content hash.
+
+    A definition scanned again is not parsed again, and the ZAP session of its first import is reused.
+    """
+
+    def __init__(self, directory: str, local_dir: str | None = None) -> None:
+        self._directory = pathlib.Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._local_dir = local_dir
+
+    def load(self, target: str, proxy: str | None = None) -> ApiDefinition:
+        """Fetch the definition of the target and get it from the cache, parsing and storing it on a miss.
+
+        Args:
+            target: URL of the definition, or path of the definition file relative to the local directory.
+            proxy: Proxy URL the definition is downloaded through.
+
+        Raises:
+            ApiDefinitionError: when the definition can not be fetched or parsed.
+        """
+        content = fetch(target, proxy=proxy, local_dir=self._local_dir)
+        digest = hashlib.sha256(content).hexdigest()
+        definition_path = self._directory / f"{digest}.definition"
+        endpoints_path = self._directory / f"{digest}.endpoints.json"
+        try:
+            parsed = json.loads(endpoints_path.read_text(encoding="utf-8"))
+            metrics.increment("zap_api_definition_cache_hits")
+        except (FileNotFoundError, json.JSONDecodeError):
+            server_url, endpoints = parse_openapi(content)
+            parsed = {"server_url": server_url, "endpoints": endpoints}
+            self._write(definition_path, content)
+            self._write(endpoints_path, json.dumps(parsed).encode())
+            metrics.increment("zap_api_definition_cache_misses")
+            logger.info(
+                "parsed API definition %s with %d endpoints", digest, len(endpoints)
+            )
+        target_origin = origin(target)
+        server_url = parsed["server_url"]
+        if target_origin is not None:
+            server_url = parse.urljoin(
+                target_origin, parse.urlparse(server_url).path or "/"
+            )
+        # The site tree holds absolute URLs, the session is only reusable for the same host.
+        host = re.sub(r"[^A-Za-z0-9.-]+", "_", parse.urlparse(server_url).netloc)
+        return ApiDefinition(
+            digest=digest,
+            path=definition_path,
+            endpoints_path=endpoints_path,
+            base_url=server_url,
+            endpoints=parsed["endpoints"],
+            session_path=self._directory / f"{digest}-{host}.session",
+        )
+
+    def restore_session(
+        self, definition: ApiDefinition, destination: pathlib.Path
+    ) -> bool:
+        """Copy the cached ZAP session of a definition, the scan loads the copy so the cached session never changes.
+
+        Returns:
+            Whether the definition has a cached session.
+        """
+        if definition.session_path.exists() is False:
+            return False
+        for path in _session_files(definition.session_path):
+            suffix = path.name.removeprefix(definition.session_path.name)
+            _copy(path, destination.with_name(f"{destination.name}{suffix}"))
+        return True
+
+    def save_session(self, definition: ApiDefinition, source: pathlib.Path) -> None:
+        """Store the ZAP session snapshot taken by a scan, unless the definition already has a cached session."""
+        if definition.session_path.exists() is True or source.exists() is False:
+            return
+        logger.info("caching the API site tree of %s", definition.digest)
+        # The session file is written last, the session is only reused once all its database files are cached.
+        for path in sorted(_session_files(source), key=lambda p: p == source):
+            suffix = path.name.removeprefix(source.name)
+            _copy(
+                path,
+                definition.session_path.with_name(
+                    f"{definition.session_path.name}{suffix}"
+                ),
+            )
+
+    @staticmethod
+    def _write(path: pathlib.Path, content: bytes) -> None:
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
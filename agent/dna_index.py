@@ -0,0 +1,121 @@
+"""Index of the DNAs of the vulnerabilities emitted by the agent, used to suppress duplicate reports."""
+
+import hashlib
+import logging
+import math
+import os
+import pathlib
+import struct
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 16
+BLOOM_FILTER_ERROR_RATE = 0.001
+# Header of the persisted bloom filter: number of bits and number of hash functions.
+BLOOM_FILTER_HEADER = struct.Struct("<QI")
+
+
+def dna_digest(dna: str) -> bytes:
+    """Compact digest of a DNA."""
+    return hashlib.blake2b(dna.encode(), digest_size=DIGEST_SIZE).digest()
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over DNA digests."""
+
+    def __init__(
+        self, bits_count: int, hashes_count: int, bits: bytearray | None = None
+    ) -> None:
+        self.bits_count = bits_count
+        self.hashes_count = hashes_count
+        self.bits = bits if bits is not None else bytearray((bits_count + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """Size a bloom filter to hold `capacity` entries with the provided false positive rate."""
+        bits_count = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        hashes_count = max(1, round(bits_count / capacity * math.log(2)))
+        return cls(bits_count, hashes_count)
+
+    def _positions(self, digest: bytes) -> list[int]:
+        # Double hashing: the k positions are derived from the two halves of the digest.
+        h1 = int.from_bytes(digest[: DIGEST_SIZE // 2], "little")
+        h2 = int.from_bytes(digest[DIGEST_SIZE // 2 :], "little") | 1
+        return [(h1 + i * h2) % self.bits_count for i in range(self.hashes_count)]
+
+    def add(self, digest: bytes) -> None:
+        """Add a digest to the filter."""
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        """Whether the digest was possibly added to the filter."""
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7)) != 0
+            for position in self._positions(digest)
+        )
+
+    def dumps(self) -> bytes:
+        """Serialize the filter."""
+        return BLOOM_FILTER_HEADER.pack(self.bits_count, self.hashes_count) + bytes(
+            self.bits
+        )
+
+    @classmethod
+    def loads(cls, data: bytes) -> "BloomFilter":
+        """Deserialize a filter serialized with `dumps`."""
+        bits_count, hashes_count = BLOOM_FILTER_HEADER.unpack_from(data)
+        return cls(
+            bits_count, hashes_count, bytearray(data[BLOOM_FILTER_HEADER.size :])
+        )
+
+
+class EmittedDnaIndex:
+    """Keeps the DNAs emitted during the agent lifetime.
+
+    Without a path, the exact digests are kept in memory. With a path, a bloom filter is used and persisted to it, so
+    the index survives agent restarts, at the cost of rare false positives.
+    """
+
+    def __init__(self, path: str | None = None, capacity: int = 1_000_000) -> None:
+        self._path = pathlib.Path(path) if path is not None else None
+        self._digests: set[bytes] = set()
+        self._bloom_filter: BloomFilter | None = None
+        if self._path is not None:
+            self._bloom_filter = self._load(self._path, capacity)
+
+    @staticmethod
+    def _load(path: pathlib.Path, capacity: int) -> BloomFilter:
+        try:
+            return BloomFilter.loads(path.read_bytes())
+        except FileNotFoundError:
+            return BloomFilter.for_capacity(capacity, BLOOM_FILTER_ERROR_RATE)
+        except struct.error:
+            logger.warning("invalid DNA index at %s, starting a new one", path)
+            return BloomFilter.for_capacity(capacity, BLOOM_FILTER_ERROR_RATE)
+
+    def __contains__(self, dna: str) -> bool:
+        """Whether the DNA was already emitted."""
+        digest = dna_digest(dna)
+        if self._bloom_filter is not None:
+            return digest in self._bloom_filter
+        return digest in self._digests
+
+    def add(self, dna: str) -> None:
+        """Record a DNA as emitted, once its vulnerability is reported."""
+        digest = dna_digest(dna)
+        if self._bloom_filter is not None:
+            self._bloom_filter.add(digest)
+        else:
+            self._digests.add(digest)
+
+    def flush(self) -> None:
+        """Persist the bloom filter to disk, if a path is set."""
+        if self._path is None or self._bloom_filter is None:
+            return
+        tmp_path = self._path.with_suffix(self._path.suffix + ".tmp")
+        try:
+            tmp_path.write_bytes(self._bloom_filter.dumps())
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            logger.warning("could not persist the DNA index to %s: %s", self._path, e)
@@ -0,0 +1,80 @@
+"""Local store of the findings of the previous scans, used to only emit the difference with the previous run."""
+
+import dataclasses
+import logging
+import sqlite3
+
+from agent import dna_index
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS findings (
+    target TEXT NOT NULL,
+    dna_digest BLOB NOT NULL,
+    title TEXT NOT NULL,
+    PRIMARY KEY (target, dna_digest)
+) WITHOUT ROWID
+"""
+
+
+@dataclasses.dataclass
+class FindingsDiff:
+    """Difference between the findings of a scan and the findings of the previous scan of the same target."""
+
+    new: set[str]
+    persisting: set[str]
+    resolved: list[str]
+
+
+class FindingsStore:
+    """SQLite store of the findings DNAs of the last scan of each target."""
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(SCHEMA)
+
+    def diff(self, target: str, findings: dict[str, str]) -> FindingsDiff:
+        """Difference between the findings of a scan and the stored findings of the target, the store is unchanged.
+
+        Args:
+            target: Scanned target.
+            findings: Title of each finding of the scan, keyed by DNA.
+
+        Returns:
+            New and persisting finding DNAs and the titles of the resolved findings.
+        """
+        digests = {dna_index.dna_digest(dna): dna for dna in findings}
+        previous = dict(
+            self._connection.execute(
+                "SELECT dna_digest, title FROM findings WHERE target = ?",
+                (target,),
+            ).fetchall()
+        )
+        return FindingsDiff(
+            new={dna for d, dna in digests.items() if d not in previous},
+            persisting={dna for d, dna in digests.items() if d in previous},
+            resolved=[title for d, title in previous.items() if d not in digests],
+        )
+
+    def commit(self, target: str, findings: dict[str, str]) -> None:
+        """Replace the stored findings of a target with the findings of its last scan.
+
+        Args:
+            target: Scanned target.
+            findings: Title of each finding of the scan, keyed by DNA.
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM findings WHERE target = ?", (target,))
+            self._connection.executemany(
+                "INSERT INTO findings (target, dna_digest, title) VALUES (?, ?, ?)",
+                [
+                    (target, dna_index.dna_digest(dna), title)
+                    for dna, title in findings.items()
+                ],
+            )
+
+    def close(self) -> None:
+        """Close the store."""
+        self._connection.close()
@@ -0,0 +1,113 @@
+"""Per-target index of the previous scans, used to only actively scan the pages changed since the last run."""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def _instance_key(alert: dict[str, Any], instance: dict[str, Any]) -> tuple:
+    return (
+        alert.get("pluginid"),
+        instance.get("uri"),
+        instance.get("method"),
+        instance.get("param"),
+    )
+
+
+def carry_forward(
+    previous_report: dict[str, Any],
+    report: dict[str, Any],
+    unchanged_urls: list[str],
+) -> dict[str, Any]:
+    """Add the findings of the previous report on unchanged URLs that are missing from the new report.
+
+    Args:
+        previous_report: ZAP JSON report of the previous scan.
+        report: ZAP JSON report of the current scan.
+        unchanged_urls: URLs that did not change since the previous scan and were not actively scanned.
+
+    Returns:
+        The merged ZAP JSON report.
+    """
+    unchanged = set(unchanged_urls)
+    merged = copy.deepcopy(report)
+    merged_sites = {site.get("@name"): site for site in merged.setdefault("site", [])}
+    carried_count = 0
+    for previous_site in previous_report.get("site", []):
+        site = merged_sites.get(previous_site.get("@name"))
+        if site is None:
+            site = {k: v for k, v in previous_site.items() if k != "alerts"}
+            site["alerts"] = []
+            merged["site"].append(site)
+            merged_sites[site.get("@name")] = site
+        alerts = {alert.get("pluginid"): alert for alert in site["alerts"]}
+        known_instances = {
+            _instance_key(alert, instance)
+            for alert in site["alerts"]
+            for instance in alert.get("instances", [])
+        }
+        for previous_alert in previous_site.get("alerts", []):
+            for instance in previous_alert.get("instances", []):
+                if instance.get("uri") not in unchanged:
+                    continue
+                if _instance_key(previous_alert, instance) in known_instances:
+                    continue
+                alert = alerts.get(previous_alert.get("pluginid"))
+                if alert is None:
+                    alert = {
+                        k: v for k, v in previous_alert.items() if k != "instances"
+                    }
+                    alert["instances"] = []
+                    site["alerts"].append(alert)
+                    alerts[alert.get("pluginid")] = alert
+                alert["instances"].append(instance)
+                known_instances.add(_instance_key(previous_alert, instance))
+                carried_count += 1
+    logger.info("carried forward %d findings on unchanged URLs", carried_count)
+    return merged
+
+
+class IncrementalIndex:
+    """Stores, for each target, the content fingerprints of the crawled URLs and the report of the last scan."""
+
+    def __init__(self, directory: str) -> None:
+        self._directory = pathlib.Path(directory)
+
+    def path(self, target: str) -> pathlib.Path:
+        """Path of the index file of a target."""
+        name = hashlib.sha256(target.encode()).hexdigest()
+        return self._directory / f"{name}.json"
+
+    def load(self, target: str) -> dict[str, Any] | None:
+        """Load the index of a target, None if the target was never scanned."""
+        try:
+            return json.loads(self.path(target).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            logger.warning("invalid incremental index for %s, ignoring it", target)
+            return None
+
+    def save(
+        self,
+        target: str,
+        fingerprints: dict[str, dict[str, str | None]],
+        report: dict[str, Any],
+    ) -> None:
+        """Save the fingerprints and the report of the last scan of a target."""
+        self._directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(target)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {"target": target, "fingerprints": fingerprints, "report": report}
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, path)
@@ -0,0 +1,74 @@
+"""Container-aware sizing of the ZAP JVM."""
+
+import logging
+import pathlib
+
+logger = logging.getLogger(__name__)
+
+CGROUP_V2_MEMORY_MAX_PATH = "/sys/fs/cgroup/memory.max"
+CGROUP_V1_MEMORY_LIMIT_PATH = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+# cgroup v1 reports an unlimited container with a value close to the max 64-bit integer.
+CGROUP_V1_UNLIMITED_THRESHOLD = 1 << 60
+# zap.sh reads the JVM options from the first line of this file.
+ZAP_JVM_PROPERTIES_PATH = "/home/zap/.ZAP/.ZAP_JVM.properties"
+
+MIB = 1024 * 1024
+# Heaps from this size use G1 to keep GC pauses short, smaller ones use the serial collector to save memory and
+# threads.
+G1_MIN_HEAP_MB = 2048
+G1_MAX_GC_PAUSE_MILLIS = 200
+# Heaps under this size are too small to keep the ZAP site tree and history in memory.
+IN_MEMORY_DATABASE_MIN_HEAP_MB = 1024
+
+DATABASE_MODE_MEMORY = "memory"
+DATABASE_MODE_FILE = "file"
+DATABASE_MODES = (DATABASE_MODE_MEMORY, DATABASE_MODE_FILE)
+
+
+def container_memory_limit_bytes() -> int | None:
+    """Read the memory limit of the container from the cgroup, None if the container is not limited."""
+    for path in (CGROUP_V2_MEMORY_MAX_PATH, CGROUP_V1_MEMORY_LIMIT_PATH):
+        try:
+            value = pathlib.Path(path).read_text(encoding="utf-8").strip()
+        except OSError:
+            continue
+        if value == "max" or value == "":
+            return None
+        limit = int(value)
+        if limit >= CGROUP_V1_UNLIMITED_THRESHOLD:
+            return None
+        return limit
+    return None
+
+
+def heap_size_mb(memory_limit_bytes: int, heap_ratio: float) -> int:
+    """Compute the max heap size in MB from the container memory limit."""
+    if heap_ratio <= 0 or heap_ratio >= 1:
+        raise ValueError(f"heap ratio must be between 0 and 1, got {heap_ratio}")
+    return int(memory_limit_bytes * heap_ratio) // MIB
+
+
+def jvm_options(heap_mb: int) -> list[str]:
+    """Build the JVM memory and GC options for the provided max heap size."""
+    options = [f"-Xmx{heap_mb}m"]
+    if heap_mb >= G1_MIN_HEAP_MB:
+        options += ["-XX:+UseG1GC", f"-XX:MaxGCPauseMillis={G1_MAX_GC_PAUSE_MILLIS}"]
+    else:
+        options.append("-XX:+UseSerialGC")
+    return options
+
+
+def database_mode(heap_mb: int | None) -> str:
+    """Pick the ZAP database mode from the max heap size, file-backed for small heaps."""
+    if heap_mb is not None and heap_mb < IN_MEMORY_DATABASE_MIN_HEAP_MB:
+        return DATABASE_MODE_FILE
+    return DATABASE_MODE_MEMORY
+
+
+def write_jvm_properties(options: list[str]) -> None:
+    """Persist the JVM options where zap.sh picks them up when starting ZAP."""
+    try:
+        with open(ZAP_JVM_PROPERTIES_PATH, "w", encoding="UTF-8") as properties:
+            properties.write(" ".join(options) + "\n")
+    except OSError as e:
+        logger.warning("could not write the ZAP JVM options: %s", e)
@@ -0,0 +1,60 @@
+"""In-process metrics registry for the Zap agent.
+
+Metrics are plain named values with optional labels, kept for the lifetime of the agent process and logged after
+each processed message.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_values: dict[str, float] = {}
+
+
+def _key(name: str, labels: dict[str, str] | None) -> str:
+    """Build the registry key of a metric from its name and labels."""
+    if not labels:
+        return name
+    formatted_labels = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{formatted_labels}}}"
+
+
+def set_gauge(name: str, value: float, labels: dict[str, str] | None = None) -> None:
+    """Set a gauge to the provided value."""
+    with _lock:
+        _values[_key(name, labels)] = value
+
+
+def increment(
+    name: str, value: float = 1, labels: dict[str, str] | None = None
+) -> None:
+    """Increment a counter by the provided value."""
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def get(name: str, labels: dict[str, str] | None = None) -> float | None:
+    """Get the current value of a metric, None if it was never set."""
+    with _lock:
+        return _values.get(_key(name, labels))
+
+
+def snapshot() -> dict[str, float]:
+    """Return a copy of all the metrics."""
+    with _lock:
+        return dict(_values)
+
+
+def reset() -> None:
+    """Drop all the metrics."""
+    with _lock:
+        _values.clear()
+
+
+def log_metrics() -> None:
+    """Log all the metrics, sorted by key."""
+    for key, value in sorted(snapshot().items()):
+        logger.info("metric %s=%s", key, value)
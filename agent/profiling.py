@@ -0,0 +1,124 @@
+"""On-demand profiling of the agent process and of the ZAP JVM."""
+
+import collections
+import datetime
+import logging
+import pathlib
+import re
+import subprocess
+import sys
+import threading
+from typing import Self
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_INTERVAL = datetime.timedelta(milliseconds=10)
+JFR_PRINT_TIMEOUT = datetime.timedelta(minutes=5)
+TOP_HOTSPOTS = 10
+JFR_STACK_TRACE_START = "stackTrace = ["
+
+
+def scan_profile_dir(root: str, target: str) -> pathlib.Path:
+    """Create the directory of the profiling artifacts of a scan."""
+    timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%dT%H%M%S")
+    name = re.sub(r"[^A-Za-z0-9.-]+", "_", target).strip("_")
+    path = pathlib.Path(root) / f"{timestamp}-{name}"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def jfr_option(recording_path: pathlib.Path) -> str:
+    """JVM option starting a Java Flight Recorder recording dumped to the provided path when the JVM exits."""
+    return f"-XX:StartFlightRecording=settings=profile,dumponexit=true,filename={recording_path}"
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread in the background.
+
+    The samples are aggregated as collapsed stacks, the format used to render flame graphs.
+    """
+
+    def __init__(self, interval: datetime.timedelta = SAMPLING_INTERVAL) -> None:
+        self._interval = interval
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.stacks: collections.Counter[tuple[str, ...]] = collections.Counter()
+
+    def _run(self) -> None:
+        while self._stop.wait(self._interval.total_seconds()) is False:
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_qualname} ({code.co_filename}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if len(stack) > 0:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path: pathlib.Path) -> None:
+        """Write the samples as collapsed stacks."""
+        with path.open("w", encoding="utf-8") as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{';'.join(stack)} {count}\n")
+
+    def hotspots(self, top: int = TOP_HOTSPOTS) -> list[tuple[str, int]]:
+        """Functions with the most samples on the top of the stack."""
+        counts: collections.Counter[str] = collections.Counter()
+        for stack, count in self.stacks.items():
+            counts[stack[-1]] += count
+        return counts.most_common(top)
+
+
+def jfr_hotspots(
+    recording_path: pathlib.Path, top: int = TOP_HOTSPOTS
+) -> list[tuple[str, int]]:
+    """Java methods with the most execution samples on the top of the stack in a JFR recording.
+
+    The samples are streamed from the text output of `jfr print`, the recording of a long scan does not fit in memory.
+    """
+    counts: collections.Counter[str] = collections.Counter()
+    try:
+        with subprocess.Popen(
+            ["jfr", "print", "--events", "jdk.ExecutionSample", str(recording_path)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ) as process:
+            timer = threading.Timer(JFR_PRINT_TIMEOUT.total_seconds(), process.kill)
+            timer.start()
+            try:
+                in_stack_trace = False
+                for line in process.stdout:
+                    line = line.strip()
+                    if line.startswith(JFR_STACK_TRACE_START):
+                        in_stack_trace = True
+                    elif in_stack_trace is True:
+                        # The first frame is the top of the stack, like `org.Parser.parse(byte[]) line: 12`.
+                        in_stack_trace = False
+                        if line != "]":
+                            counts[line.split("(", 1)[0]] += 1
+            finally:
+                timer.cancel()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning("could not read the JFR recording %s: %s", recording_path, e)
+        return []
+    return counts.most_common(top)
+
+
+def log_hotspots(source: str, hotspots: list[tuple[str, int]]) -> None:
+    """Log the hotspots of a profile."""
+    for name, count in hotspots:
+        logger.info("%s hotspot: %s (%d samples)", source, name, count)
@@ -0,0 +1,161 @@
+"""Pool of upstream proxies with health checks and least-load assignment of the scans."""
+
+import dataclasses
+import datetime
+import logging
+import socket
+import threading
+import time
+from urllib import parse
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_TIMEOUT = datetime.timedelta(seconds=5)
+HEALTH_CHECK_INTERVAL = datetime.timedelta(seconds=30)
+# Weight of the last measure in the moving average of the latency.
+LATENCY_SMOOTHING = 0.3
+
+
+class Error(Exception):
+    """Base proxy pool error."""
+
+
+class NoHealthyProxyError(Error):
+    """No proxy of the pool is healthy."""
+
+
+@dataclasses.dataclass
+class Proxy:
+    """Upstream proxy and its health and load statistics."""
+
+    url: str
+    host: str
+    port: int
+    healthy: bool = True
+    latency_ms: float | None = None
+    active_scans: int = 0
+    scans: int = 0
+    failures: int = 0
+
+
+class ProxyPool:
+    """Assigns scans to the healthy proxy with the least active scans, then the lowest latency."""
+
+    def __init__(
+        self,
+        proxies: list[str],
+        timeout: datetime.timedelta = HEALTH_CHECK_TIMEOUT,
+    ) -> None:
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.proxies = []
+        for url in proxies:
+            parsed_url = parse.urlparse(url)
+            if parsed_url.hostname is None or parsed_url.port is None:
+                logger.warning("Invalid proxy URL: %s", url)
+                continue
+            self.proxies.append(Proxy(url, parsed_url.hostname, parsed_url.port))
+
+    def check(self, proxy: Proxy) -> bool:
+        """Check a proxy accepts connections and update its health and latency."""
+        start = time.monotonic()
+        try:
+            with socket.create_connection(
+                (proxy.host, proxy.port), timeout=self._timeout.total_seconds()
+            ):
+                latency_ms = (time.monotonic() - start) * 1000
+            healthy = True
+        except OSError as e:
+            logger.warning("proxy %s is unhealthy: %s", proxy.url, e)
+            latency_ms = None
+            healthy = False
+        with self._lock:
+            if healthy is False and proxy.healthy is True:
+                proxy.failures += 1
+            proxy.healthy = healthy
+            if latency_ms is not None:
+                proxy.latency_ms = (
+                    latency_ms
+                    if proxy.latency_ms is None
+                    else LATENCY_SMOOTHING * latency_ms
+                    + (1 - LATENCY_SMOOTHING) * proxy.latency_ms
+                )
+            self._export(proxy)
+        return healthy
+
+    def check_all(self) -> None:
+        """Check all the proxies."""
+        for proxy in self.proxies:
+            self.check(proxy)
+
+    def start_health_checks(
+        self, interval: datetime.timedelta = HEALTH_CHECK_INTERVAL
+    ) -> None:
+        """Check all the proxies periodically in the background."""
+
+        def _run() -> None:
+            while self._stop.is_set() is False:
+                self.check_all()
+                self._stop.wait(interval.total_seconds())
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+
+    def stop_health_checks(self) -> None:
+        """Stop the background health checks."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def acquire(self) -> Proxy:
+        """Assign a scan to the healthy proxy with the least load.
+
+        Raises:
+            NoHealthyProxyError: when no proxy is healthy.
+        """
+        with self._lock:
+            healthy = [p for p in self.proxies if p.healthy is True]
+            if len(healthy) == 0:
+                raise NoHealthyProxyError("no healthy proxy in the pool")
+            proxy = min(
+                healthy,
+                key=lambda p: (
+                    p.active_scans,
+                    p.latency_ms if p.latency_ms is not None else float("inf"),
+                ),
+            )
+            proxy.active_scans += 1
+            proxy.scans += 1
+            self._export(proxy)
+            return proxy
+
+    def release(self, proxy: Proxy) -> None:
+        """Release the scan assigned to a proxy."""
+        with self._lock:
+            proxy.active_scans -= 1
+            self._export(proxy)
+
+    def failover(self, proxy: Proxy) -> Proxy:
+        """Move a scan from a dead proxy to the healthy proxy with the least load.
+
+        Raises:
+            NoHealthyProxyError: when no other proxy is healthy, the scan stays assigned to the dead proxy.
+        """
+        new_proxy = self.acquire()
+        self.release(proxy)
+        logger.info("scan moved from proxy %s to %s", proxy.url, new_proxy.url)
+        return new_proxy
+
+    @staticmethod
+    def _export(proxy: Proxy) -> None:
+        labels = {"proxy": proxy.url}
+        metrics.set_gauge("zap_proxy_healthy", int(proxy.healthy), labels=labels)
+        metrics.set_gauge("zap_proxy_active_scans", proxy.active_scans, labels=labels)
+        metrics.set_gauge("zap_proxy_scans", proxy.scans, labels=labels)
+        metrics.set_gauge("zap_proxy_failures", proxy.failures, labels=labels)
+        if proxy.latency_ms is not None:
+            metrics.set_gauge("zap_proxy_latency_ms", proxy.latency_ms, labels=labels)
@@ -3,13 +3,17 @@
 import dataclasses
 import json
 import re
+from concurrent import futures
 from typing import Any
+from urllib import parse
 
 from markdownify import markdownify as md
 from ostorlab.agent.kb import kb
 from ostorlab.agent.mixins import agent_report_vulnerability_mixin as vuln_mixin
 from ostorlab.assets import domain_name
 
+from agent import metrics, suppressions
+
 RISK_RATING_MAPPING = {
     0: vuln_mixin.RiskRating.INFO,
     1: vuln_mixin.RiskRating.LOW,
@@ -17,6 +21,9 @@ RISK_RATING_MAPPING = {
     3: vuln_mixin.RiskRating.HIGH,
 }
 
+# Number of alerts sent at once to a parsing process.
+PARSE_CHUNK_SIZE = 4
+
 CONFIDENCE_MAPPING = {
     0: "FALSE_POSITIVE",
     1: "LOW",
@@ -100,15 +107,105 @@ class Vulnerability:
     dna: str
 
 
-def parse_results(results: dict[str, Any], scope_urls_regex: str | None = None):
-    """Parses JSON generated Zap results and yield vulnerability entries.
-
-    Args:
-        results: Parsed JSON output.
-
-    Yields:
-        Vulnerability entry.
-    """
+def _parse_alert(target: str, host: str, alert: dict[str, Any]) -> list[Vulnerability]:
+    """Parse the instances of a ZAP alert into vulnerabilities."""
+    vulnerabilities = []
+    title = alert.get("name")
+    description = md(alert.get("desc"))
+    recommendation = md(alert.get("solution"))
+    technical_detail_header = md(alert.get("otherinfo"))
+    risk_rating_id = int(alert.get("riskcode"))
+    confidence_id = int(alert.get("confidence"))
+    references = {
+        r: r for r in alert.get("reference").replace("<p>", "").split("</p>") if r != ""
+    }
+    cweid = alert.get("cweid")
+    references[f"cwe-{cweid}"] = f"https://nvd.nist.gov/vuln/detail/{cweid}.html"
+    for instance in alert.get("instances"):
+        uri = instance.get("uri")
+        method = instance.get("method")
+        param = instance.get("param")
+        attack = instance.get("attack")
+        evidence = instance.get("evidence")
+
+        technical_detail = _build_technical_detail(
+            title=title,
+            target=target,
+            header=technical_detail_header,
+            uri=uri,
+            method=method,
+            param=param,
+            attack=attack,
+            evidence=evidence,
+        )
+        vuln_location = vuln_mixin.VulnerabilityLocation(
+            asset=domain_name.DomainName(name=host),
+            metadata=[
+                vuln_mixin.VulnerabilityLocationMetadata(
+                    metadata_type=vuln_mixin.MetadataType.URL, value=uri
+                )
+            ],
+        )
+        dna = _compute_dna(
+            vulnerability_title=title,
+            vuln_location=vuln_location,
+            param=param,
+        )
+        vulnerabilities.append(
+            Vulnerability(
+                entry=kb.Entry(
+                    title=title,
+                    risk_rating=_map_risk_rating(risk_rating_id, confidence_id).value,
+                    short_description=description,
+                    description=description,
+                    recommendation=recommendation,
+                    references=references,
+                    security_issue=True,
+                    privacy_issue=False,
+                    has_public_exploit=False,
+                    targeted_by_malware=False,
+                    targeted_by_ransomware=False,
+                    targeted_by_nation_state=False,
+                    cvss_v3_vector="",
+                ),
+                technical_detail=technical_detail,
+                risk_rating=_map_risk_rating(risk_rating_id, confidence_id),
+                vulnerability_location=vuln_location,
+                dna=dna,
+            )
+        )
+    return vulnerabilities
+
+
+def _suppress_instances(
+    host: str, alert: dict[str, Any], suppression_index: suppressions.SuppressionIndex
+) -> dict[str, Any]:
+    """Copy of the alert without its instances that are known false positives."""
+    plugin_id = alert.get("pluginid")
+    instances = [
+        instance
+        for instance in alert.get("instances")
+        if suppression_index.is_suppressed(
+            plugin_id, host, parse.urlparse(instance.get("uri")).path or "/"
+        )
+        is False
+    ]
+    suppressed_count = len(alert.get("instances")) - len(instances)
+    if suppressed_count > 0:
+        metrics.increment(
+            "zap_suppressed_alert_instances",
+            suppressed_count,
+            labels={"plugin": plugin_id},
+        )
+    return {**alert, "instances": instances}
+
+
+def _alerts(
+    results: dict[str, Any],
+    scope_urls_regex: str | None,
+    suppression_index: suppressions.SuppressionIndex | None = None,
+):
+    """Yield the (target, host, alert) of every in-scope site of the results, without the suppressed instances."""
     for site in results.get("site", []):
         target = site.get("@name")
         if scope_urls_regex is not None and re.match(scope_urls_regex, target) is None:
@@ -116,71 +213,42 @@ def parse_results(results: dict[str, Any], scope_urls_regex: str | None = None):
 
         host = site.get("@host")
         for alert in site.get("alerts"):
-            title = alert.get("name")
-            description = md(alert.get("desc"))
-            recommendation = md(alert.get("solution"))
-            technical_detail_header = md(alert.get("otherinfo"))
-            risk_rating_id = int(alert.get("riskcode"))
-            confidence_id = int(alert.get("confidence"))
-            references = {
-                r: r
-                for r in alert.get("reference").replace("<p>", "").split("</p>")
-                if r != ""
-            }
-            cweid = alert.get("cweid")
-            references[f"cwe-{cweid}"] = (
-                f"https://nvd.nist.gov/vuln/detail/{cweid}.html"
-            )
-            for instance in alert.get("instances"):
-                uri = instance.get("uri")
-                method = instance.get("method")
-                param = instance.get("param")
-                attack = instance.get("attack")
-                evidence = instance.get("evidence")
-
-                technical_detail = _build_technical_detail(
-                    title=title,
-                    target=target,
-                    header=technical_detail_header,
-                    uri=uri,
-                    method=method,
-                    param=param,
-                    attack=attack,
-                    evidence=evidence,
-                )
-                vuln_location = vuln_mixin.VulnerabilityLocation(
-                    asset=domain_name.DomainName(name=host),
-                    metadata=[
-                        vuln_mixin.VulnerabilityLocationMetadata(
-                            metadata_type=vuln_mixin.MetadataType.URL, value=uri
-                        )
-                    ],
-                )
-                dna = _compute_dna(
-                    vulnerability_title=title,
-                    vuln_location=vuln_location,
-                    param=param,
-                )
-                yield Vulnerability(
-                    entry=kb.Entry(
-                        title=title,
-                        risk_rating=_map_risk_rating(
-                            risk_rating_id, confidence_id
-                        ).value,
-                        short_description=description,
-                        description=description,
-                        recommendation=recommendation,
-                        references=references,
-                        security_issue=True,
-                        privacy_issue=False,
-                        has_public_exploit=False,
-                        targeted_by_malware=False,
-                        targeted_by_ransomware=False,
-                        targeted_by_nation_state=False,
-                        cvss_v3_vector="",
-                    ),
-                    technical_detail=technical_detail,
-                    risk_rating=_map_risk_rating(risk_rating_id, confidence_id),
-                    vulnerability_location=vuln_location,
-                    dna=dna,
-                )
+            if suppression_index is not None:
+                alert = _suppress_instances(host, alert, suppression_index)
+                if len(alert["instances"]) == 0:
+                    continue
+            yield target, host, alert
+
+
+def parse_results(
+    results: dict[str, Any],
+    scope_urls_regex: str | None = None,
+    workers: int | None = None,
+    suppression_index: suppressions.SuppressionIndex | None = None,
+):
+    """Parses JSON generated Zap results and yield vulnerability entries.
+
+    Args:
+        results: Parsed JSON output.
+        scope_urls_regex: Regex of the in-scope sites, all sites are parsed if not set.
+        workers: Number of processes parsing the alerts in parallel. None or 1 parses them in the current process.
+        suppression_index: Known false positives, dropped before they are parsed.
+
+    Yields:
+        Vulnerability entry, in the same order whether parsed in parallel or not.
+    """
+    alerts = _alerts(results, scope_urls_regex, suppression_index)
+    if workers is None or workers <= 1:
+        for target, host, alert in alerts:
+            yield from _parse_alert(target, host, alert)
+        return
+
+    alerts = list(alerts)
+    if len(alerts) == 0:
+        return
+    targets, hosts, site_alerts = zip(*alerts, strict=True)
+    with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for vulnerabilities in executor.map(
+            _parse_alert, targets, hosts, site_alerts, chunksize=PARSE_CHUNK_SIZE
+        ):
+            yield from vulnerabilities
@@ -0,0 +1,90 @@
+"""Statistics of the active scan rules kept across runs, used to enforce a time budget on slow rules."""
+
+import json
+import logging
+import os
+import pathlib
+from typing import Any
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of runs of a rule before its statistics are trusted to skip it.
+MIN_RUNS_BEFORE_SKIP = 3
+# A skipped rule runs again, capped, every that many scans, so it is re-enabled once it raises an alert.
+REPROBE_INTERVAL = 10
+
+
+class RuleStatsStore:
+    """Aggregated duration, request count and alert count of each active scan rule, persisted as JSON."""
+
+    def __init__(self, path: str | None) -> None:
+        self._path = pathlib.Path(path) if path is not None else None
+        self._stats: dict[str, dict[str, Any]] = {}
+        if self._path is not None and self._path.exists():
+            try:
+                self._stats = json.loads(self._path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                logger.warning("invalid rule statistics at %s, ignoring them", path)
+
+    def record(self, scan_stats: list[dict[str, Any]]) -> None:
+        """Add the statistics of the rules of a scan and export them as metrics.
+
+        Rules that did not send any request, like the ones skipped for being over budget, did not run and are not
+        counted, they would otherwise lower the average duration and be run again on the next scan.
+        """
+        for rule in scan_stats:
+            if rule["request_count"] == 0:
+                continue
+            stats = self._stats.setdefault(
+                rule["id"],
+                {
+                    "name": rule["name"],
+                    "runs": 0,
+                    "time_ms": 0,
+                    "request_count": 0,
+                    "alert_count": 0,
+                },
+            )
+            stats["runs"] += 1
+            for counter in ("time_ms", "request_count", "alert_count"):
+                stats[counter] += rule[counter]
+                metrics.increment(
+                    f"zap_rule_{counter}", rule[counter], labels={"rule": rule["id"]}
+                )
+        self._save()
+
+    def _save(self) -> None:
+        if self._path is None:
+            return
+        tmp_path = self._path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._stats), encoding="utf-8")
+        os.replace(tmp_path, self._path)
+
+    def slow_rules(self, budget_ms: int) -> list[str]:
+        """Rules that never raised an alert and take on average more than the budget."""
+        slow = []
+        for rule_id, stats in self._stats.items():
+            if stats["runs"] < MIN_RUNS_BEFORE_SKIP or stats["alert_count"] > 0:
+                continue
+            if stats["time_ms"] / stats["runs"] > budget_ms:
+                slow.append(rule_id)
+        return sorted(slow)
+
+    def rules_to_skip(self, budget_ms: int) -> list[str]:
+        """Slow rules to skip on the next scan, each of them is left to run every `REPROBE_INTERVAL` scans.
+
+        A skipped rule sends no request and its statistics never change, the periodic runs give the rules that raise
+        alerts on the newer targets a chance to be re-enabled.
+        """
+        skipped = []
+        for rule_id in self.slow_rules(budget_ms):
+            stats = self._stats[rule_id]
+            stats["skipped_scans"] = stats.get("skipped_scans", 0) + 1
+            if stats["skipped_scans"] % REPROBE_INTERVAL == 0:
+                logger.info("re-probing the skipped rule %s", rule_id)
+                continue
+            skipped.append(rule_id)
+        self._save()
+        return skipped
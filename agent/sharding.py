@@ -0,0 +1,279 @@
+"""Sharding of the targets across the agent replicas by registrable domain, with consistent hashing.
+
+Every replica owns the targets whose registrable domain hashes to it on the ring, so the caches and indexes of a host
+stay on a single replica. Replicas announce themselves with heartbeat files in a shared directory, the ring is rebuilt
+when a replica joins or leaves and only the targets of the changed replicas move. Targets are forwarded to their owner
+through an inbox in the same directory, so the other agents listening on the bus never see them twice.
+"""
+
+import base64
+import bisect
+import dataclasses
+import datetime
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import uuid
+from urllib import parse
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+VIRTUAL_NODES = 100
+HEARTBEAT_INTERVAL = datetime.timedelta(seconds=10)
+HEARTBEAT_TTL = datetime.timedelta(seconds=30)
+# Public suffixes made of two labels, the registrable domain is then made of three labels.
+MULTI_LABEL_SUFFIXES = frozenset(
+    {
+        "co.uk",
+        "org.uk",
+        "ac.uk",
+        "gov.uk",
+        "com.au",
+        "net.au",
+        "org.au",
+        "co.jp",
+        "ne.jp",
+        "co.nz",
+        "co.za",
+        "com.br",
+        "com.cn",
+        "com.mx",
+        "com.tr",
+        "co.in",
+        "co.kr",
+        "com.sg",
+    }
+)
+
+
+def registrable_domain(target: str) -> str:
+    """Registrable domain of the host of a target URL or domain name, the IP itself for an IP."""
+    host = (parse.urlparse(target).hostname or target).lower().rstrip(".")
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    labels = host.split(".")
+    suffix_labels = 2 if ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES else 1
+    return ".".join(labels[-(suffix_labels + 1) :])
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest())
+
+
+class HashRing:
+    """Consistent hashing ring of the replicas, each placed at several virtual points to even out the load."""
+
+    def __init__(self, replicas: list[str], virtual_nodes: int = VIRTUAL_NODES) -> None:
+        self._virtual_nodes = virtual_nodes
+        self._points: list[int] = []
+        self._replicas: dict[int, str] = {}
+        for replica in replicas:
+            self.add(replica)
+
+    @property
+    def replicas(self) -> set[str]:
+        return set(self._replicas.values())
+
+    def add(self, replica: str) -> None:
+        for index in range(self._virtual_nodes):
+            point = _hash(f"{replica}#{index}")
+            if point not in self._replicas:
+                bisect.insort(self._points, point)
+            self._replicas[point] = replica
+
+    def remove(self, replica: str) -> None:
+        for index in range(self._virtual_nodes):
+            point = _hash(f"{replica}#{index}")
+            if self._replicas.get(point) == replica:
+                del self._replicas[point]
+                self._points.remove(point)
+
+    def owner(self, key: str) -> str | None:
+        """Replica owning a key, the first one clockwise of its hash, None when the ring is empty."""
+        if len(self._points) == 0:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._replicas[self._points[index]]
+
+
+class FileMembership:
+    """Replicas alive, tracked with heartbeat files in a directory shared by the replicas."""
+
+    def __init__(
+        self,
+        directory: str,
+        replica_id: str,
+        ttl: datetime.timedelta = HEARTBEAT_TTL,
+    ) -> None:
+        self._directory = pathlib.Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self.replica_id = replica_id
+        self._ttl = ttl
+
+    def heartbeat(self) -> None:
+        """Announce the replica is alive."""
+        (self._directory / self.replica_id).touch()
+
+    def leave(self) -> None:
+        """Announce the replica left."""
+        (self._directory / self.replica_id).unlink(missing_ok=True)
+
+    def live_replicas(self) -> set[str]:
+        """Replicas with a heartbeat more recent than the TTL."""
+        deadline = time.time() - self._ttl.total_seconds()
+        replicas = set()
+        for path in self._directory.iterdir():
+            # Entries starting with a dot, like the inboxes, are not heartbeats.
+            if path.name.startswith("."):
+                continue
+            try:
+                if path.stat().st_mtime >= deadline:
+                    replicas.add(path.name)
+            except FileNotFoundError:
+                continue
+        return replicas
+
+
+class ShardRouter:
+    """Maps the targets to their owning replica, following the replicas joining and leaving."""
+
+    def __init__(
+        self, membership: FileMembership, virtual_nodes: int = VIRTUAL_NODES
+    ) -> None:
+        self._membership = membership
+        self._ring = HashRing([], virtual_nodes=virtual_nodes)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def replica_id(self) -> str:
+        return self._membership.replica_id
+
+    @property
+    def replicas(self) -> set[str]:
+        """Replicas of the ring."""
+        with self._lock:
+            return self._ring.replicas | {self.replica_id}
+
+    def refresh(self) -> None:
+        """Heartbeat and rebalance the ring on the replicas that joined or left."""
+        self._membership.heartbeat()
+        live = self._membership.live_replicas() | {self.replica_id}
+        with self._lock:
+            current = self._ring.replicas
+            for replica in sorted(live - current):
+                logger.info("replica %s joined the shard ring", replica)
+                self._ring.add(replica)
+            for replica in sorted(current - live):
+                logger.info("replica %s left the shard ring", replica)
+                self._ring.remove(replica)
+        metrics.set_gauge("zap_shard_replicas", len(live))
+
+    def start(self, interval: datetime.timedelta = HEARTBEAT_INTERVAL) -> None:
+        """Join the ring and keep the membership fresh in the background."""
+        self.refresh()
+
+        def _run() -> None:
+            while self._stop.wait(interval.total_seconds()) is False:
+                self.refresh()
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Leave the ring."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._membership.leave()
+
+    def owner(self, target: str) -> str:
+        """Replica owning a target."""
+        with self._lock:
+            return self._ring.owner(registrable_domain(target)) or self.replica_id
+
+    def is_owner(self, target: str) -> bool:
+        """Check whether this replica owns a target."""
+        return self.owner(target) == self.replica_id
+
+
+@dataclasses.dataclass
+class ForwardedMessage:
+    """Message forwarded to the owner of its target.
+
+    Attributes:
+        selector: Selector of the message.
+        raw: Serialized message.
+        forwards: Number of times the message was forwarded.
+    """
+
+    selector: str
+    raw: bytes
+    forwards: int
+
+
+class FileInbox:
+    """Messages addressed to a replica, as files in a directory shared by the replicas."""
+
+    def __init__(self, directory: str, replica_id: str) -> None:
+        self._directory = pathlib.Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self.replica_id = replica_id
+
+    def send(self, replica_id: str, message: ForwardedMessage) -> None:
+        """Address a message to a replica."""
+        inbox = self._directory / replica_id
+        inbox.mkdir(exist_ok=True)
+        name = f"{time.time_ns()}-{uuid.uuid4().hex}"
+        tmp_path = inbox / f".{name}.tmp"
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "selector": message.selector,
+                    "raw": base64.b64encode(message.raw).decode(),
+                    "forwards": message.forwards,
+                }
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, inbox / name)
+
+    def receive(self, live_replicas: set[str]) -> list[ForwardedMessage]:
+        """Take the messages addressed to this replica and the ones left to the replicas that are not live anymore.
+
+        A message is claimed by renaming it, so a message is only taken by a single replica.
+        """
+        messages = []
+        for inbox in sorted(self._directory.iterdir()):
+            if inbox.name != self.replica_id and inbox.name in live_replicas:
+                continue
+            for path in sorted(
+                p for p in inbox.iterdir() if not p.name.startswith(".")
+            ):
+                claimed_path = path.with_name(f".{path.name}.{self.replica_id}")
+                try:
+                    os.replace(path, claimed_path)
+                except FileNotFoundError:
+                    # Claimed by another replica.
+                    continue
+                content = json.loads(claimed_path.read_text(encoding="utf-8"))
+                claimed_path.unlink()
+                messages.append(
+                    ForwardedMessage(
+                        selector=content["selector"],
+                        raw=base64.b64decode(content["raw"]),
+                        forwards=content["forwards"],
+                    )
+                )
+        return messages
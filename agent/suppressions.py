@@ -0,0 +1,124 @@
+"""Index of the known false positives, suppressed before the vulnerabilities are built.
+
+Rules are read from a YAML file, each rule suppressing the alerts of a ZAP plugin on a host and optionally on a path:
+
+    - plugin_id: 10038
+      host: "*.example.com"
+      path: "^/static/"
+      reason: "CSP set by the CDN."
+
+The host is an exact host name, `*.` followed by a domain to match its subdomains, or `*` to match every host. The
+path is a regex matched from the start of the URL path, all the paths are matched when it is not set.
+"""
+
+import dataclasses
+import logging
+import pathlib
+import re
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+ANY_HOST = "*"
+
+
+class Error(Exception):
+    """Base suppression error."""
+
+
+class InvalidSuppressionRuleError(Error):
+    """A suppression rule is malformed."""
+
+
+@dataclasses.dataclass
+class _HostNode:
+    children: dict[str, "_HostNode"] = dataclasses.field(default_factory=dict)
+    # Values of the patterns ending at this node.
+    values: list = dataclasses.field(default_factory=list)
+    # Values of the `*.` patterns ending at this node, matching the subdomains only.
+    wildcard_values: list = dataclasses.field(default_factory=list)
+
+
+class HostTrie:
+    """Trie of host patterns keyed by their labels from the top-level domain down."""
+
+    def __init__(self) -> None:
+        self._root = _HostNode()
+
+    def insert(self, pattern: str, value) -> None:
+        """Add the value of a host pattern."""
+        node = self._root
+        labels = pattern.lower().split(".")[::-1]
+        for index, label in enumerate(labels):
+            if label == ANY_HOST and index == len(labels) - 1:
+                node.wildcard_values.append(value)
+                return
+            node = node.children.setdefault(label, _HostNode())
+        node.values.append(value)
+
+    def match(self, host: str) -> list:
+        """Values of all the patterns matching a host."""
+        node = self._root
+        matches = list(node.wildcard_values)
+        labels = host.lower().split(".")[::-1]
+        for index, label in enumerate(labels):
+            node = node.children.get(label)
+            if node is None:
+                return matches
+            if index < len(labels) - 1:
+                matches.extend(node.wildcard_values)
+        matches.extend(node.values)
+        return matches
+
+
+class SuppressionIndex:
+    """Suppression rules indexed by plugin ID, then host, then path regex."""
+
+    def __init__(self, rules: list[dict]) -> None:
+        self._index: dict[str, HostTrie] = {}
+        for rule in rules:
+            try:
+                plugin_id = str(rule["plugin_id"])
+                path = re.compile(rule["path"]) if rule.get("path") else None
+            except (KeyError, TypeError, re.error) as e:
+                raise InvalidSuppressionRuleError(
+                    f"invalid suppression rule {rule}"
+                ) from e
+            trie = self._index.setdefault(plugin_id, HostTrie())
+            trie.insert(str(rule.get("host") or ANY_HOST), path)
+
+    @classmethod
+    def from_file(cls, path: str) -> "SuppressionIndex":
+        """Compile the rules of a YAML file.
+
+        Raises:
+            InvalidSuppressionRuleError: when the file or one of its rules is malformed.
+        """
+        try:
+            rules = yaml.safe_load(pathlib.Path(path).read_text(encoding="utf-8"))
+        except yaml.YAMLError as e:
+            raise InvalidSuppressionRuleError(
+                f"invalid suppression rules {path}"
+            ) from e
+        if isinstance(rules, list) is False:
+            raise InvalidSuppressionRuleError(f"suppression rules {path} is not a list")
+        logger.info("loaded %d suppression rules from %s", len(rules), path)
+        return cls(rules)
+
+    def is_suppressed(self, plugin_id: str, host: str, path: str) -> bool:
+        """Check whether the alerts of a plugin on a URL are known false positives."""
+        trie = self._index.get(str(plugin_id))
+        if trie is None:
+            return False
+        return any(
+            regex is None or regex.match(path) is not None for regex in trie.match(host)
+        )
+
+    def suppressed_plugins(self, host: str) -> list[str]:
+        """Plugins suppressed on all the paths of a host."""
+        return sorted(
+            plugin_id
+            for plugin_id, trie in self._index.items()
+            if any(regex is None for regex in trie.match(host))
+        )
@@ -0,0 +1,114 @@
+"""Disk budget enforcement of the ZAP work directories."""
+
+import datetime
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def disk_usage_bytes(path: pathlib.Path) -> int:
+    """Compute the disk usage of a file or a directory tree, 0 if it does not exist."""
+    if path.is_symlink() or path.is_file():
+        try:
+            return path.lstat().st_size
+        except OSError:
+            return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                # The file was removed while walking the tree.
+                continue
+    return total
+
+
+def _remove(path: pathlib.Path) -> None:
+    """Remove a file or a directory tree."""
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class WorkDirGarbageCollector:
+    """Keeps the disk usage of the ZAP work directories under a budget.
+
+    Only the entries whose name starts with `prefix`, the per-scan work directories, are accounted and removed, the
+    other files of the directories, like user mounted policies, are left alone. When the budget is exceeded, the
+    oldest entries are removed first. Entries younger than `min_age` are never removed as they may still be used by a
+    running scan.
+    """
+
+    def __init__(
+        self,
+        directories: list[str],
+        prefix: str,
+        budget_bytes: int | None,
+        min_age: datetime.timedelta,
+        interval: datetime.timedelta,
+    ) -> None:
+        self._directories = [pathlib.Path(d) for d in directories]
+        self._prefix = prefix
+        self._budget_bytes = budget_bytes
+        self._min_age = min_age
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        """Start collecting in the background."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop collecting and wait for the background thread to exit."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while self._stop.is_set() is False:
+            try:
+                self.collect()
+            except OSError as e:
+                logger.warning("work directory garbage collection failed: %s", e)
+            self._stop.wait(self._interval.total_seconds())
+
+    def collect(self) -> int:
+        """Remove the oldest entries until the disk usage is under budget and return the disk usage in bytes."""
+        entries = []
+        for directory in self._directories:
+            if directory.is_dir() is False:
+                continue
+            for entry in directory.glob(f"{self._prefix}*"):
+                try:
+                    mtime = entry.lstat().st_mtime
+                except OSError:
+                    continue
+                entries.append((mtime, entry, disk_usage_bytes(entry)))
+        usage = sum(size for _, _, size in entries)
+        if self._budget_bytes is not None and usage > self._budget_bytes:
+            newest_removable_mtime = time.time() - self._min_age.total_seconds()
+            for mtime, entry, size in sorted(entries, key=lambda e: e[0]):
+                if usage <= self._budget_bytes or mtime > newest_removable_mtime:
+                    break
+                logger.info("removing %s to stay under the disk budget", entry)
+                _remove(entry)
+                usage -= size
+                metrics.increment("zap_work_dir_removed_bytes", size)
+            if usage > self._budget_bytes:
+                logger.warning(
+                    "work directories use %d bytes, over the budget of %d bytes",
+                    usage,
+                    self._budget_bytes,
+                )
+        metrics.set_gauge("zap_work_dir_disk_usage_bytes", usage)
+        return usage
@@ -2,8 +2,14 @@
 
 import datetime
 import logging
+import pathlib
 import re
+import signal
+import socket
 import subprocess
+import threading
+import time
+import types
 from typing import cast
 
 from ostorlab.agent import agent
@@ -13,7 +19,18 @@ from ostorlab.agent.mixins import agent_report_vulnerability_mixin as vuln_mixin
 from ostorlab.runtimes import definitions as runtime_definitions
 from rich import logging as rich_logging
 
-from agent import result_parser, zap_wrapper
+from agent import (
+    dna_index,
+    findings_store,
+    metrics,
+    profiling,
+    proxy_pool,
+    result_parser,
+    sharding,
+    suppressions,
+    work_dir,
+    zap_wrapper,
+)
 
 
 class Error(Exception):
@@ -29,6 +46,19 @@ class SetUpVpnError(Error):
 
 
 COMMAND_TIMEOUT = datetime.timedelta(minutes=1)
+WORK_DIR_GC_INTERVAL = datetime.timedelta(minutes=1)
+MIB = 1024 * 1024
+PROFILING_SIGNAL = signal.SIGUSR1
+PROFILING_DIR = "/home/zap/profiles"
+PYTHON_PROFILE_FILE_NAME = "agent.collapsed"
+JFR_RECORDING_FILE_NAME = "zap.jfr"
+SHARD_MODE_FORWARD = "forward"
+SHARD_MODE_SKIP = "skip"
+SHARD_MODES = (SHARD_MODE_FORWARD, SHARD_MODE_SKIP)
+# Forwards of a target that did not reach its owner before the replica scans it itself.
+MAX_SHARD_FORWARDS = 3
+SHARD_INBOX_DIR_NAME = ".inbox"
+SHARD_INBOX_POLL_INTERVAL = datetime.timedelta(seconds=5)
 
 WIREGUARD_CONFIG_FILE_PATH = "/etc/wireguard/wg0.conf"
 DNS_RESOLV_CONFIG_PATH = "/etc/resolv.conf"
@@ -61,6 +91,110 @@ class ZapAgent(agent.Agent, vuln_mixin.AgentReportVulnMixin):
         self._scan_profile: str | None = self.args.get("scan_profile")
         self._crawl_timeout: int | None = self.args.get("crawl_timeout")
         self._proxy: str | None = self.args.get("proxy")
+        self._proxy_pool: proxy_pool.ProxyPool | None = None
+        if len(self.args.get("proxies") or []) > 0:
+            self._proxy_pool = proxy_pool.ProxyPool(self.args.get("proxies"))
+        self._ajax_spider_browsers: int | None = self.args.get("ajax_spider_browsers")
+        self._ajax_spider_headless: bool = self.args.get("ajax_spider_headless", False)
+        self._ajax_spider_max_crawl_states: int | None = self.args.get(
+            "ajax_spider_max_crawl_states"
+        )
+        self._ajax_spider_max_crawl_depth: int | None = self.args.get(
+            "ajax_spider_max_crawl_depth"
+        )
+        self._ajax_spider_max_duration: int | None = self.args.get(
+            "ajax_spider_max_duration"
+        )
+        self._jvm_heap_ratio: float | None = self.args.get("jvm_heap_ratio")
+        self._zap_database_mode: str | None = self.args.get("zap_database_mode")
+        self._zap_database_recovery_log: bool | None = self.args.get(
+            "zap_database_recovery_log"
+        )
+        self._zap_history_prune_interval: int | None = self.args.get(
+            "zap_history_prune_interval"
+        )
+        self._work_dir: str | None = self.args.get("work_dir")
+        self._work_dir_disk_budget_mb: int | None = self.args.get(
+            "work_dir_disk_budget_mb"
+        )
+        self._zap_session_in_work_dir: bool | None = self.args.get(
+            "zap_session_in_work_dir"
+        )
+        self._incremental_index_dir: str | None = self.args.get("incremental_index_dir")
+        self._rule_stats_path: str | None = self.args.get("rule_stats_path")
+        self._rule_time_budget: int | None = self.args.get("rule_time_budget")
+        self._spider_max_depth: int | None = self.args.get("spider_max_depth")
+        self._spider_max_children: int | None = self.args.get("spider_max_children")
+        self._spider_max_urls: int | None = self.args.get("spider_max_urls")
+        self._spider_normalize_query: bool = self.args.get(
+            "spider_normalize_query", False
+        )
+        self._spider_exclude_urls_regex: list[str] = list(
+            self.args.get("spider_exclude_urls_regex") or []
+        )
+        if (
+            self.args.get("spider_exclude_out_of_scope") is True
+            and self._scope_urls_regex is not None
+        ):
+            # The scope regex is matched from the start of the URL, exclude everything it does not match.
+            self._spider_exclude_urls_regex.append(
+                f"^(?!(?:{self._scope_urls_regex})).*$"
+            )
+        self._api_format: str = self.args.get("api_format") or "openapi"
+        self._api_definition_cache_dir: str | None = self.args.get(
+            "api_definition_cache_dir"
+        )
+        self._api_scan_parallelism: int | None = self.args.get("api_scan_parallelism")
+        self._suppression_index: suppressions.SuppressionIndex | None = None
+        if self.args.get("suppressions_path") is not None:
+            self._suppression_index = suppressions.SuppressionIndex.from_file(
+                self.args.get("suppressions_path")
+            )
+        self._shard_mode: str = self.args.get("shard_mode") or SHARD_MODE_SKIP
+        if self._shard_mode not in SHARD_MODES:
+            raise ValueError(
+                f"unknown shard_mode {self._shard_mode}, expected one of {SHARD_MODES}"
+            )
+        self._shard_router: sharding.ShardRouter | None = None
+        self._shard_inbox: sharding.FileInbox | None = None
+        if self.args.get("shard_membership_dir") is not None:
+            membership_dir = self.args.get("shard_membership_dir")
+            replica_id = self.args.get("shard_replica_id") or socket.gethostname()
+            self._shard_router = sharding.ShardRouter(
+                sharding.FileMembership(membership_dir, replica_id)
+            )
+            if self._shard_mode == SHARD_MODE_FORWARD:
+                self._shard_inbox = sharding.FileInbox(
+                    str(pathlib.Path(membership_dir) / SHARD_INBOX_DIR_NAME),
+                    replica_id,
+                )
+        # Serializes the scans of the bus messages and of the forwarded ones.
+        self._scan_lock = threading.Lock()
+        self._profiling: bool = self.args.get("profiling", False)
+        self._profiling_dir: str | None = self.args.get("profiling_dir")
+        self._profile_next_scan = threading.Event()
+        # The agent is built on the main thread, `start` runs in a worker thread where no signal handler can be set.
+        try:
+            signal.signal(PROFILING_SIGNAL, self._on_profiling_signal)
+        except ValueError:
+            logger.warning(
+                "profiling signal handler can only be set in the main thread"
+            )
+        self._parse_workers: int | None = self.args.get("parse_workers")
+        self._findings_store: findings_store.FindingsStore | None = None
+        if self.args.get("findings_store_path") is not None:
+            self._findings_store = findings_store.FindingsStore(
+                self.args.get("findings_store_path")
+            )
+        self._emitted_dnas: dna_index.EmittedDnaIndex | None = None
+        if (
+            self.args.get("dna_index") is True
+            or self.args.get("dna_index_path") is not None
+        ):
+            self._emitted_dnas = dna_index.EmittedDnaIndex(
+                path=self.args.get("dna_index_path"),
+                capacity=self.args.get("dna_index_capacity") or 1_000_000,
+            )
 
     def start(self) -> None:
         """Setup Zap scanner."""
@@ -68,7 +202,47 @@ class ZapAgent(agent.Agent, vuln_mixin.AgentReportVulnMixin):
             scan_profile=self._scan_profile,
             crawl_timeout=self._crawl_timeout,
             proxy=self._proxy,
+            ajax_spider_browsers=self._ajax_spider_browsers,
+            ajax_spider_headless=self._ajax_spider_headless,
+            ajax_spider_max_crawl_states=self._ajax_spider_max_crawl_states,
+            ajax_spider_max_crawl_depth=self._ajax_spider_max_crawl_depth,
+            ajax_spider_max_duration=self._ajax_spider_max_duration,
+            jvm_heap_ratio=self._jvm_heap_ratio,
+            database_mode=self._zap_database_mode,
+            database_recovery_log=self._zap_database_recovery_log,
+            history_prune_interval=self._zap_history_prune_interval,
+            scope_urls_regex=self._scope_urls_regex,
+            work_dir=self._work_dir,
+            scan_session=self._zap_session_in_work_dir is True,
+            incremental_index_dir=self._incremental_index_dir,
+            rule_stats_path=self._rule_stats_path,
+            rule_time_budget=self._rule_time_budget,
+            spider_max_depth=self._spider_max_depth,
+            spider_max_children=self._spider_max_children,
+            spider_max_urls=self._spider_max_urls,
+            spider_normalize_query=self._spider_normalize_query,
+            spider_exclude_urls_regex=self._spider_exclude_urls_regex,
+            proxy_pool=self._proxy_pool,
+            api_format=self._api_format,
+            api_definition_cache_dir=self._api_definition_cache_dir,
+            api_scan_parallelism=self._api_scan_parallelism,
+            suppression_index=self._suppression_index,
         )
+        if self._proxy_pool is not None:
+            self._proxy_pool.start_health_checks()
+        if self._shard_router is not None:
+            self._shard_router.start()
+        if self._shard_inbox is not None:
+            threading.Thread(target=self._poll_shard_inbox, daemon=True).start()
+        if self._work_dir_disk_budget_mb is not None:
+            self._work_dir_gc = work_dir.WorkDirGarbageCollector(
+                directories=[self._work_dir or zap_wrapper.OUTPUT_DIR],
+                prefix=zap_wrapper.WORK_DIR_PREFIX,
+                budget_bytes=self._work_dir_disk_budget_mb * MIB,
+                min_age=zap_wrapper.JAVA_COMMAND_TIMEOUT,
+                interval=WORK_DIR_GC_INTERVAL,
+            )
+            self._work_dir_gc.start()
 
     def process(self, message: m.Message) -> None:
         """Trigger zap scan and emits vulnerabilities.
@@ -79,7 +253,19 @@ class ZapAgent(agent.Agent, vuln_mixin.AgentReportVulnMixin):
         Returns:
             None
         """
+        self._process(message, forwards=0)
+
+    def _process(self, message: m.Message, forwards: int) -> None:
+        """Scan the target of a message received from the bus or forwarded by another replica."""
+        if (
+            self._shard_router is not None
+            and self._route_to_owner(message, forwards) is False
+        ):
+            return
+        with self._scan_lock:
+            self._process_target(message)
 
+    def _process_target(self, message: m.Message) -> None:
         if self._vpn_config_content is not None:
             try:
                 self.use_vpn(self._vpn_config_content)
@@ -92,8 +278,95 @@ class ZapAgent(agent.Agent, vuln_mixin.AgentReportVulnMixin):
         else:
             logger.info("scanning target %s", target)
 
-            results = self._zap.scan(target)
-            self._emit_results(results)
+            try:
+                if self._profiling is True or self._profile_next_scan.is_set():
+                    self._profile_next_scan.clear()
+                    self._profiled_scan(target)
+                else:
+                    self._scan(target)
+            except proxy_pool.NoHealthyProxyError:
+                logger.error("no healthy proxy to scan %s", target)
+            metrics.log_metrics()
+
+    def _route_to_owner(self, message: m.Message, forwards: int) -> bool:
+        """Check the target is owned by this replica, otherwise forward it to its owner or skip it.
+
+        Replicas sharing the bus queue forward the targets to the inbox of their owner. Replicas each getting every
+        message skip the targets they do not own.
+
+        Returns:
+            Whether this replica scans the target.
+        """
+        target = self._prepare_target(message)
+        owner = self._shard_router.owner(target)
+        if owner == self._shard_router.replica_id:
+            return True
+        if self._shard_mode == SHARD_MODE_SKIP:
+            logger.info("skipping target %s owned by replica %s", target, owner)
+            metrics.increment("zap_shard_targets", labels={"action": "skipped"})
+            return False
+        if forwards >= MAX_SHARD_FORWARDS:
+            logger.warning(
+                "target %s did not reach its owner %s after %d forwards, scanning it",
+                target,
+                owner,
+                MAX_SHARD_FORWARDS,
+            )
+            metrics.increment("zap_shard_targets", labels={"action": "taken_over"})
+            return True
+        selector = next(s for s in self.in_selectors if message.selector.startswith(s))
+        logger.info("forwarding target %s to replica %s", target, owner)
+        self._shard_inbox.send(
+            owner,
+            sharding.ForwardedMessage(
+                selector=selector, raw=message.raw, forwards=forwards + 1
+            ),
+        )
+        metrics.increment("zap_shard_targets", labels={"action": "forwarded"})
+        return False
+
+    def _process_shard_inbox(self) -> None:
+        """Scan the targets forwarded to this replica and the ones left to the replicas that left the ring."""
+        for forwarded in self._shard_inbox.receive(self._shard_router.replicas):
+            self._process(
+                m.Message.from_raw(forwarded.selector, forwarded.raw),
+                forwards=forwarded.forwards,
+            )
+
+    def _poll_shard_inbox(self) -> None:
+        while True:
+            try:
+                self._process_shard_inbox()
+            except Exception:
+                logger.exception("could not process the forwarded targets")
+            time.sleep(SHARD_INBOX_POLL_INTERVAL.total_seconds())
+
+    def _scan(
+        self, target: str, jfr_recording_path: pathlib.Path | None = None
+    ) -> None:
+        """Scan the target and emit the results."""
+        results = self._zap.scan(target, jfr_recording_path=jfr_recording_path)
+        self._emit_results(results, target)
+
+    def _profiled_scan(self, target: str) -> None:
+        """Scan the target while profiling the agent and ZAP, the artifacts are written to a per-scan directory."""
+        profile_dir = profiling.scan_profile_dir(
+            self._profiling_dir or PROFILING_DIR, target
+        )
+        jfr_recording_path = profile_dir / JFR_RECORDING_FILE_NAME
+        logger.info("profiling scan of %s to %s", target, profile_dir)
+        with profiling.SamplingProfiler() as profiler:
+            self._scan(target, jfr_recording_path=jfr_recording_path)
+        profiler.write_collapsed(profile_dir / PYTHON_PROFILE_FILE_NAME)
+        profiling.log_hotspots("agent", profiler.hotspots())
+        if jfr_recording_path.exists() is True:
+            profiling.log_hotspots("zap", profiling.jfr_hotspots(jfr_recording_path))
+
+    def _on_profiling_signal(self, signum: int, frame: types.FrameType | None) -> None:
+        """Profile the next scan."""
+        del signum, frame
+        logger.info("profiling requested for the next scan")
+        self._profile_next_scan.set()
 
     def _prepare_target(self, message: m.Message) -> str:
         """Prepare targets based on type,
@@ -114,11 +387,43 @@ class ZapAgent(agent.Agent, vuln_mixin.AgentReportVulnMixin):
         elif message.data.get("url") is not None:
             return message.data.get("url")
 
-    def _emit_results(self, results: dict) -> None:
-        """Parses results and emits vulnerabilities."""
-        for vuln in result_parser.parse_results(
-            results=results, scope_urls_regex=self._scope_urls_regex
-        ):
+    def _emit_results(self, results: dict, target: str) -> None:
+        """Parses results and emits vulnerabilities that were not already emitted.
+
+        When a findings store is set, only the findings that are new since the previous scan of the target are
+        emitted, the persisting and resolved ones are summarized in the logs and metrics. The findings of a scan that
+        returned no results are not diffed, so a failed scan does not resolve the findings of the previous one.
+        """
+        vulnerabilities = result_parser.parse_results(
+            results=results,
+            scope_urls_regex=self._scope_urls_regex,
+            workers=self._parse_workers,
+            suppression_index=self._suppression_index,
+        )
+        findings = None
+        diff = None
+        if self._findings_store is not None:
+            if len(results.get("site") or []) == 0:
+                logger.warning(
+                    "scan of %s returned no results, findings are not diffed", target
+                )
+            else:
+                vulnerabilities = list(vulnerabilities)
+                findings = {
+                    v.dna: v.entry.title for v in vulnerabilities if v.dna is not None
+                }
+                diff = self._findings_store.diff(target, findings)
+        for vuln in vulnerabilities:
+            if diff is not None and vuln.dna is not None and vuln.dna not in diff.new:
+                continue
+            if (
+                self._emitted_dnas is not None
+                and vuln.dna is not None
+                and vuln.dna in self._emitted_dnas
+            ):
+                logger.debug("skipping already emitted vulnerability %s", vuln.dna)
+                metrics.increment("zap_duplicate_vulnerabilities_suppressed")
+                continue
             self.report_vulnerability(
                 entry=vuln.entry,
                 technical_detail=vuln.technical_detail,
@@ -126,6 +431,31 @@ class ZapAgent(agent.Agent, vuln_mixin.AgentReportVulnMixin):
                 vulnerability_location=vuln.vulnerability_location,
                 dna=vuln.dna,
             )
+            if self._emitted_dnas is not None and vuln.dna is not None:
+                self._emitted_dnas.add(vuln.dna)
+            metrics.increment("zap_vulnerabilities_emitted")
+        if self._emitted_dnas is not None:
+            self._emitted_dnas.flush()
+        if diff is not None:
+            self._commit_findings(target, findings, diff)
+
+    def _commit_findings(
+        self, target: str, findings: dict[str, str], diff: findings_store.FindingsDiff
+    ) -> None:
+        """Store the findings of the target once emitted, so the findings of a failed emission are emitted again."""
+        self._findings_store.commit(target, findings)
+        logger.info(
+            "target %s has %d new, %d persisting and %d resolved findings",
+            target,
+            len(diff.new),
+            len(diff.persisting),
+            len(diff.resolved),
+        )
+        for title in diff.resolved:
+            logger.info("resolved finding on %s: %s", target, title)
+        metrics.increment("zap_findings_new", len(diff.new))
+        metrics.increment("zap_findings_persisting", len(diff.persisting))
+        metrics.increment("zap_findings_resolved", len(diff.resolved))
 
     def _should_process_target(self, scope_urls_regex: str | None, url: str) -> bool:
         if scope_urls_regex is None:
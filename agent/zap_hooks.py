@@ -0,0 +1,528 @@
+"""Hooks loaded by the ZAP scan scripts through the --hook option.
+
+The hooks run inside the scan script process and talk to ZAP through its API client. They are configured by the
+wrapper through environment variables and only depend on the standard library.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib import parse
+
+INCREMENTAL_INDEX_ENV = "ZAP_AGENT_INCREMENTAL_INDEX"
+INCREMENTAL_OUTPUT_ENV = "ZAP_AGENT_INCREMENTAL_OUTPUT"
+RULE_STATS_OUTPUT_ENV = "ZAP_AGENT_RULE_STATS_OUTPUT"
+DISABLED_RULES_ENV = "ZAP_AGENT_DISABLED_RULES"
+MAX_RULE_DURATION_ENV = "ZAP_AGENT_MAX_RULE_DURATION"
+SPIDER_EXCLUDE_ENV = "ZAP_AGENT_SPIDER_EXCLUDE"
+SPIDER_MAX_URLS_ENV = "ZAP_AGENT_SPIDER_MAX_URLS"
+SPIDER_STATS_OUTPUT_ENV = "ZAP_AGENT_SPIDER_STATS_OUTPUT"
+PROXY_FILE_ENV = "ZAP_AGENT_PROXY_FILE"
+AJAX_SPIDER_MAX_DURATION_ENV = "ZAP_AGENT_AJAX_SPIDER_MAX_DURATION"
+HISTORY_PRUNE_INTERVAL_ENV = "ZAP_AGENT_HISTORY_PRUNE_INTERVAL"
+HISTORY_KEEP_SITES_ENV = "ZAP_AGENT_HISTORY_KEEP_SITES"
+SUPPRESSED_RULES_ENV = "ZAP_AGENT_SUPPRESSED_RULES"
+API_SESSION_ENV = "ZAP_AGENT_API_SESSION"
+API_ENDPOINTS_ENV = "ZAP_AGENT_API_ENDPOINTS"
+API_BASE_URL_ENV = "ZAP_AGENT_API_BASE_URL"
+API_SCAN_PARALLELISM_ENV = "ZAP_AGENT_API_SCAN_PARALLELISM"
+API_STATS_OUTPUT_ENV = "ZAP_AGENT_API_STATS_OUTPUT"
+MESSAGES_PAGE_SIZE = 500
+PROXY_POLL_INTERVAL_SECONDS = 5
+SPIDER_POLL_INTERVAL_SECONDS = 2
+API_SCAN_POLL_INTERVAL_SECONDS = 2
+
+logger = logging.getLogger(__name__)
+
+
+def _header_value(headers: str, name: str) -> str | None:
+    """Get a header value from a raw HTTP header block."""
+    match = re.search(rf"^{name}:\s*(.*?)\s*$", headers, re.IGNORECASE | re.MULTILINE)
+    return match.group(1) if match is not None else None
+
+
+def _message_url(request_header: str) -> str | None:
+    """Get the URL from the request line of a raw HTTP header block."""
+    request_line = request_header.split("\r\n", 1)[0].split("\n", 1)[0].split(" ")
+    return request_line[1] if len(request_line) >= 2 else None
+
+
+def site_fingerprints(zap, target: str) -> dict[str, dict[str, str | None]]:
+    """Fingerprint the content of every URL under the target from the messages in the ZAP history."""
+    fingerprints = {}
+    start = 0
+    while True:
+        messages = zap.core.messages(
+            baseurl=target, start=start, count=MESSAGES_PAGE_SIZE
+        )
+        for message in messages:
+            url = _message_url(message.get("requestHeader", ""))
+            if url is None:
+                continue
+            response_header = message.get("responseHeader", "")
+            fingerprints[url] = {
+                "hash": hashlib.sha256(
+                    message.get("responseBody", "").encode()
+                ).hexdigest(),
+                "etag": _header_value(response_header, "ETag"),
+                "last_modified": _header_value(response_header, "Last-Modified"),
+            }
+        if len(messages) < MESSAGES_PAGE_SIZE:
+            return fingerprints
+        start += MESSAGES_PAGE_SIZE
+
+
+def is_unchanged(
+    previous: dict[str, str | None], current: dict[str, str | None]
+) -> bool:
+    """Compare two fingerprints of a URL, using the strongest validator both have."""
+    if previous.get("etag") is not None and current.get("etag") is not None:
+        return previous["etag"] == current["etag"]
+    if (
+        previous.get("last_modified") is not None
+        and current.get("last_modified") is not None
+    ):
+        return previous["last_modified"] == current["last_modified"]
+    return previous.get("hash") == current.get("hash")
+
+
+def _exclude_unchanged_urls(zap, target: str) -> None:
+    """Exclude the URLs unchanged since the previous scan from the active scan and record the new fingerprints."""
+    index_path = os.environ[INCREMENTAL_INDEX_ENV]
+    output_path = os.environ[INCREMENTAL_OUTPUT_ENV]
+    previous_fingerprints = {}
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as index_file:
+            previous_fingerprints = json.load(index_file).get("fingerprints", {})
+
+    fingerprints = site_fingerprints(zap, target)
+    unchanged_urls = [
+        url
+        for url, fingerprint in fingerprints.items()
+        if url in previous_fingerprints
+        and is_unchanged(previous_fingerprints[url], fingerprint)
+    ]
+    for url in unchanged_urls:
+        zap.ascan.exclude_from_scan(f"^{re.escape(url)}$")
+    logger.info(
+        "incremental scan: %d unchanged URLs excluded from the active scan out of %d",
+        len(unchanged_urls),
+        len(fingerprints),
+    )
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump(
+            {"fingerprints": fingerprints, "unchanged_urls": unchanged_urls},
+            output_file,
+        )
+
+
+def _plugin_stats(plugin: list[str]) -> dict[str, str | int]:
+    """Parse a plugin progress entry: name, id, quality, status, time in ms, request count and alert count."""
+    name, plugin_id, _, status, *counters = plugin
+    time_ms, request_count, alert_count = (
+        [int(c) if str(c).isdigit() else 0 for c in counters] + [0, 0, 0]
+    )[:3]
+    return {
+        "id": plugin_id,
+        "name": name,
+        "status": status,
+        "time_ms": time_ms,
+        "request_count": request_count,
+        "alert_count": alert_count,
+    }
+
+
+def rule_stats(zap) -> list[dict[str, str | int]]:
+    """Collect the duration, request count and alert count of every active scan rule of every active scan."""
+    stats = []
+    for scan in zap.ascan.scans:
+        progress = zap.ascan.scan_progress(scanid=scan["id"])
+        for host_progress in progress[1::2]:
+            for host_process in host_progress.get("HostProcess", []):
+                stats.append(_plugin_stats(host_process["Plugin"]))
+    return stats
+
+
+def _dump_rule_stats(zap) -> None:
+    with open(os.environ[RULE_STATS_OUTPUT_ENV], "w", encoding="utf-8") as output_file:
+        json.dump(rule_stats(zap), output_file)
+
+
+def _enforce_rule_budget(zap, policy) -> None:
+    """Disable the rules over budget and cap the duration of the other ones."""
+    disabled_rules = os.environ.get(DISABLED_RULES_ENV, "")
+    if disabled_rules != "":
+        logger.info("disabling active scan rules %s", disabled_rules)
+        if policy is not None:
+            zap.ascan.disable_scanners(disabled_rules, scanpolicyname=policy)
+        else:
+            zap.ascan.disable_scanners(disabled_rules)
+    if MAX_RULE_DURATION_ENV in os.environ:
+        zap.ascan.set_option_max_rule_duration_in_mins(
+            int(os.environ[MAX_RULE_DURATION_ENV])
+        )
+
+
+def _disable_suppressed_rules(zap, policy) -> None:
+    """Disable the active scan rules whose alerts on the target are all known false positives.
+
+    The scan script only active scans the target, the passive scan rules run on every crawled host and stay enabled,
+    their suppressed alerts are filtered out when the results are parsed.
+    """
+    suppressed_rules = os.environ[SUPPRESSED_RULES_ENV].split(",")
+    scanners = (
+        zap.ascan.scanners(scanpolicyname=policy)
+        if policy is not None
+        else zap.ascan.scanners()
+    )
+    if isinstance(scanners, list) is False:
+        logger.warning("could not list the active scan rules: %s", scanners)
+        return
+    active_rules = [s["id"] for s in scanners if s["id"] in suppressed_rules]
+    if len(active_rules) == 0:
+        return
+    logger.info("disabling suppressed active scan rules %s", active_rules)
+    if policy is not None:
+        result = zap.ascan.disable_scanners(
+            ",".join(active_rules), scanpolicyname=policy
+        )
+    else:
+        result = zap.ascan.disable_scanners(",".join(active_rules))
+    # The API errors are returned, not raised.
+    if result != "OK":
+        logger.warning(
+            "could not disable the suppressed active scan rules %s: %s",
+            active_rules,
+            result,
+        )
+
+
+class SpiderUrlsLimiter:
+    """Stops the running spider scans once they found the max number of URLs."""
+
+    def __init__(self, zap, max_urls: int) -> None:
+        self._zap = zap
+        self._max_urls = max_urls
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.pruned = False
+
+    def _run(self) -> None:
+        while self._stop.wait(SPIDER_POLL_INTERVAL_SECONDS) is False:
+            self.check()
+
+    def check(self) -> None:
+        """Stop the spider scans over the max number of URLs."""
+        for scan in self._zap.spider.scans:
+            if scan.get("state") != "RUNNING":
+                continue
+            if len(self._zap.spider.results(scanid=scan["id"])) >= self._max_urls:
+                logger.info("spider reached %d URLs, stopping it", self._max_urls)
+                self._zap.spider.stop(scanid=scan["id"])
+                self.pruned = True
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+_spider_urls_limiter: SpiderUrlsLimiter | None = None
+
+
+def spider_stats(zap, exclusions: list[str], max_urls_reached: bool) -> dict:
+    """Count the URLs found by the spider scans and the ones pruned by the exclusions and the crawl limits.
+
+    The URLs rejected by the spider on the hosts it crawled that match no exclusion were pruned by the max depth or the
+    max children limits, the URLs of the other hosts are out of scope.
+    """
+    patterns = [re.compile(e) for e in exclusions]
+    in_scope_urls, out_of_scope_urls = [], []
+    for scan in zap.spider.scans:
+        for result in zap.spider.full_results(scanid=scan["id"]):
+            in_scope_urls.extend(u["url"] for u in result.get("urlsInScope", []))
+            out_of_scope_urls.extend(result.get("urlsOutOfScope", []))
+    crawled_hosts = {parse.urlparse(url).netloc for url in in_scope_urls}
+    excluded, limited = 0, 0
+    for url in out_of_scope_urls:
+        if any(p.match(url) for p in patterns):
+            excluded += 1
+        elif parse.urlparse(url).netloc in crawled_hosts:
+            limited += 1
+    return {
+        "urls_in_scope": len(in_scope_urls),
+        "excluded_urls": excluded,
+        "limited_urls": limited,
+        "max_urls_reached": max_urls_reached,
+    }
+
+
+class ProxyFollower:
+    """Switches the upstream proxy of ZAP when the wrapper moves the scan to another proxy."""
+
+    def __init__(self, zap, proxy_file: str) -> None:
+        self._zap = zap
+        self._proxy_file = proxy_file
+        self._current = self._read()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _read(self) -> str:
+        with open(self._proxy_file, encoding="utf-8") as proxy_file:
+            return proxy_file.read().strip()
+
+    def _run(self) -> None:
+        while self._stop.wait(PROXY_POLL_INTERVAL_SECONDS) is False:
+            self.check()
+
+    def check(self) -> None:
+        """Switch the ZAP upstream proxy if it changed."""
+        proxy = self._read()
+        if proxy == self._current or proxy == "":
+            return
+        parsed_proxy = parse.urlparse(proxy)
+        logger.info("switching upstream proxy to %s", proxy)
+        self._zap.network.set_http_proxy(parsed_proxy.hostname, str(parsed_proxy.port))
+        self._current = proxy
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+_proxy_follower: ProxyFollower | None = None
+
+
+class HistoryPruner:
+    """Deletes from the ZAP database the history of the out-of-scope sites while the scan runs.
+
+    Those sites, like the third-party hosts requested by the AJAX spider browsers, are never reported, pruning them
+    keeps the database and the site tree from growing with the scan duration.
+    """
+
+    def __init__(
+        self, zap, target: str, interval: int, kept_sites: list[str] | None = None
+    ) -> None:
+        self._zap = zap
+        self._target_netloc = parse.urlparse(target).netloc
+        self._kept_sites = [re.compile(k) for k in kept_sites or []]
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.pruned_sites = 0
+
+    def _run(self) -> None:
+        while self._stop.wait(self._interval) is False:
+            self.prune()
+
+    def prune(self) -> None:
+        """Delete the site nodes of the out-of-scope sites, with their history."""
+        for site in self._zap.core.sites:
+            if parse.urlparse(site).netloc == self._target_netloc or any(
+                k.match(site) is not None for k in self._kept_sites
+            ):
+                continue
+            logger.info("pruning the history of %s", site)
+            self._zap.core.delete_site_node(site)
+            self.pruned_sites += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+_history_pruner: HistoryPruner | None = None
+
+
+def _load_api_session(zap, session_path: str) -> None:
+    """Load the copy of the site tree imported by a previous scan of the same API definition."""
+    if os.path.exists(session_path) is False:
+        return
+    logger.info("reusing the API site tree of %s", session_path)
+    zap.core.load_session(session_path)
+
+
+def _save_api_session(zap, session_path: str) -> None:
+    """Snapshot the site tree imported from the API definition, before it fills up with the active scan messages."""
+    if os.path.exists(session_path) is True:
+        return
+    logger.info("saving the API site tree to %s", session_path)
+    zap.core.snapshot_session(name=session_path, overwrite=True)
+
+
+def endpoint_regex(base_url: str, path: str) -> str:
+    """Regex of the URLs of an API endpoint, the path template parameters matching any path segment."""
+    parts = re.split(r"(\{[^}/]*\})", base_url.rstrip("/") + path)
+    return (
+        "".join(
+            "[^/?]+" if part.startswith("{") and part.endswith("}") else re.escape(part)
+            for part in parts
+        )
+        + r"(?:\?.*)?$"
+    )
+
+
+def scan_endpoints(
+    zap, base_url: str, endpoints: list[dict], policy, parallelism: int
+) -> list[dict]:
+    """Actively scan each endpoint in its own context, running up to `parallelism` scans at once.
+
+    Returns:
+        The duration of the scan of each endpoint.
+    """
+    pending = collections.deque(enumerate(endpoints))
+    running = {}
+    stats = []
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(running) < parallelism:
+            index, endpoint = pending.popleft()
+            context_name = f"agent-api-endpoint-{index}"
+            context_id = zap.context.new_context(context_name)
+            zap.context.include_in_context(
+                context_name, endpoint_regex(base_url, endpoint["path"])
+            )
+            scan_id = zap.ascan.scan(
+                contextid=context_id, recurse=True, scanpolicyname=policy
+            )
+            if str(scan_id).isdigit() is False:
+                logger.warning(
+                    "could not scan API endpoint %s: %s", endpoint["path"], scan_id
+                )
+                zap.context.remove_context(context_name)
+                continue
+            running[scan_id] = (endpoint, context_name, time.monotonic())
+        time.sleep(API_SCAN_POLL_INTERVAL_SECONDS)
+        for scan_id, (endpoint, context_name, start) in list(running.items()):
+            if int(zap.ascan.status(scan_id)) < 100:
+                continue
+            del running[scan_id]
+            zap.context.remove_context(context_name)
+            stats.append(
+                {
+                    "path": endpoint["path"],
+                    "methods": endpoint["methods"],
+                    "time_ms": int((time.monotonic() - start) * 1000),
+                }
+            )
+            logger.info(
+                "API endpoint %s scanned in %d ms, %d/%d endpoints done",
+                endpoint["path"],
+                stats[-1]["time_ms"],
+                len(stats),
+                len(endpoints),
+            )
+    return stats
+
+
+def _scan_api_endpoints(zap, policy) -> None:
+    with open(os.environ[API_ENDPOINTS_ENV], encoding="utf-8") as endpoints_file:
+        endpoints = json.load(endpoints_file)["endpoints"]
+    base_url = os.environ[API_BASE_URL_ENV]
+    stats = scan_endpoints(
+        zap,
+        base_url,
+        endpoints,
+        policy,
+        int(os.environ[API_SCAN_PARALLELISM_ENV]),
+    )
+    # The scan script active scan then only covers what is left out of the endpoints.
+    for endpoint in endpoints:
+        zap.ascan.exclude_from_scan(endpoint_regex(base_url, endpoint["path"]))
+    with open(os.environ[API_STATS_OUTPUT_ENV], "w", encoding="utf-8") as output_file:
+        json.dump(stats, output_file)
+
+
+def zap_started(zap, target):
+    """Called by the scan scripts once ZAP is started."""
+    global _spider_urls_limiter, _proxy_follower, _history_pruner
+    # The hooks module stays loaded by the scan script, the state of a previous run is dropped.
+    _spider_urls_limiter, _proxy_follower, _history_pruner = None, None, None
+    if HISTORY_PRUNE_INTERVAL_ENV in os.environ:
+        _history_pruner = HistoryPruner(
+            zap,
+            target,
+            int(os.environ[HISTORY_PRUNE_INTERVAL_ENV]),
+            json.loads(os.environ.get(HISTORY_KEEP_SITES_ENV, "[]")),
+        )
+        _history_pruner.start()
+    if PROXY_FILE_ENV in os.environ:
+        _proxy_follower = ProxyFollower(zap, os.environ[PROXY_FILE_ENV])
+        _proxy_follower.start()
+    if API_SESSION_ENV in os.environ:
+        _load_api_session(zap, os.environ[API_SESSION_ENV])
+
+
+def zap_spider(zap, target):
+    """Called by the scan scripts right before the spider starts."""
+    del target
+    global _spider_urls_limiter
+    for regex in json.loads(os.environ.get(SPIDER_EXCLUDE_ENV, "[]")):
+        zap.spider.exclude_from_scan(regex)
+    if SPIDER_MAX_URLS_ENV in os.environ:
+        _spider_urls_limiter = SpiderUrlsLimiter(
+            zap, int(os.environ[SPIDER_MAX_URLS_ENV])
+        )
+        _spider_urls_limiter.start()
+
+
+def _dump_spider_stats(zap) -> None:
+    max_urls_reached = False
+    if _spider_urls_limiter is not None:
+        _spider_urls_limiter.stop()
+        max_urls_reached = _spider_urls_limiter.pruned
+    stats = spider_stats(
+        zap, json.loads(os.environ.get(SPIDER_EXCLUDE_ENV, "[]")), max_urls_reached
+    )
+    with open(
+        os.environ[SPIDER_STATS_OUTPUT_ENV], "w", encoding="utf-8"
+    ) as output_file:
+        json.dump(stats, output_file)
+
+
+def zap_ajax_spider(zap, target, max_time):
+    """Called by the scan scripts right before the AJAX spider starts.
+
+    The scripts set the AJAX spider max duration from the -m option, the returned arguments override it.
+    """
+    if AJAX_SPIDER_MAX_DURATION_ENV in os.environ:
+        max_time = int(os.environ[AJAX_SPIDER_MAX_DURATION_ENV])
+    return zap, target, max_time
+
+
+def zap_active_scan(zap, target, policy):
+    """Called by the scan scripts right before the active scan starts."""
+    if API_SESSION_ENV in os.environ:
+        _save_api_session(zap, os.environ[API_SESSION_ENV])
+    if INCREMENTAL_INDEX_ENV in os.environ:
+        _exclude_unchanged_urls(zap, target)
+    _enforce_rule_budget(zap, policy)
+    if SUPPRESSED_RULES_ENV in os.environ:
+        _disable_suppressed_rules(zap, policy)
+    if API_ENDPOINTS_ENV in os.environ:
+        _scan_api_endpoints(zap, policy)
+
+
+def zap_pre_shutdown(zap):
+    """Called by the scan scripts right before ZAP is shut down."""
+    if _proxy_follower is not None:
+        _proxy_follower.stop()
+    if _history_pruner is not None:
+        _history_pruner.stop()
+        logger.info("pruned the history of %d sites", _history_pruner.pruned_sites)
+    if RULE_STATS_OUTPUT_ENV in os.environ:
+        _dump_rule_stats(zap)
+    if SPIDER_STATS_OUTPUT_ENV in os.environ:
+        _dump_spider_stats(zap)
@@ -1,20 +1,58 @@
 """Zap wrapper implementation"""
 
+import contextlib
 import datetime
 import json
 import logging
+import os
 import pathlib
+import re
 import subprocess
 import tempfile
-from typing import NamedTuple
+import threading
+from typing import NamedTuple, Self
 from urllib import parse
 
 import tenacity
 
+from agent import (
+    api_definitions,
+    incremental,
+    jvm,
+    metrics,
+    profiling,
+    proxy_pool,
+    rule_stats,
+    sharding,
+    suppressions,
+    zap_hooks,
+)
+
 logger = logging.getLogger(__name__)
 
-OUTPUT_SUFFIX = ".json"
 OUTPUT_DIR = "/zap/wrk"
+WORK_DIR_PREFIX = "scan-"
+REPORT_FILE_NAME = "report.json"
+SESSION_FILE_NAME = "session"
+ZAP_HOOKS_PATH = str(pathlib.Path(__file__).parent / "zap_hooks.py")
+INCREMENTAL_OUTPUT_FILE_NAME = "incremental.json"
+RULE_STATS_FILE_NAME = "rule_stats.json"
+SPIDER_STATS_FILE_NAME = "spider_stats.json"
+SPIDER_NORMALIZED_QUERY_HANDLING = "IGNORE_VALUE"
+PROXY_FILE_NAME = "proxy"
+API_STATS_FILE_NAME = "api_stats.json"
+API_SESSION_FILE_NAME = "api.session"
+EMPTY_API_DEFINITION_FILE_NAME = "empty-definition.json"
+# Imported instead of the definition when its cached site tree is loaded, the scan script then imports nothing.
+EMPTY_OPENAPI_DEFINITION = {
+    "openapi": "3.0.0",
+    "info": {"title": "Cached API definition", "version": "1"},
+    "paths": {},
+}
+API_PROFILE = "api"
+API_FORMAT_OPENAPI = "openapi"
+SLOWEST_API_ENDPOINTS = 10
+PROXY_FAILOVER_CHECK_INTERVAL = datetime.timedelta(seconds=10)
 PROFILE_SCRIPT = {
     "baseline": "/zap/zap-baseline.py",
     "api": "/zap/zap-api-scan.py",
@@ -23,6 +61,17 @@ PROFILE_SCRIPT = {
 
 JAVA_COMMAND_TIMEOUT = datetime.timedelta(minutes=60)
 
+AJAX_SPIDER_HEADLESS_BROWSER = "firefox-headless"
+BROWSER_PROCESS_NAMES = ("firefox", "firefox-esr", "geckodriver")
+BROWSER_MEMORY_SAMPLING_INTERVAL = datetime.timedelta(seconds=5)
+PROC_DIR = "/proc"
+
+DATABASE_MODE_AUTO = "auto"
+MILLISECONDS_PER_MINUTE = 60 * 1000
+# Rules are capped to a multiple of the time budget, so the rules over budget on average are told apart from the
+# rules only overrunning the cap.
+RULE_DURATION_CAP_FACTOR = 2
+
 
 class ProxyTuple(NamedTuple):
     proxy_host: str
@@ -38,6 +87,90 @@ def _parse_proxy(proxy: str) -> ProxyTuple | None:
     return None
 
 
+def _browsers_rss_bytes() -> int:
+    """Sum the resident memory of all the running browser processes."""
+    total = 0
+    for status_path in pathlib.Path(PROC_DIR).glob("[0-9]*/status"):
+        try:
+            status = status_path.read_text(encoding="utf-8")
+        except OSError:
+            # The process exited while listing.
+            continue
+        fields = dict(line.split(":", 1) for line in status.splitlines() if ":" in line)
+        if fields.get("Name", "").strip() not in BROWSER_PROCESS_NAMES:
+            continue
+        rss = fields.get("VmRSS", "").split()
+        if len(rss) > 0:
+            total += int(rss[0]) * 1024
+    return total
+
+
+class _BrowserMemorySampler:
+    """Samples the memory of the AJAX spider browsers in the background and keeps the peak value."""
+
+    def __init__(self, interval: datetime.timedelta) -> None:
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.peak_rss_bytes = 0
+
+    def _run(self) -> None:
+        while True:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, _browsers_rss_bytes())
+            if self._stop.wait(self._interval.total_seconds()):
+                return
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class _ProxyFailoverMonitor:
+    """Assigns the scan to a proxy of the pool and moves it to another one when the proxy dies.
+
+    The current proxy is written to a file that the scan script hooks follow to switch the ZAP upstream proxy.
+    """
+
+    def __init__(
+        self,
+        pool: proxy_pool.ProxyPool,
+        proxy_file: pathlib.Path,
+        interval: datetime.timedelta,
+    ) -> None:
+        self._pool = pool
+        self._proxy_file = proxy_file
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.proxy: proxy_pool.Proxy | None = None
+
+    def _run(self) -> None:
+        while self._stop.wait(self._interval.total_seconds()) is False:
+            if self._pool.check(self.proxy) is True:
+                continue
+            try:
+                self.proxy = self._pool.failover(self.proxy)
+            except proxy_pool.NoHealthyProxyError:
+                logger.error("proxy %s died and no proxy is healthy", self.proxy.url)
+                continue
+            self._proxy_file.write_text(self.proxy.url, encoding="utf-8")
+
+    def __enter__(self) -> Self:
+        self.proxy = self._pool.acquire()
+        self._proxy_file.write_text(self.proxy.url, encoding="utf-8")
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._pool.release(self.proxy)
+
+
 class ZapWrapper:
     """Zap scanner wrapper."""
 
@@ -46,60 +179,576 @@ class ZapWrapper:
         scan_profile: str,
         crawl_timeout: int | None = None,
         proxy: str | None = None,
+        ajax_spider_browsers: int | None = None,
+        ajax_spider_headless: bool = False,
+        ajax_spider_max_crawl_states: int | None = None,
+        ajax_spider_max_crawl_depth: int | None = None,
+        ajax_spider_max_duration: int | None = None,
+        jvm_heap_ratio: float | None = None,
+        database_mode: str | None = None,
+        database_recovery_log: bool | None = None,
+        history_prune_interval: int | None = None,
+        scope_urls_regex: str | None = None,
+        work_dir: str | None = None,
+        scan_session: bool = False,
+        incremental_index_dir: str | None = None,
+        rule_stats_path: str | None = None,
+        rule_time_budget: int | None = None,
+        spider_max_depth: int | None = None,
+        spider_max_children: int | None = None,
+        spider_max_urls: int | None = None,
+        spider_normalize_query: bool = False,
+        spider_exclude_urls_regex: list[str] | None = None,
+        proxy_pool: proxy_pool.ProxyPool | None = None,
+        api_format: str = API_FORMAT_OPENAPI,
+        api_definition_cache_dir: str | None = None,
+        api_scan_parallelism: int | None = None,
+        suppression_index: suppressions.SuppressionIndex | None = None,
     ) -> None:
         """Configures wrapper to start scanning targets.
 
         Args:
             scan_profile: Scan profile from one of these values (baseline, api and full).
             crawl_timeout: Max duration to crawl in minutes. None means no limit.
+            proxy: Proxy URL to route the scan traffic through.
+            ajax_spider_browsers: Number of browsers the AJAX spider runs in parallel. None keeps ZAP's default.
+            ajax_spider_headless: Run the AJAX spider browsers in headless mode, without a display.
+            ajax_spider_max_crawl_states: Max number of crawl states of the AJAX spider. None keeps ZAP's default.
+            ajax_spider_max_crawl_depth: Max crawl depth of the AJAX spider. None keeps ZAP's default.
+            ajax_spider_max_duration: Max duration of the AJAX spider in minutes, set through the scan script hooks as the
+                scripts override it with the -m value. None keeps the -m value.
+            jvm_heap_ratio: Ratio of the container memory limit used as the ZAP max heap, the GC is picked from the
+                resulting heap size. None keeps the JVM defaults.
+            database_mode: ZAP database mode from one of these values (memory, file and auto). `auto` picks the mode
+                from the heap size. None keeps ZAP's default.
+            database_recovery_log: Enable the ZAP database recovery log. None keeps ZAP's default.
+            history_prune_interval: Interval in seconds at which the history of the out-of-scope sites is pruned from
+                the ZAP database while the scan runs. None never prunes it.
+            scope_urls_regex: Regex of the in-scope sites, their history is never pruned.
+            work_dir: Directory where the per-scan work directories are created, for instance a tmpfs mount.
+                None uses the ZAP output directory.
+            scan_session: Keep the ZAP session in the per-scan work directory, removed with it once the scan is done,
+                instead of the ZAP home where the sessions pile up.
+            incremental_index_dir: Directory of the per-target index of the previous scans. When set, URLs unchanged
+                since the previous scan are excluded from the active scan and their previous findings are carried
+                forward.
+            rule_stats_path: Path where the statistics of the active scan rules are kept across runs. None keeps them
+                in memory.
+            rule_time_budget: Time budget in minutes of each active scan rule. Rules are capped to the budget and
+                rules that never raised an alert while taking on average more than the budget are skipped.
+            spider_max_depth: Max crawl depth of the spider. None keeps ZAP's default.
+            spider_max_children: Max number of children crawled per node of the site tree. None keeps ZAP's default.
+            spider_max_urls: Max number of URLs found by the spider before it is stopped. None means no limit.
+            spider_normalize_query: Ignore the values of the query parameters when comparing URLs, so URLs only
+                differing by their parameter values are crawled once.
+            spider_exclude_urls_regex: Regexes of the URLs the spider does not crawl.
+            proxy_pool: Pool of proxies the scans are assigned to, takes precedence over `proxy`. A scan moves to
+                another proxy of the pool when its proxy dies.
+            api_format: Format of the API definition of the api profile (openapi, soap and graphql).
+            api_definition_cache_dir: Directory where the OpenAPI definitions are cached by content hash, with their
+                parsed endpoints and the ZAP session of their import. None fetches and imports them on every scan.
+            api_scan_parallelism: Number of OpenAPI endpoints actively scanned in parallel, each in its own context.
+                Needs the API definition cache. None scans all the endpoints in a single active scan.
+            suppression_index: Known false positives. The rules suppressed on all the paths of the target host are
+                disabled in the scan.
         """
         if scan_profile not in PROFILE_SCRIPT:
             raise ValueError()
+        if database_mode is not None and database_mode not in (
+            *jvm.DATABASE_MODES,
+            DATABASE_MODE_AUTO,
+        ):
+            raise ValueError()
         self._scan_profile = scan_profile
         self._crawl_timeout = crawl_timeout
         self._proxy = proxy
+        self._ajax_spider_browsers = ajax_spider_browsers
+        self._ajax_spider_headless = ajax_spider_headless
+        self._ajax_spider_max_crawl_states = ajax_spider_max_crawl_states
+        self._ajax_spider_max_crawl_depth = ajax_spider_max_crawl_depth
+        self._ajax_spider_max_duration = ajax_spider_max_duration
+        self._database_recovery_log = database_recovery_log
+        self._history_prune_interval = history_prune_interval
+        self._scope_urls_regex = scope_urls_regex
+        self._work_dir = work_dir
+        self._scan_session = scan_session
+        self._incremental_index = None
+        if incremental_index_dir is not None:
+            self._incremental_index = incremental.IncrementalIndex(
+                incremental_index_dir
+            )
+        self._rule_time_budget = rule_time_budget
+        self._rule_stats = None
+        if rule_stats_path is not None or rule_time_budget is not None:
+            self._rule_stats = rule_stats.RuleStatsStore(rule_stats_path)
+        self._spider_max_depth = spider_max_depth
+        self._spider_max_children = spider_max_children
+        self._spider_max_urls = spider_max_urls
+        self._spider_normalize_query = spider_normalize_query
+        self._spider_exclude_urls_regex = spider_exclude_urls_regex or []
+        self._proxy_pool = proxy_pool
+        self._api_format = api_format
+        self._api_definitions = None
+        if (
+            api_definition_cache_dir is not None
+            and scan_profile == API_PROFILE
+            and api_format == API_FORMAT_OPENAPI
+        ):
+            self._api_definitions = api_definitions.ApiDefinitionCache(
+                api_definition_cache_dir, local_dir=OUTPUT_DIR
+            )
+        self._api_scan_parallelism = api_scan_parallelism
+        self._suppression_index = suppression_index
+        heap_mb = None
+        if jvm_heap_ratio is not None:
+            heap_mb = self._setup_jvm(jvm_heap_ratio)
+        if database_mode == DATABASE_MODE_AUTO:
+            database_mode = jvm.database_mode(heap_mb)
+        self._database_mode = database_mode
+
+    def _setup_jvm(self, heap_ratio: float) -> int | None:
+        """Size the ZAP JVM from the container memory limit and return the max heap size in MB."""
+        memory_limit = jvm.container_memory_limit_bytes()
+        if memory_limit is None:
+            logger.info("no container memory limit found, keeping the JVM defaults")
+            return None
+        heap_mb = jvm.heap_size_mb(memory_limit, heap_ratio)
+        options = jvm.jvm_options(heap_mb)
+        logger.info("using JVM options %s", options)
+        jvm.write_jvm_properties(options)
+        return heap_mb
 
     @tenacity.retry(
         stop=tenacity.stop_after_attempt(5),
         wait=tenacity.wait_fixed(2),
         retry=tenacity.retry_if_exception_type(subprocess.TimeoutExpired),
     )
-    def scan(self, target: str) -> dict:
+    def scan(self, target: str, jfr_recording_path: pathlib.Path | None = None) -> dict:
         """Starts a scan on targets and returns JSON generated output.
 
         Args:
             target: Target URL.
+            jfr_recording_path: When set, a Java Flight Recorder recording of ZAP is written to this path.
 
         Returns:
             JSON generated output as a dict.
         """
-        with tempfile.NamedTemporaryFile(dir=OUTPUT_DIR, suffix=OUTPUT_SUFFIX) as t:
-            command = self._prepare_command(target, pathlib.Path(t.name).name)
+        with (
+            tempfile.TemporaryDirectory(
+                dir=self._work_dir or OUTPUT_DIR, prefix=WORK_DIR_PREFIX
+            ) as work_dir,
+            contextlib.ExitStack() as stack,
+        ):
+            scan_dir = pathlib.Path(work_dir)
+            report_path = scan_dir / REPORT_FILE_NAME
+            proxy = self._proxy
+            proxy_file = None
+            if self._proxy_pool is not None:
+                proxy_file = scan_dir / PROXY_FILE_NAME
+                proxy_monitor = stack.enter_context(
+                    _ProxyFailoverMonitor(
+                        self._proxy_pool, proxy_file, PROXY_FAILOVER_CHECK_INTERVAL
+                    )
+                )
+                proxy = proxy_monitor.proxy.url
+            api_definition = self._load_api_definition(target, proxy)
+            api_definition_path = None
+            if api_definition is not None:
+                api_definition_path = self._prepare_api_definition(
+                    api_definition, scan_dir
+                )
+            hooks_env = self._hooks_env(target, scan_dir, proxy_file, api_definition)
+            # The scan scripts resolve the report path relative to the output directory.
+            command = self._prepare_command(
+                target,
+                os.path.relpath(report_path, OUTPUT_DIR),
+                hooks=len(hooks_env) > 0,
+                proxy=proxy,
+                api_definition_path=api_definition_path,
+                scan_dir=scan_dir,
+            )
+            env = None
+            if len(hooks_env) > 0 or jfr_recording_path is not None:
+                env = {**os.environ, **hooks_env}
+            if jfr_recording_path is not None:
+                env["JAVA_TOOL_OPTIONS"] = " ".join(
+                    o
+                    for o in (
+                        env.get("JAVA_TOOL_OPTIONS"),
+                        profiling.jfr_option(jfr_recording_path),
+                    )
+                    if o
+                )
             logger.info("running command %s", command)
+            browser_memory = None
             try:
-                subprocess.run(
-                    command, check=False, timeout=JAVA_COMMAND_TIMEOUT.seconds
-                )
-                return json.load(t)
-            except json.JSONDecodeError:
+                # The api script has no spider, the AJAX spider browsers only run with the other profiles.
+                with (
+                    _BrowserMemorySampler(BROWSER_MEMORY_SAMPLING_INTERVAL)
+                    if self._scan_profile != API_PROFILE
+                    else contextlib.nullcontext()
+                ) as browser_memory:
+                    subprocess.run(
+                        command,
+                        check=False,
+                        timeout=JAVA_COMMAND_TIMEOUT.seconds,
+                        env=env,
+                    )
+                results = json.loads(report_path.read_text(encoding="utf-8"))
+            except (FileNotFoundError, json.JSONDecodeError):
                 return {}
+            finally:
+                if browser_memory is not None:
+                    logger.info(
+                        "AJAX spider browsers peak memory: %d bytes",
+                        browser_memory.peak_rss_bytes,
+                    )
+                    metrics.set_gauge(
+                        "zap_ajax_browsers_peak_rss_bytes",
+                        browser_memory.peak_rss_bytes,
+                    )
+                if self._rule_stats is not None:
+                    self._record_rule_stats(scan_dir)
+                if self._spider_hooks_enabled is True:
+                    self._record_spider_stats(scan_dir, target)
+                if api_definition is not None:
+                    self._api_definitions.save_session(
+                        api_definition, scan_dir / API_SESSION_FILE_NAME
+                    )
+                    if self._api_scan_parallelism is not None:
+                        self._record_api_stats(scan_dir, target)
+            if self._incremental_index is not None:
+                results = self._apply_incremental_scan(target, results, scan_dir)
+            return results
+
+    def _load_api_definition(
+        self, target: str, proxy: str | None
+    ) -> api_definitions.ApiDefinition | None:
+        """Get the API definition of the target, fetched through the scan proxy, None when it is not cached."""
+        if self._api_definitions is None:
+            return None
+        try:
+            return self._api_definitions.load(target, proxy=proxy)
+        except api_definitions.ApiDefinitionError as e:
+            logger.warning("%s, scanning without the API definition cache", e)
+            return None
+
+    def _prepare_api_definition(
+        self, api_definition: api_definitions.ApiDefinition, scan_dir: pathlib.Path
+    ) -> pathlib.Path:
+        """Copy the cached site tree of the definition to the scan directory and get the definition to import.
+
+        When the site tree is cached, the hooks load its copy and an empty definition is imported instead, so the
+        definition is not imported again.
+        """
+        if (
+            self._api_definitions.restore_session(
+                api_definition, scan_dir / API_SESSION_FILE_NAME
+            )
+            is False
+        ):
+            return api_definition.path
+        empty_definition_path = scan_dir / EMPTY_API_DEFINITION_FILE_NAME
+        empty_definition_path.write_text(
+            json.dumps(EMPTY_OPENAPI_DEFINITION), encoding="utf-8"
+        )
+        return empty_definition_path
+
+    def _history_kept_sites(self, target: str) -> list[str]:
+        """Regexes of the sites whose history is never pruned: the sites in scope and the target registrable domain."""
+        domain = sharding.registrable_domain(target)
+        kept_sites = [rf"^[a-z]+://([^/]+\.)?{re.escape(domain)}(:\d+)?/?$"]
+        if self._scope_urls_regex is not None:
+            kept_sites.append(self._scope_urls_regex)
+        return kept_sites
+
+    def _hooks_env(
+        self,
+        target: str,
+        scan_dir: pathlib.Path,
+        proxy_file: pathlib.Path | None,
+        api_definition: api_definitions.ApiDefinition | None,
+    ) -> dict[str, str]:
+        """Prepare the environment variables configuring the scan script hooks, empty if no hook is needed."""
+        env = {}
+        if self._history_prune_interval is not None:
+            env[zap_hooks.HISTORY_PRUNE_INTERVAL_ENV] = str(
+                self._history_prune_interval
+            )
+            env[zap_hooks.HISTORY_KEEP_SITES_ENV] = json.dumps(
+                self._history_kept_sites(target)
+            )
+        if self._ajax_spider_max_duration is not None:
+            env[zap_hooks.AJAX_SPIDER_MAX_DURATION_ENV] = str(
+                self._ajax_spider_max_duration
+            )
+        if self._incremental_index is not None:
+            env[zap_hooks.INCREMENTAL_INDEX_ENV] = str(
+                self._incremental_index.path(target)
+            )
+            env[zap_hooks.INCREMENTAL_OUTPUT_ENV] = str(
+                scan_dir / INCREMENTAL_OUTPUT_FILE_NAME
+            )
+        if self._rule_stats is not None:
+            env[zap_hooks.RULE_STATS_OUTPUT_ENV] = str(scan_dir / RULE_STATS_FILE_NAME)
+        if self._rule_time_budget is not None:
+            env[zap_hooks.MAX_RULE_DURATION_ENV] = str(
+                self._rule_time_budget * RULE_DURATION_CAP_FACTOR
+            )
+            skipped_rules = self._rule_stats.rules_to_skip(
+                self._rule_time_budget * MILLISECONDS_PER_MINUTE
+            )
+            if len(skipped_rules) > 0:
+                env[zap_hooks.DISABLED_RULES_ENV] = ",".join(skipped_rules)
+        if self._spider_hooks_enabled is True:
+            env[zap_hooks.SPIDER_STATS_OUTPUT_ENV] = str(
+                scan_dir / SPIDER_STATS_FILE_NAME
+            )
+            env[zap_hooks.SPIDER_EXCLUDE_ENV] = json.dumps(
+                self._spider_exclude_urls_regex
+            )
+            if self._spider_max_urls is not None:
+                env[zap_hooks.SPIDER_MAX_URLS_ENV] = str(self._spider_max_urls)
+        if proxy_file is not None:
+            env[zap_hooks.PROXY_FILE_ENV] = str(proxy_file)
+        if self._suppression_index is not None:
+            suppressed_rules = self._suppression_index.suppressed_plugins(
+                parse.urlparse(target).hostname or ""
+            )
+            if len(suppressed_rules) > 0:
+                env[zap_hooks.SUPPRESSED_RULES_ENV] = ",".join(suppressed_rules)
+        if api_definition is not None:
+            env[zap_hooks.API_SESSION_ENV] = str(scan_dir / API_SESSION_FILE_NAME)
+            if self._api_scan_parallelism is not None:
+                env[zap_hooks.API_ENDPOINTS_ENV] = str(api_definition.endpoints_path)
+                env[zap_hooks.API_BASE_URL_ENV] = api_definition.base_url
+                env[zap_hooks.API_SCAN_PARALLELISM_ENV] = str(
+                    self._api_scan_parallelism
+                )
+                env[zap_hooks.API_STATS_OUTPUT_ENV] = str(
+                    scan_dir / API_STATS_FILE_NAME
+                )
+        return env
 
-    def _prepare_command(self, url: str, output) -> list[str]:
+    @property
+    def _spider_hooks_enabled(self) -> bool:
+        return (
+            len(self._spider_exclude_urls_regex) > 0
+            or self._spider_max_urls is not None
+            or self._spider_max_depth is not None
+            or self._spider_max_children is not None
+        )
+
+    def _record_spider_stats(self, scan_dir: pathlib.Path, target: str) -> None:
+        """Report the URLs pruned by the spider limits, as collected by the hooks."""
+        try:
+            stats = json.loads(
+                (scan_dir / SPIDER_STATS_FILE_NAME).read_text(encoding="utf-8")
+            )
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.info("no spider statistics collected")
+            return
+        logger.info(
+            "spider found %d URLs in scope on %s, %d URLs pruned by the exclusions, %d by the max depth and "
+            "children, max URLs reached: %s",
+            stats["urls_in_scope"],
+            target,
+            stats["excluded_urls"],
+            stats["limited_urls"],
+            stats["max_urls_reached"],
+        )
+        metrics.set_gauge(
+            "zap_spider_urls_in_scope",
+            stats["urls_in_scope"],
+            labels={"target": target},
+        )
+        metrics.increment(
+            "zap_spider_pruned_urls",
+            stats["excluded_urls"],
+            labels={"limit": "exclusions"},
+        )
+        metrics.increment(
+            "zap_spider_pruned_urls",
+            stats["limited_urls"],
+            labels={"limit": "max_depth_or_children"},
+        )
+        metrics.increment(
+            "zap_spider_pruned_scans",
+            int(stats["max_urls_reached"]),
+            labels={"limit": "max_urls"},
+        )
+
+    def _record_api_stats(self, scan_dir: pathlib.Path, target: str) -> None:
+        """Report the scan duration of the API endpoints collected by the hooks."""
+        try:
+            endpoints = json.loads(
+                (scan_dir / API_STATS_FILE_NAME).read_text(encoding="utf-8")
+            )
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.info("no API endpoint statistics collected")
+            return
+        total_ms = sum(e["time_ms"] for e in endpoints)
+        logger.info(
+            "scanned %d API endpoints of %s, %d ms of endpoint scans",
+            len(endpoints),
+            target,
+            total_ms,
+        )
+        for endpoint in sorted(endpoints, key=lambda e: e["time_ms"], reverse=True)[
+            :SLOWEST_API_ENDPOINTS
+        ]:
+            logger.info(
+                "API endpoint %s %s: %d ms",
+                ",".join(endpoint["methods"]),
+                endpoint["path"],
+                endpoint["time_ms"],
+            )
+        metrics.increment("zap_api_endpoints_scanned", len(endpoints))
+        metrics.increment("zap_api_endpoint_scan_time_ms", total_ms)
+        metrics.set_gauge(
+            "zap_api_endpoint_max_scan_time_ms",
+            max((e["time_ms"] for e in endpoints), default=0),
+            labels={"target": target},
+        )
+
+    def _record_rule_stats(self, scan_dir: pathlib.Path) -> None:
+        """Record the statistics of the active scan rules collected by the hooks."""
+        try:
+            scan_stats = json.loads(
+                (scan_dir / RULE_STATS_FILE_NAME).read_text(encoding="utf-8")
+            )
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.info("no active scan rule statistics collected")
+            return
+        for rule in sorted(scan_stats, key=lambda r: r["time_ms"], reverse=True):
+            logger.info(
+                "active scan rule %s (%s): %d ms, %d requests, %d alerts",
+                rule["name"],
+                rule["id"],
+                rule["time_ms"],
+                rule["request_count"],
+                rule["alert_count"],
+            )
+        self._rule_stats.record(scan_stats)
+
+    def _apply_incremental_scan(
+        self, target: str, results: dict, scan_dir: pathlib.Path
+    ) -> dict:
+        """Carry forward the previous findings on unchanged URLs and update the incremental index of the target."""
+        try:
+            hook_output = json.loads(
+                (scan_dir / INCREMENTAL_OUTPUT_FILE_NAME).read_text(encoding="utf-8")
+            )
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.warning("no incremental scan data collected for %s", target)
+            return results
+        previous = self._incremental_index.load(target)
+        if previous is not None:
+            results = incremental.carry_forward(
+                previous.get("report", {}), results, hook_output["unchanged_urls"]
+            )
+        metrics.set_gauge(
+            "zap_incremental_unchanged_urls",
+            len(hook_output["unchanged_urls"]),
+            labels={"target": target},
+        )
+        self._incremental_index.save(target, hook_output["fingerprints"], results)
+        return results
+
+    def _prepare_command(
+        self,
+        url: str,
+        output,
+        hooks: bool = False,
+        proxy: str | None = None,
+        api_definition_path: pathlib.Path | None = None,
+        scan_dir: pathlib.Path | None = None,
+    ) -> list[str]:
         """Prepare zap command."""
         command = [PROFILE_SCRIPT[self._scan_profile], "-d"]
-        # Set target.
-        command += ["-t", url]
-        # Set timeout.
-        if self._crawl_timeout is not None:
+        if self._scan_profile == API_PROFILE:
+            # Set the API definition, imported from the cache when cached.
+            if api_definition_path is not None:
+                # The script reads the definition file relative to the output directory.
+                command += [
+                    "-t",
+                    os.path.relpath(api_definition_path, OUTPUT_DIR),
+                    "-f",
+                    self._api_format,
+                ]
+                if api_definitions.origin(url) is not None:
+                    # The script overrides the host of the definition servers with a `host[:port]` value.
+                    command += ["-O", parse.urlparse(url).netloc]
+            else:
+                command += ["-t", url, "-f", self._api_format]
+        else:
+            # Set target.
+            command += ["-t", url]
+        # Set timeout, the api script has no spider.
+        if self._crawl_timeout is not None and self._scan_profile != API_PROFILE:
             command.extend(["-m", str(self._crawl_timeout)])
-        # Set proxy.
-        if self._proxy is not None:
-            parsed_proxy = _parse_proxy(self._proxy)
-            if parsed_proxy is not None:
-                zap_arguments = f"-config network.connection.httpProxy.enabled=true -config network.connection.httpProxy.host={parsed_proxy.proxy_host} -config network.connection.httpProxy.port={parsed_proxy.proxy_port}"
-                # Note: zap_arguments is a STRING,
-                # and it passed as a single argument to the command, using the -z option for the zap profile.
-                command.extend(["-z", zap_arguments])
+        zap_options = self._zap_options(proxy, scan_dir)
+        if len(zap_options) > 0:
+            # Note: the ZAP options are joined into a STRING,
+            # and it passed as a single argument to the command, using the -z option for the zap profile.
+            command.extend(["-z", " ".join(zap_options)])
+        # Set hooks.
+        if hooks is True:
+            command.append(f"--hook={ZAP_HOOKS_PATH}")
         # Set output and Spider crawling.
-        command.extend(["-j", "-J", output])
+        if self._scan_profile == API_PROFILE:
+            command.extend(["-J", output])
+        else:
+            command.extend(["-j", "-J", output])
         return command
+
+    def _zap_options(
+        self, proxy: str | None, scan_dir: pathlib.Path | None = None
+    ) -> list[str]:
+        """Prepare the ZAP command line options passed through the -z option."""
+        options = []
+        # Set proxy.
+        if proxy is not None:
+            parsed_proxy = _parse_proxy(proxy)
+            if parsed_proxy is not None:
+                options += [
+                    "-config network.connection.httpProxy.enabled=true",
+                    f"-config network.connection.httpProxy.host={parsed_proxy.proxy_host}",
+                    f"-config network.connection.httpProxy.port={parsed_proxy.proxy_port}",
+                ]
+        # Set AJAX spider options.
+        if self._ajax_spider_headless is True:
+            options.append(
+                f"-config ajaxSpider.browserId={AJAX_SPIDER_HEADLESS_BROWSER}"
+            )
+        if self._ajax_spider_browsers is not None:
+            options.append(
+                f"-config ajaxSpider.numberOfBrowsers={self._ajax_spider_browsers}"
+            )
+        if self._ajax_spider_max_crawl_states is not None:
+            options.append(
+                f"-config ajaxSpider.maxCrawlStates={self._ajax_spider_max_crawl_states}"
+            )
+        if self._ajax_spider_max_crawl_depth is not None:
+            options.append(
+                f"-config ajaxSpider.maxCrawlDepth={self._ajax_spider_max_crawl_depth}"
+            )
+        # Set spider crawl-shape options.
+        if self._spider_max_depth is not None:
+            options.append(f"-config spider.maxDepth={self._spider_max_depth}")
+        if self._spider_max_children is not None:
+            options.append(f"-config spider.maxChildren={self._spider_max_children}")
+        if self._spider_normalize_query is True:
+            options.append(
+                f"-config spider.handleParameters={SPIDER_NORMALIZED_QUERY_HANDLING}"
+            )
+        # Set ZAP database options.
+        if self._database_mode == jvm.DATABASE_MODE_FILE:
+            options.append("-lowmem")
+        if self._database_recovery_log is not None:
+            options.append(
+                f"-config database.recoverylog={str(self._database_recovery_log).lower()}"
+            )
+        if self._scan_session is True and scan_dir is not None:
+            options.append(f"-newsession {scan_dir / SESSION_FILE_NAME}")
+        return options
@@ -0,0 +1,221 @@
+"""End-to-end load-test harness running the agent against the synthetic vulnerable web application.
+
+The harness needs the ZAP scan scripts, so it runs inside the agent image. Emitted messages are recorded instead of
+being sent to the bus.
+
+Usage:
+    python -m benchmarks.load_test --pages 50 --params 3 --issues 20 --profiles baseline full --output results.json
+"""
+
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import pathlib
+import random
+import threading
+import time
+from typing import Any, Self
+
+from ostorlab.agent import definitions as agent_definitions
+from ostorlab.agent.message import message as m
+from ostorlab.runtimes import definitions as runtime_definitions
+from ostorlab.utils import definitions as utils_definitions
+
+from agent import zap_agent
+from benchmarks import synthetic_app
+
+AGENT_DEFINITION_PATH = pathlib.Path(__file__).parent.parent / "ostorlab.yaml"
+SECONDS_PER_HOUR = 3600
+PROC_DIR = "/proc"
+MEMORY_SAMPLING_INTERVAL = datetime.timedelta(seconds=1)
+
+
+@dataclasses.dataclass
+class LoadTestResult:
+    """Measures of the scans of one profile."""
+
+    profile: str
+    targets: int
+    duration_seconds: float
+    targets_per_hour: float
+    requests_per_second: float
+    time_to_first_finding_seconds: float | None
+    peak_memory_bytes: int
+    findings: int
+    recall: float
+
+
+class _RecordingZapAgent(zap_agent.ZapAgent):
+    """Zap agent recording the emitted messages with their emission time."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.emitted: list[tuple[float, str, dict[str, Any]]] = []
+
+    def emit(self, selector: str, data: dict[str, Any], *args, **kwargs) -> None:
+        self.emitted.append((time.monotonic(), selector, data))
+
+
+def _build_agent(profile: str, extra_args: dict[str, Any]) -> _RecordingZapAgent:
+    with AGENT_DEFINITION_PATH.open() as yaml_o:
+        definition = agent_definitions.AgentDefinition.from_yaml(yaml_o)
+    args = {"scan_profile": profile, **extra_args}
+    settings = runtime_definitions.AgentSettings(
+        key="agent/ostorlab/zap",
+        bus_url="NA",
+        bus_exchange_topic="NA",
+        args=[
+            utils_definitions.Arg(
+                name=name, type="string", value=json.dumps(value).encode()
+            )
+            for name, value in args.items()
+        ],
+        healthcheck_port=random.randint(5000, 6000),
+    )
+    return _RecordingZapAgent(definition, settings)
+
+
+def _process_tree_rss_bytes(pid: int) -> int:
+    """Sum the resident memory of a process and of all its descendants, the ZAP JVM included."""
+    parents: dict[int, int] = {}
+    for stat_path in pathlib.Path(PROC_DIR).glob("[0-9]*/stat"):
+        try:
+            stat = stat_path.read_text(encoding="utf-8")
+        except OSError:
+            # The process exited while listing.
+            continue
+        # The process name may contain spaces and parentheses, the fields after it are split on the last one.
+        parents[int(stat_path.parent.name)] = int(stat.rsplit(")", 1)[1].split()[1])
+    tree = {pid}
+    added = True
+    while added is True:
+        children = {child for child, parent in parents.items() if parent in tree}
+        added = len(children - tree) > 0
+        tree |= children
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for tree_pid in tree:
+        try:
+            statm = (pathlib.Path(PROC_DIR) / str(tree_pid) / "statm").read_text()
+        except OSError:
+            continue
+        total += int(statm.split()[1]) * page_size
+    return total
+
+
+class _ProcessTreeMemorySampler:
+    """Samples the memory of the harness process tree in the background and keeps the peak value.
+
+    The rusage of the children only covers the children that exited and were waited for, it misses the ZAP JVM started
+    by the scan script.
+    """
+
+    def __init__(self, interval: datetime.timedelta) -> None:
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.peak_rss_bytes = 0
+
+    def _run(self) -> None:
+        while True:
+            self.peak_rss_bytes = max(
+                self.peak_rss_bytes, _process_tree_rss_bytes(os.getpid())
+            )
+            if self._stop.wait(self._interval.total_seconds()):
+                return
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_profile(
+    profile: str,
+    pages: int,
+    params: int,
+    issues: int,
+    repeat: int,
+    extra_args: dict[str, Any],
+) -> LoadTestResult:
+    """Scan a fresh synthetic application `repeat` times with a profile and measure the scans."""
+    app = synthetic_app.SyntheticApp(pages=pages, params=params, issues=issues)
+    app.start()
+    try:
+        agent = _build_agent(profile, extra_args)
+        agent.start()
+        message = m.Message.from_data(
+            "v3.asset.link", data={"url": app.url, "method": "GET"}
+        )
+        start = time.monotonic()
+        with _ProcessTreeMemorySampler(MEMORY_SAMPLING_INTERVAL) as memory_sampler:
+            for _ in range(repeat):
+                agent.process(message)
+        duration = time.monotonic() - start
+    finally:
+        app.stop()
+
+    findings = [
+        (data["title"], metadata["value"])
+        for _, selector, data in agent.emitted
+        if selector == "v3.report.vulnerability"
+        for metadata in data.get("vulnerability_location", {}).get("metadata", [])
+    ]
+    first_finding_time = min((t for t, _, _ in agent.emitted), default=None)
+    return LoadTestResult(
+        profile=profile,
+        targets=repeat,
+        duration_seconds=duration,
+        targets_per_hour=repeat * SECONDS_PER_HOUR / duration,
+        requests_per_second=app.requests_count / duration,
+        time_to_first_finding_seconds=(
+            first_finding_time - start if first_finding_time is not None else None
+        ),
+        peak_memory_bytes=memory_sampler.peak_rss_bytes,
+        findings=len(agent.emitted),
+        recall=synthetic_app.recall(app.planted, findings),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--params", type=int, default=3)
+    parser.add_argument("--issues", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=["baseline", "full"],
+        choices=["baseline", "full"],
+    )
+    parser.add_argument(
+        "--agent-args",
+        type=json.loads,
+        default={},
+        help="JSON object of extra agent args, to compare performance features.",
+    )
+    parser.add_argument("--output", type=pathlib.Path, help="Path of the JSON results.")
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profiles:
+        result = run_profile(
+            profile, args.pages, args.params, args.issues, args.repeat, args.agent_args
+        )
+        print(json.dumps(dataclasses.asdict(result)))
+        results.append(result)
+    if args.output is not None:
+        args.output.write_text(
+            json.dumps([dataclasses.asdict(r) for r in results], indent=2),
+            encoding="utf-8",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark of the serial and parallel parsing of a large multi-site ZAP report.
+
+Usage:
+    python -m benchmarks.result_parser_benchmark --sites 200 --workers 4
+"""
+
+import argparse
+import copy
+import json
+import pathlib
+import time
+
+from agent import result_parser
+
+SAMPLE_REPORT_PATH = (
+    pathlib.Path(__file__).parent.parent / "tests" / "zap-test-output.json"
+)
+
+
+def _build_report(sites_count: int) -> dict:
+    """Build a report with `sites_count` copies of the sample report site."""
+    sample_site = json.loads(SAMPLE_REPORT_PATH.read_text(encoding="utf-8"))["site"][0]
+    sites = []
+    for i in range(sites_count):
+        site = copy.deepcopy(sample_site)
+        site["@name"] = f"https://site-{i}.example.com"
+        site["@host"] = f"site-{i}.example.com"
+        sites.append(site)
+    return {"site": sites}
+
+
+def _time_parse(report: dict, workers: int | None) -> tuple[float, list]:
+    start = time.perf_counter()
+    vulnerabilities = list(result_parser.parse_results(report, workers=workers))
+    return time.perf_counter() - start, vulnerabilities
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    report = _build_report(args.sites)
+    serial_duration, serial_vulnerabilities = _time_parse(report, workers=None)
+    parallel_duration, parallel_vulnerabilities = _time_parse(
+        report, workers=args.workers
+    )
+    if parallel_vulnerabilities != serial_vulnerabilities:
+        raise AssertionError("parallel parsing output differs from serial parsing")
+    print(f"vulnerabilities: {len(serial_vulnerabilities)}")
+    print(f"serial: {serial_duration:.2f}s")
+    print(f"parallel ({args.workers} workers): {parallel_duration:.2f}s")
+    print(f"speedup: {serial_duration / parallel_duration:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
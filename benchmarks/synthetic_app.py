@@ -0,0 +1,169 @@
+"""Synthetic vulnerable web application used by the load-test harness.
+
+The application serves a crawlable tree of pages taking query parameters. Issues are planted round-robin on the
+pages, each of a kind ZAP is expected to report.
+"""
+
+import dataclasses
+import threading
+from http import server
+from urllib import parse
+
+ISSUE_KINDS = ("headers", "xss", "sqli", "redirect")
+# Title prefix of the ZAP alert expected for each kind of planted issue.
+EXPECTED_ALERT_TITLES = {
+    "headers": "Content Security Policy (CSP) Header Not Set",
+    "xss": "Cross Site Scripting (Reflected)",
+    "sqli": "SQL Injection",
+    "redirect": "External Redirect",
+}
+SECURITY_HEADERS = {
+    "Content-Security-Policy": "default-src 'self'",
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "Cache-Control": "no-store",
+}
+SQL_ERROR = "You have an error in your SQL syntax; check the manual that corresponds to your MySQL server version"
+
+
+@dataclasses.dataclass(frozen=True)
+class PlantedIssue:
+    """Issue planted on a page, on one of its parameters."""
+
+    kind: str
+    path: str
+    param: str
+
+
+class SyntheticApp:
+    """Threaded HTTP server of the synthetic application."""
+
+    def __init__(
+        self, pages: int, params: int, issues: int, host: str = "127.0.0.1"
+    ) -> None:
+        self.pages = pages
+        self.params = [f"p{i}" for i in range(max(1, params))]
+        self.planted = [
+            PlantedIssue(
+                kind=ISSUE_KINDS[i % len(ISSUE_KINDS)],
+                path=f"/page/{i % pages}",
+                param=self.params[i % len(self.params)],
+            )
+            for i in range(issues)
+        ]
+        self._issues_by_path: dict[str, list[PlantedIssue]] = {}
+        for issue in self.planted:
+            self._issues_by_path.setdefault(issue.path, []).append(issue)
+        self.requests_count = 0
+        self._lock = threading.Lock()
+        self._server = server.ThreadingHTTPServer((host, 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count_request(self) -> None:
+        with self._lock:
+            self.requests_count += 1
+
+    def _page_links(self, indexes: list[int]) -> str:
+        """Links to the pages of the provided indexes, with all the parameters set."""
+        query = parse.urlencode({p: "value" for p in self.params})
+        return "".join(
+            f'<a href="/page/{i}?{query}">page {i}</a>'
+            for i in indexes
+            if i < self.pages
+        )
+
+    def render(
+        self, path: str, query: dict[str, str]
+    ) -> tuple[int, dict[str, str], str]:
+        """Render a page and return its status, headers and body."""
+        if path == "/":
+            return (
+                200,
+                dict(SECURITY_HEADERS),
+                f"<html><body>{self._page_links([0])}</body></html>",
+            )
+        if (
+            path.startswith("/page/") is False
+            or path[len("/page/") :].isdigit() is False
+        ):
+            return 404, dict(SECURITY_HEADERS), "<html><body>not found</body></html>"
+        index = int(path[len("/page/") :])
+        if index >= self.pages:
+            return 404, dict(SECURITY_HEADERS), "<html><body>not found</body></html>"
+
+        headers = dict(SECURITY_HEADERS)
+        content = []
+        for issue in self._issues_by_path.get(path, []):
+            value = query.get(issue.param, "")
+            if issue.kind == "headers":
+                headers.pop("Content-Security-Policy", None)
+            elif issue.kind == "xss":
+                content.append(f"<p>{value}</p>")
+            elif issue.kind == "sqli" and "'" in value:
+                return 500, headers, f"<html><body>{SQL_ERROR}</body></html>"
+            elif issue.kind == "redirect" and value.startswith(("http://", "https://")):
+                headers["Location"] = value
+                return 302, headers, ""
+        form_fields = "".join(f'<input name="{p}" value="value">' for p in self.params)
+        body = (
+            f"<html><body><h1>page {index}</h1>{''.join(content)}"
+            f'<form action="{path}" method="GET">{form_fields}</form>'
+            f"{self._page_links([2 * index + 1, 2 * index + 2])}</body></html>"
+        )
+        return 200, headers, body
+
+    def _handler_class(self) -> type[server.BaseHTTPRequestHandler]:
+        app = self
+
+        class Handler(server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                app._count_request()
+                parsed = parse.urlparse(self.path)
+                query = dict(parse.parse_qsl(parsed.query))
+                status, headers, body = app.render(parsed.path, query)
+                encoded = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(encoded)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format: str, *args) -> None:
+                del format, args
+
+        return Handler
+
+
+def recall(planted: list[PlantedIssue], findings: list[tuple[str, str]]) -> float:
+    """Ratio of the planted issues matched by a finding of the expected title on the same path.
+
+    Args:
+        planted: Planted issues.
+        findings: Title and URL of each finding.
+    """
+    if len(planted) == 0:
+        return 1.0
+    found_paths = [(title, parse.urlparse(url).path) for title, url in findings]
+    matched = [
+        issue
+        for issue in planted
+        if any(
+            title.startswith(EXPECTED_ALERT_TITLES[issue.kind]) and path == issue.path
+            for title, path in found_paths
+        )
+    ]
+    return len(matched) / len(planted)
@@ -0,0 +1,144 @@
+"""Unit tests for the cache of the API definitions."""
+
+import http.server
+import pathlib
+import threading
+
+import pytest
+from pytest_mock import plugin
+
+from agent import api_definitions
+
+OPENAPI_DEFINITION = b"""
+openapi: 3.0.0
+servers:
+  - url: https://api.dummy.com/v1
+paths:
+  /users:
+    get: {}
+    post: {}
+  /users/{id}:
+    parameters: []
+    delete: {}
+"""
+
+
+def testParseOpenapi_withOpenapi3Yaml_returnsServerAndEndpoints() -> None:
+    """Validates the server URL and the methods of every path are parsed."""
+    server_url, endpoints = api_definitions.parse_openapi(OPENAPI_DEFINITION)
+
+    assert server_url == "https://api.dummy.com/v1"
+    assert endpoints == [
+        {"path": "/users", "methods": ["GET", "POST"]},
+        {"path": "/users/{id}", "methods": ["DELETE"]},
+    ]
+
+
+def testParseOpenapi_withSwagger2Json_buildsServerFromHostAndBasePath() -> None:
+    """Validates Swagger 2 definitions are supported."""
+    server_url, endpoints = api_definitions.parse_openapi(
+        b'{"swagger": "2.0", "host": "dummy.com", "schemes": ["http"], "basePath": "/api",'
+        b' "paths": {"/pets": {"get": {}}}}'
+    )
+
+    assert server_url == "http://dummy.com/api"
+    assert endpoints == [{"path": "/pets", "methods": ["GET"]}]
+
+
+def testParseOpenapi_withoutPaths_raisesApiDefinitionError() -> None:
+    """Validates content that is not an API definition is rejected."""
+    with pytest.raises(api_definitions.ApiDefinitionError):
+        api_definitions.parse_openapi(b"<html></html>")
+
+
+def testApiDefinitionCacheLoad_withSameContent_parsesOnceAndOverridesHost(
+    tmp_path: pathlib.Path, mocker: plugin.MockerFixture
+) -> None:
+    """Validates a definition is parsed on the first load only and its endpoints are based on the target host."""
+    mocker.patch("agent.api_definitions.fetch", return_value=OPENAPI_DEFINITION)
+    parse_mock = mocker.patch(
+        "agent.api_definitions.parse_openapi",
+        wraps=api_definitions.parse_openapi,
+    )
+    cache = api_definitions.ApiDefinitionCache(str(tmp_path))
+
+    first = cache.load("https://staging.dummy.com:8443/openapi.yaml")
+    second = cache.load("https://staging.dummy.com:8443/openapi.yaml")
+
+    assert parse_mock.call_count == 1
+    assert first == second
+    assert first.path.read_bytes() == OPENAPI_DEFINITION
+    assert first.base_url == "https://staging.dummy.com:8443/v1"
+    assert len(first.endpoints) == 2
+    assert first.session_path.name.endswith("staging.dummy.com_8443.session")
+
+
+def testApiDefinitionCacheSession_whenSnapshotSaved_restoresACopyOfIt(
+    tmp_path: pathlib.Path, mocker: plugin.MockerFixture
+) -> None:
+    """Validates the session snapshot of a scan is cached once and the next scans get a copy of it."""
+    mocker.patch("agent.api_definitions.fetch", return_value=OPENAPI_DEFINITION)
+    cache = api_definitions.ApiDefinitionCache(str(tmp_path / "cache"))
+    definition = cache.load("https://dummy.com/openapi.yaml")
+    first_scan_dir = tmp_path / "scan-1"
+    first_scan_dir.mkdir()
+    (first_scan_dir / "api.session").write_text("tree")
+    (first_scan_dir / "api.session.data").write_text("data")
+    (first_scan_dir / "api.session.lck").write_text("lock")
+    second_scan_dir = tmp_path / "scan-2"
+    second_scan_dir.mkdir()
+
+    assert cache.restore_session(definition, second_scan_dir / "api.session") is False
+    cache.save_session(definition, first_scan_dir / "api.session")
+    (first_scan_dir / "api.session.data").write_text("scan history")
+    cache.save_session(definition, first_scan_dir / "api.session")
+    restored = cache.restore_session(definition, second_scan_dir / "api.session")
+
+    assert restored is True
+    assert sorted(p.name for p in second_scan_dir.iterdir()) == [
+        "api.session",
+        "api.session.data",
+    ]
+    assert (second_scan_dir / "api.session.data").read_text() == "data"
+
+
+def testFetch_withProxy_downloadsTheDefinitionThroughIt() -> None:
+    """Validates the definition is downloaded through the proxy of the scan."""
+    requested_urls = []
+
+    class _ProxyHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            requested_urls.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(OPENAPI_DEFINITION)
+
+        def log_message(self, *args) -> None:
+            del args
+
+    proxy = http.server.HTTPServer(("127.0.0.1", 0), _ProxyHandler)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    try:
+        content = api_definitions.fetch(
+            "http://api.dummy.com/openapi.yaml",
+            proxy=f"http://127.0.0.1:{proxy.server_port}",
+        )
+    finally:
+        proxy.shutdown()
+
+    assert content == OPENAPI_DEFINITION
+    assert requested_urls == ["http://api.dummy.com/openapi.yaml"]
+
+
+def testFetch_withLocalDir_readsTheFileRelativeToIt(tmp_path: pathlib.Path) -> None:
+    """Validates the definition files are read relative to the local directory, like the scan script does."""
+    (tmp_path / "openapi.yaml").write_bytes(OPENAPI_DEFINITION)
+
+    assert (
+        api_definitions.fetch("openapi.yaml", local_dir=str(tmp_path))
+        == OPENAPI_DEFINITION
+    )
+    assert (
+        api_definitions.fetch("/openapi.yaml", local_dir=str(tmp_path))
+        == OPENAPI_DEFINITION
+    )
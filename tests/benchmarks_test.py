@@ -0,0 +1,113 @@
+"""Unit tests for the load-test harness and its synthetic web application."""
+
+import os
+import subprocess
+import sys
+from urllib import error, request
+
+import pytest
+from pytest_mock import plugin
+
+from benchmarks import load_test, synthetic_app
+
+
+@pytest.fixture
+def app():
+    app = synthetic_app.SyntheticApp(pages=4, params=2, issues=4)
+    app.start()
+    yield app
+    app.stop()
+
+
+def testSyntheticApp_withPlantedIssues_servesVulnerablePages(
+    app: synthetic_app.SyntheticApp,
+) -> None:
+    """Validates the planted issues are reachable on their pages."""
+    with request.urlopen(f"{app.url}page/0?p0=x") as response:
+        assert response.headers.get("Content-Security-Policy") is None
+    with request.urlopen(f"{app.url}page/1?p1=<script>alert(1)</script>") as response:
+        assert "<script>alert(1)</script>" in response.read().decode()
+    with pytest.raises(error.HTTPError) as http_error:
+        request.urlopen(f"{app.url}page/2?p0='")
+    assert synthetic_app.SQL_ERROR in http_error.value.read().decode()
+    assert app.requests_count == 3
+
+
+def testRecall_withFindings_returnsRatioOfMatchedPlantedIssues() -> None:
+    """Validates planted issues are matched by title prefix and path."""
+    planted = [
+        synthetic_app.PlantedIssue(kind="xss", path="/page/1", param="p0"),
+        synthetic_app.PlantedIssue(kind="sqli", path="/page/2", param="p0"),
+    ]
+
+    assert (
+        synthetic_app.recall(
+            planted,
+            [
+                ("Cross Site Scripting (Reflected)", "http://127.0.0.1/page/1?p0=x"),
+                ("SQL Injection - MySQL", "http://127.0.0.1/page/3?p0=x"),
+            ],
+        )
+        == 0.5
+    )
+
+
+def testRunProfile_withMockedScan_measuresScans(mocker: plugin.MockerFixture) -> None:
+    """Validates the harness measures the findings emitted by the agent."""
+    mocker.patch(
+        "agent.zap_wrapper.ZapWrapper.scan",
+        return_value={
+            "site": [
+                {
+                    "@name": "http://127.0.0.1",
+                    "@host": "127.0.0.1",
+                    "alerts": [
+                        {
+                            "name": "Content Security Policy (CSP) Header Not Set",
+                            "desc": "",
+                            "solution": "",
+                            "otherinfo": "",
+                            "riskcode": "2",
+                            "confidence": "3",
+                            "reference": "",
+                            "cweid": "693",
+                            "instances": [
+                                {
+                                    "uri": "http://127.0.0.1/page/0",
+                                    "method": "GET",
+                                    "param": "",
+                                    "attack": "",
+                                    "evidence": "",
+                                }
+                            ],
+                        }
+                    ],
+                }
+            ]
+        },
+    )
+
+    result = load_test.run_profile(
+        "baseline", pages=4, params=1, issues=1, repeat=1, extra_args={}
+    )
+
+    assert result.findings == 1
+    assert result.recall == 1.0
+    assert result.time_to_first_finding_seconds is not None
+    assert result.peak_memory_bytes > 0
+
+
+def testProcessTreeRssBytes_withRunningChild_includesChildMemory() -> None:
+    """Validates the memory of the descendant processes, like the ZAP JVM, is included."""
+    self_rss = load_test._process_tree_rss_bytes(os.getpid())
+    child = subprocess.Popen(
+        [sys.executable, "-c", "import sys; sys.stdin.read()"], stdin=subprocess.PIPE
+    )
+    try:
+        tree_rss = load_test._process_tree_rss_bytes(os.getpid())
+        child_rss = load_test._process_tree_rss_bytes(child.pid)
+    finally:
+        child.communicate()
+
+    assert child_rss > 0
+    assert tree_rss > self_rss
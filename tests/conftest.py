@@ -10,7 +10,7 @@ from ostorlab.agent.message import message
 from ostorlab.runtimes import definitions as runtime_definitions
 from ostorlab.utils import definitions as utils_definitions
 
-from agent import zap_agent
+from agent import metrics, zap_agent
 
 VPN_CONFIG = """[Interface]
 # NetShield = 1
@@ -33,6 +33,14 @@ nameserver 8.8.4.4
 """
 
 
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """Reset the global metrics registry, so the metrics of a test do not leak into the next one."""
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
 @pytest.fixture
 def scan_message():
     """Creates a dummy message of type v3.asset.domain_name to be used by the agent for testing purposes."""
@@ -141,3 +149,63 @@ def zap_missing_headers_output() -> json:
         "r", encoding="utf-8"
     )
     return json.load(zap_output_file)
+
+
+@pytest.fixture
+def test_agent_with_dna_index() -> zap_agent.ZapAgent:
+    with (pathlib.Path(__file__).parent.parent / "ostorlab.yaml").open() as yaml_o:
+        definition = agent_definitions.AgentDefinition.from_yaml(yaml_o)
+        settings = runtime_definitions.AgentSettings(
+            key="agent/ostorlab/zap",
+            bus_url="NA",
+            bus_exchange_topic="NA",
+            args=[
+                utils_definitions.Arg(
+                    name="dna_index",
+                    type="boolean",
+                    value=json.dumps(True).encode(),
+                )
+            ],
+            healthcheck_port=random.randint(5000, 6000),
+        )
+        return zap_agent.ZapAgent(definition, settings)
+
+
+@pytest.fixture
+def test_agent_with_session_in_work_dir() -> zap_agent.ZapAgent:
+    with (pathlib.Path(__file__).parent.parent / "ostorlab.yaml").open() as yaml_o:
+        definition = agent_definitions.AgentDefinition.from_yaml(yaml_o)
+        settings = runtime_definitions.AgentSettings(
+            key="agent/ostorlab/zap",
+            bus_url="NA",
+            bus_exchange_topic="NA",
+            args=[
+                utils_definitions.Arg(
+                    name="zap_session_in_work_dir",
+                    type="boolean",
+                    value=json.dumps(True).encode(),
+                )
+            ],
+            healthcheck_port=random.randint(5000, 6000),
+        )
+        return zap_agent.ZapAgent(definition, settings)
+
+
+@pytest.fixture
+def test_agent_with_findings_store(tmp_path: pathlib.Path) -> zap_agent.ZapAgent:
+    with (pathlib.Path(__file__).parent.parent / "ostorlab.yaml").open() as yaml_o:
+        definition = agent_definitions.AgentDefinition.from_yaml(yaml_o)
+        settings = runtime_definitions.AgentSettings(
+            key="agent/ostorlab/zap",
+            bus_url="NA",
+            bus_exchange_topic="NA",
+            args=[
+                utils_definitions.Arg(
+                    name="findings_store_path",
+                    type="string",
+                    value=json.dumps(str(tmp_path / "findings.db")).encode(),
+                )
+            ],
+            healthcheck_port=random.randint(5000, 6000),
+        )
+        return zap_agent.ZapAgent(definition, settings)
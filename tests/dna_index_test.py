@@ -0,0 +1,31 @@
+"""Unit tests for the emitted DNA index."""
+
+import pathlib
+
+from agent import dna_index
+
+
+def testEmittedDnaIndexContains_whenDnaAlreadyEmitted_returnsTrue() -> None:
+    """Validates only the added DNAs are reported as emitted."""
+    index = dna_index.EmittedDnaIndex()
+
+    assert '{"title": "XSS"}' not in index
+    index.add('{"title": "XSS"}')
+
+    assert '{"title": "XSS"}' in index
+    assert '{"title": "SQLi"}' not in index
+
+
+def testEmittedDnaIndexFlush_withPath_persistsBloomFilterAcrossInstances(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates the bloom filter is persisted and reloaded."""
+    path = tmp_path / "dna.bloom"
+    index = dna_index.EmittedDnaIndex(path=str(path), capacity=1000)
+    index.add('{"title": "XSS"}')
+    index.flush()
+
+    reloaded_index = dna_index.EmittedDnaIndex(path=str(path), capacity=1000)
+
+    assert '{"title": "XSS"}' in reloaded_index
+    assert '{"title": "SQLi"}' not in reloaded_index
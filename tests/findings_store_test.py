@@ -0,0 +1,37 @@
+"""Unit tests for the findings store."""
+
+import pathlib
+
+from agent import findings_store
+
+
+def testFindingsStoreDiff_withPreviousScan_returnsNewPersistingAndResolvedFindings(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates the findings are diffed against the previous scan of the same target only."""
+    store = findings_store.FindingsStore(str(tmp_path / "findings.db"))
+    first_diff = store.diff("https://a.com", {"dna-1": "XSS", "dna-2": "SQLi"})
+    store.commit("https://a.com", {"dna-1": "XSS", "dna-2": "SQLi"})
+    store.commit("https://b.com", {"dna-3": "CSRF"})
+
+    diff = store.diff("https://a.com", {"dna-2": "SQLi", "dna-4": "SSRF"})
+
+    assert first_diff.new == {"dna-1", "dna-2"}
+    assert diff.new == {"dna-4"}
+    assert diff.persisting == {"dna-2"}
+    assert diff.resolved == ["XSS"]
+
+
+def testFindingsStoreDiff_withoutCommit_leavesStoredFindingsUnchanged(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates a diff does not change the store until the findings are committed."""
+    store = findings_store.FindingsStore(str(tmp_path / "findings.db"))
+    store.commit("https://a.com", {"dna-1": "XSS"})
+
+    store.diff("https://a.com", {})
+    diff = store.diff("https://a.com", {"dna-1": "XSS"})
+
+    assert diff.new == set()
+    assert diff.persisting == {"dna-1"}
+    assert diff.resolved == []
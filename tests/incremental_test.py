@@ -0,0 +1,124 @@
+"""Unit tests for the incremental scan index."""
+
+import pathlib
+from unittest import mock
+
+from agent import incremental, zap_hooks
+
+PREVIOUS_REPORT = {
+    "site": [
+        {
+            "@name": "https://dummy.com",
+            "@host": "dummy.com",
+            "alerts": [
+                {
+                    "pluginid": "40018",
+                    "name": "SQL Injection",
+                    "instances": [
+                        {
+                            "uri": "https://dummy.com/stable",
+                            "method": "GET",
+                            "param": "id",
+                        },
+                        {
+                            "uri": "https://dummy.com/changed",
+                            "method": "GET",
+                            "param": "id",
+                        },
+                    ],
+                }
+            ],
+        }
+    ]
+}
+
+
+def testCarryForward_withUnchangedUrls_addsOnlyTheirPreviousFindings() -> None:
+    """Validates findings on unchanged URLs are carried forward without duplicates."""
+    report = {
+        "site": [{"@name": "https://dummy.com", "@host": "dummy.com", "alerts": []}]
+    }
+
+    merged = incremental.carry_forward(
+        PREVIOUS_REPORT, report, ["https://dummy.com/stable"]
+    )
+    merged_again = incremental.carry_forward(
+        PREVIOUS_REPORT, merged, ["https://dummy.com/stable"]
+    )
+
+    assert report["site"][0]["alerts"] == []
+    assert merged_again == merged
+    assert merged["site"][0]["alerts"] == [
+        {
+            "pluginid": "40018",
+            "name": "SQL Injection",
+            "instances": [
+                {"uri": "https://dummy.com/stable", "method": "GET", "param": "id"}
+            ],
+        }
+    ]
+
+
+def testIncrementalIndex_whenSaved_loadsFingerprintsAndReport(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates the index of a target is persisted."""
+    index = incremental.IncrementalIndex(str(tmp_path / "index"))
+    fingerprints = {
+        "https://dummy.com/": {"hash": "abc", "etag": None, "last_modified": None}
+    }
+
+    index.save("https://dummy.com", fingerprints, PREVIOUS_REPORT)
+
+    assert index.load("https://other.com") is None
+    assert index.load("https://dummy.com") == {
+        "target": "https://dummy.com",
+        "fingerprints": fingerprints,
+        "report": PREVIOUS_REPORT,
+    }
+
+
+def testZapActiveScanHook_withPreviousIndex_excludesUnchangedUrls(
+    tmp_path: pathlib.Path, monkeypatch
+) -> None:
+    """Validates the hook excludes the unchanged URLs from the active scan and records the new fingerprints."""
+    index = incremental.IncrementalIndex(str(tmp_path))
+    index.save(
+        "https://dummy.com",
+        {
+            "https://dummy.com/stable": {
+                "hash": "x",
+                "etag": '"v1"',
+                "last_modified": None,
+            },
+            "https://dummy.com/changed": {
+                "hash": "x",
+                "etag": '"v1"',
+                "last_modified": None,
+            },
+        },
+        PREVIOUS_REPORT,
+    )
+    monkeypatch.setenv(
+        zap_hooks.INCREMENTAL_INDEX_ENV, str(index.path("https://dummy.com"))
+    )
+    monkeypatch.setenv(zap_hooks.INCREMENTAL_OUTPUT_ENV, str(tmp_path / "out.json"))
+    zap = mock.MagicMock()
+    zap.core.messages.return_value = [
+        {
+            "requestHeader": f"GET {url} HTTP/1.1\r\nHost: dummy.com\r\n",
+            "responseHeader": f'HTTP/1.1 200 OK\r\nETag: "{etag}"\r\n',
+            "responseBody": "<html></html>",
+        }
+        for url, etag in [
+            ("https://dummy.com/stable", "v1"),
+            ("https://dummy.com/changed", "v2"),
+            ("https://dummy.com/new", "v1"),
+        ]
+    ]
+
+    zap_hooks.zap_active_scan(zap, "https://dummy.com", "policy")
+
+    zap.ascan.exclude_from_scan.assert_called_once_with("^https://dummy\\.com/stable$")
+    output = (tmp_path / "out.json").read_text()
+    assert '"unchanged_urls": ["https://dummy.com/stable"]' in output
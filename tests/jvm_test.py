@@ -0,0 +1,53 @@
+"""Unit tests for the ZAP JVM sizing."""
+
+import pathlib
+
+from pytest_mock import plugin
+
+from agent import jvm
+
+
+def testContainerMemoryLimitBytes_whenCgroupV2Limit_returnsLimit(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the memory limit is read from the cgroup v2 interface."""
+    memory_max = tmp_path / "memory.max"
+    memory_max.write_text("4294967296\n", encoding="utf-8")
+    mocker.patch.object(jvm, "CGROUP_V2_MEMORY_MAX_PATH", str(memory_max))
+
+    assert jvm.container_memory_limit_bytes() == 4294967296
+
+
+def testContainerMemoryLimitBytes_whenUnlimited_returnsNone(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates an unlimited container has no memory limit."""
+    memory_max = tmp_path / "memory.max"
+    memory_max.write_text("max\n", encoding="utf-8")
+    mocker.patch.object(jvm, "CGROUP_V2_MEMORY_MAX_PATH", str(memory_max))
+
+    assert jvm.container_memory_limit_bytes() is None
+
+
+def testJvmOptions_withLargeHeap_usesG1() -> None:
+    """Validates a large heap uses the G1 garbage collector."""
+    assert jvm.jvm_options(jvm.heap_size_mb(8 * 1024**3, 0.75)) == [
+        "-Xmx6144m",
+        "-XX:+UseG1GC",
+        "-XX:MaxGCPauseMillis=200",
+    ]
+
+
+def testJvmOptions_withSmallHeap_usesSerialGc() -> None:
+    """Validates a small heap uses the serial garbage collector."""
+    assert jvm.jvm_options(512) == ["-Xmx512m", "-XX:+UseSerialGC"]
+
+
+def testDatabaseMode_withSmallHeap_usesFileDatabase() -> None:
+    """Validates a small heap keeps the ZAP database in files."""
+    assert jvm.database_mode(512) == jvm.DATABASE_MODE_FILE
+
+
+def testDatabaseMode_withLargeHeap_usesInMemoryDatabase() -> None:
+    """Validates a large heap keeps the ZAP database in memory."""
+    assert jvm.database_mode(6144) == jvm.DATABASE_MODE_MEMORY
@@ -0,0 +1,80 @@
+"""Unit tests for the profiling helpers."""
+
+import io
+import pathlib
+import time
+
+from pytest_mock import plugin
+
+from agent import profiling
+
+
+def _busy_function() -> None:
+    deadline = time.monotonic() + 0.2
+    while time.monotonic() < deadline:
+        pass
+
+
+def testSamplingProfiler_whenBusy_collectsHotspotsAndCollapsedStacks(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates the stack samples of the profiled thread are aggregated."""
+    with profiling.SamplingProfiler() as profiler:
+        _busy_function()
+
+    profiler.write_collapsed(tmp_path / "agent.collapsed")
+
+    assert "_busy_function" in profiler.hotspots()[0][0]
+    assert "_busy_function" in (tmp_path / "agent.collapsed").read_text()
+
+
+def testJfrHotspots_withExecutionSamples_countsTopFrames(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates the JFR execution samples are aggregated by top frame."""
+    output = """
+jdk.ExecutionSample {
+  startTime = 10:55:12.345
+  stackTrace = [
+    org.Parser.parse(byte[]) line: 12
+    org.Scanner.run() line: 40
+  ]
+}
+
+jdk.ExecutionSample {
+  stackTrace = [
+    org.Parser.parse(byte[]) line: 14
+  ]
+}
+
+jdk.ExecutionSample {
+  stackTrace = [
+    org.Http.send(java.lang.String, int) line: 3
+  ]
+}
+
+jdk.ExecutionSample {
+  stackTrace = null
+}
+"""
+    popen_mock = mocker.patch("subprocess.Popen")
+    process = popen_mock.return_value.__enter__.return_value
+    process.stdout = io.StringIO(output)
+    process.returncode = 0
+
+    assert profiling.jfr_hotspots(pathlib.Path("zap.jfr")) == [
+        ("org.Parser.parse", 2),
+        ("org.Http.send", 1),
+    ]
+
+
+def testJfrHotspots_whenJfrFails_returnsNoHotspots(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates a recording that can not be read is reported without hotspots."""
+    popen_mock = mocker.patch("subprocess.Popen")
+    process = popen_mock.return_value.__enter__.return_value
+    process.stdout = io.StringIO("")
+    process.returncode = 1
+
+    assert profiling.jfr_hotspots(pathlib.Path("zap.jfr")) == []
@@ -0,0 +1,69 @@
+"""Unit tests for the pool of upstream proxies."""
+
+import socket
+from collections.abc import Iterator
+
+import pytest
+
+from agent import metrics, proxy_pool
+
+
+@pytest.fixture
+def listening_port() -> Iterator[int]:
+    """Port of a local socket accepting connections, standing in for a proxy."""
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        yield server.getsockname()[1]
+
+
+def _closed_port() -> int:
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        return server.getsockname()[1]
+
+
+def testProxyPoolAcquire_withSeveralProxies_assignsLeastLoadedProxy() -> None:
+    """Validates the scans are spread on the proxies with the least active scans."""
+    pool = proxy_pool.ProxyPool(["http://proxy1:8080", "http://proxy2:8080"])
+
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    third = pool.acquire()
+
+    assert first.url != second.url
+    assert third.url == first.url
+    assert first.scans == 2
+    assert metrics.get("zap_proxy_active_scans", {"proxy": second.url}) == 1
+
+
+def testProxyPoolCheck_withClosedPort_marksProxyUnhealthy(listening_port: int) -> None:
+    """Validates a proxy refusing connections is unhealthy and no longer assigned scans."""
+    dead_url = f"http://127.0.0.1:{_closed_port()}"
+    alive_url = f"http://127.0.0.1:{listening_port}"
+    pool = proxy_pool.ProxyPool([dead_url, alive_url])
+
+    pool.check_all()
+
+    assert [p.healthy for p in pool.proxies] == [False, True]
+    assert pool.proxies[0].failures == 1
+    assert pool.proxies[1].latency_ms is not None
+    assert pool.acquire().url == alive_url
+    assert metrics.get("zap_proxy_healthy", {"proxy": dead_url}) == 0
+
+
+def testProxyPoolFailover_whenProxyDies_movesScanToHealthyProxy() -> None:
+    """Validates failover moves the scan to another proxy and raises when none is healthy."""
+    pool = proxy_pool.ProxyPool(["http://proxy1:8080", "http://proxy2:8080"])
+    proxy = pool.acquire()
+    proxy.healthy = False
+
+    new_proxy = pool.failover(proxy)
+
+    assert new_proxy.url != proxy.url
+    assert proxy.active_scans == 0
+    assert new_proxy.active_scans == 1
+    new_proxy.healthy = False
+    with pytest.raises(proxy_pool.NoHealthyProxyError):
+        pool.failover(new_proxy)
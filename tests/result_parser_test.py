@@ -5,7 +5,7 @@ import pathlib
 
 from ostorlab.agent.mixins import agent_report_vulnerability_mixin as vuln_mixin
 
-from agent import result_parser
+from agent import result_parser, suppressions
 
 
 def testParseResults_always_yieldsValidVulnerabilities():
@@ -44,3 +44,39 @@ def testParseResults_whenMissingHeader_yieldsValidVulnerabilities(
         vulnz[0].technical_detail
         == "Strict-Transport-Security Header Not Set at https://www.google.com/default"
     )
+
+
+def testParseResults_withWorkers_yieldsSameVulnerabilitiesAsSerialParsing() -> None:
+    """Test parallel parsing of Zap JSON output yields the serial output in the same order."""
+    with (pathlib.Path(__file__).parent / "zap-output-with-multiple-targets.json").open(
+        "r", encoding="utf-8"
+    ) as o:
+        results = json.load(o)
+
+    serial_vulnz = list(result_parser.parse_results(results))
+    parallel_vulnz = list(result_parser.parse_results(results, workers=2))
+
+    assert len(serial_vulnz) > 0
+    assert parallel_vulnz == serial_vulnz
+    assert list(result_parser.parse_results({}, workers=2)) == []
+
+
+def testParseResults_withSuppressionIndex_dropsKnownFalsePositives(
+    zap_missing_headers_output: json,
+) -> None:
+    """Test the suppressed alert instances are dropped before being parsed."""
+    index = suppressions.SuppressionIndex(
+        [
+            {"plugin_id": "10021", "host": "www.google.com"},
+            {"plugin_id": "10035", "host": "*.google.com", "path": "^/groups"},
+        ]
+    )
+
+    vulnz = list(
+        result_parser.parse_results(zap_missing_headers_output, suppression_index=index)
+    )
+
+    assert len(vulnz) == 11
+    assert all(
+        "/groups" not in v.vulnerability_location.metadata[0].value for v in vulnz
+    )
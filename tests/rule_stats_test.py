@@ -0,0 +1,71 @@
+"""Unit tests for the active scan rule statistics."""
+
+import pathlib
+
+from agent import metrics, rule_stats
+
+
+def _rule(rule_id: str, time_ms: int, alert_count: int) -> dict:
+    return {
+        "id": rule_id,
+        "name": f"rule {rule_id}",
+        "status": "Complete",
+        "time_ms": time_ms,
+        "request_count": 100,
+        "alert_count": alert_count,
+    }
+
+
+def testRuleStatsStore_whenSlowRulesWithoutAlerts_returnsThemAfterEnoughRuns(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates only the slow rules that never raised an alert are over budget, and stats are persisted."""
+    path = tmp_path / "rule_stats.json"
+    store = rule_stats.RuleStatsStore(str(path))
+    scan_stats = [_rule("40018", 600_000, 0), _rule("6", 900_000, 2), _rule("1", 10, 0)]
+
+    store.record(scan_stats)
+    assert store.slow_rules(60_000) == []
+    for _ in range(rule_stats.MIN_RUNS_BEFORE_SKIP - 1):
+        store.record(scan_stats)
+
+    assert store.slow_rules(60_000) == ["40018"]
+    assert rule_stats.RuleStatsStore(str(path)).slow_rules(60_000) == ["40018"]
+    assert metrics.get("zap_rule_request_count", labels={"rule": "6"}) == 300
+
+
+def testRuleStatsStoreRecord_whenRuleSkipped_doesNotCountTheRun(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates the runs of a rule skipped without sending requests do not lower its average duration."""
+    store = rule_stats.RuleStatsStore(str(tmp_path / "rule_stats.json"))
+    for _ in range(rule_stats.MIN_RUNS_BEFORE_SKIP):
+        store.record([_rule("40018", 600_000, 0)])
+    skipped = {**_rule("40018", 0, 0), "status": "Skipped", "request_count": 0}
+
+    for _ in range(rule_stats.MIN_RUNS_BEFORE_SKIP):
+        store.record([skipped])
+
+    assert store.slow_rules(60_000) == ["40018"]
+    assert metrics.get("zap_rule_request_count", labels={"rule": "40018"}) == 300
+
+
+def testRuleStatsStoreRulesToSkip_whenSkippedRuleReprobed_reEnablesItOnAlert(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates a skipped rule runs again periodically and is no longer skipped once it raised an alert."""
+    path = tmp_path / "rule_stats.json"
+    store = rule_stats.RuleStatsStore(str(path))
+    for _ in range(rule_stats.MIN_RUNS_BEFORE_SKIP):
+        store.record([_rule("40018", 600_000, 0)])
+
+    decisions = [
+        rule_stats.RuleStatsStore(str(path)).rules_to_skip(60_000)
+        for _ in range(rule_stats.REPROBE_INTERVAL)
+    ]
+
+    assert decisions[:-1] == [["40018"]] * (rule_stats.REPROBE_INTERVAL - 1)
+    assert decisions[-1] == []
+    store = rule_stats.RuleStatsStore(str(path))
+    store.record([_rule("40018", 120_000, 1)])
+    assert store.rules_to_skip(60_000) == []
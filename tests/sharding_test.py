@@ -0,0 +1,217 @@
+"""Unit tests for the sharding of the targets across the agent replicas."""
+
+import collections
+import json
+import os
+import pathlib
+import random
+import time
+from typing import Any
+
+import pytest
+from ostorlab.agent import definitions as agent_definitions
+from ostorlab.agent.message import message as m
+from ostorlab.runtimes import definitions as runtime_definitions
+from ostorlab.utils import definitions as utils_definitions
+from pytest_mock import plugin
+
+from agent import sharding, zap_agent
+
+TARGETS = [
+    "https://www.ostorlab.co/login",
+    "https://api.ostorlab.co/v1",
+    "https://shop.example.co.uk/",
+    "https://example.com/",
+    "https://blog.example.com/posts",
+    "https://dummy.org/",
+    "https://10.0.0.1:8443/",
+    "https://sub.test.net/",
+]
+
+
+def testRegistrableDomain_withSubdomainsSuffixesAndIps_returnsRegistrableDomain() -> (
+    None
+):
+    """Validates the subdomains of a registrable domain share the same shard key."""
+    assert sharding.registrable_domain("https://a.b.ostorlab.co/x") == "ostorlab.co"
+    assert sharding.registrable_domain("https://shop.example.co.uk") == "example.co.uk"
+    assert sharding.registrable_domain("ostorlab.co") == "ostorlab.co"
+    assert sharding.registrable_domain("http://10.0.0.1:8080/") == "10.0.0.1"
+
+
+def testHashRing_whenReplicaJoins_onlyMovesKeysToNewReplica() -> None:
+    """Validates consistent hashing moves a fraction of the keys, all of them to the joining replica."""
+    keys = [f"domain{i}.com" for i in range(1000)]
+    ring = sharding.HashRing(["replica-0", "replica-1", "replica-2"])
+    before = {key: ring.owner(key) for key in keys}
+
+    ring.add("replica-3")
+    after = {key: ring.owner(key) for key in keys}
+
+    moved = [key for key in keys if before[key] != after[key]]
+    assert all(after[key] == "replica-3" for key in moved)
+    assert 150 < len(moved) < 350
+    ring.remove("replica-3")
+    assert {key: ring.owner(key) for key in keys} == before
+
+
+def testFileMembership_withStaleHeartbeat_excludesReplica(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates replicas stop being live once their heartbeat is older than the TTL or they left."""
+    alive = sharding.FileMembership(str(tmp_path), "alive")
+    stale = sharding.FileMembership(str(tmp_path), "stale")
+    left = sharding.FileMembership(str(tmp_path), "left")
+    for membership in (alive, stale, left):
+        membership.heartbeat()
+    old = time.time() - sharding.HEARTBEAT_TTL.total_seconds() - 1
+    os.utime(tmp_path / "stale", (old, old))
+    left.leave()
+
+    assert alive.live_replicas() == {"alive"}
+
+
+def testFileInbox_withLeftReplica_deliversItsMessagesOnce(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates the messages are delivered to their replica, and the ones of a replica that left to a single other
+    replica."""
+    first = sharding.FileInbox(str(tmp_path), "replica-0")
+    second = sharding.FileInbox(str(tmp_path), "replica-1")
+    message = sharding.ForwardedMessage(
+        selector="v3.asset.link", raw=b"\x00raw", forwards=1
+    )
+    first.send("replica-1", message)
+    first.send("replica-2", message)
+
+    received = second.receive({"replica-0", "replica-1", "replica-2"})
+    orphans = second.receive({"replica-0", "replica-1"})
+
+    assert received == [message]
+    assert orphans == [message]
+    assert first.receive({"replica-0", "replica-1"}) == []
+
+
+class _LocalBus:
+    """Stand-in bus delivering each message to one of the replicas sharing the queue, in turn."""
+
+    def __init__(self, agents: list[zap_agent.ZapAgent]) -> None:
+        self.agents = agents
+        self._queue: collections.deque[tuple[str, dict[str, Any]]] = collections.deque()
+        self._next = 0
+
+    def publish(self, selector: str, data: dict[str, Any]) -> None:
+        self._queue.append((selector, data))
+
+    def drain(self) -> None:
+        while len(self._queue) > 0:
+            selector, data = self._queue.popleft()
+            agents = [a for a in self.agents if a is not None]
+            agent = agents[self._next % len(agents)]
+            self._next += 1
+            agent.process(m.Message.from_data(selector, data=data))
+        # Replicas poll the targets forwarded to their inbox.
+        for agent in self.agents:
+            if agent is not None:
+                agent._process_shard_inbox()
+
+
+def _agent(
+    membership_dir: pathlib.Path, replica_id: str, shard_mode: str = "forward"
+) -> zap_agent.ZapAgent:
+    with (pathlib.Path(__file__).parent.parent / "ostorlab.yaml").open() as yaml_o:
+        definition = agent_definitions.AgentDefinition.from_yaml(yaml_o)
+    args = {
+        "shard_membership_dir": str(membership_dir),
+        "shard_replica_id": replica_id,
+        "shard_mode": shard_mode,
+    }
+    settings = runtime_definitions.AgentSettings(
+        key="agent/ostorlab/zap",
+        bus_url="NA",
+        bus_exchange_topic="NA",
+        args=[
+            utils_definitions.Arg(
+                name=name, type="string", value=json.dumps(value).encode()
+            )
+            for name, value in args.items()
+        ],
+        healthcheck_port=random.randint(5000, 6000),
+    )
+    return zap_agent.ZapAgent(definition, settings)
+
+
+def testZapAgentProcess_withSeveralReplicas_scansEachTargetOnItsOwner(
+    tmp_path: pathlib.Path, mocker: plugin.MockerFixture
+) -> None:
+    """Validates every target is scanned once, by the owner of its registrable domain, before and after a replica
+    leaves the ring, and nothing is sent back to the bus."""
+    agents = [_agent(tmp_path, f"replica-{i}") for i in range(3)]
+    scanned: dict[str, list[str]] = collections.defaultdict(list)
+    emit_mocks = []
+    for agent in agents:
+        replica_id = agent._shard_router.replica_id
+        mocker.patch.object(
+            agent,
+            "_scan",
+            side_effect=lambda target, replica_id=replica_id: scanned[
+                replica_id
+            ].append(target),
+        )
+        emit_mocks.append(mocker.patch.object(agent, "emit"))
+        agent._shard_router.refresh()
+    for agent in agents:
+        agent._shard_router.refresh()
+    bus = _LocalBus(agents)
+
+    for target in TARGETS:
+        bus.publish("v3.asset.link", {"url": target, "method": "GET"})
+    bus.drain()
+
+    assert sorted(t for targets in scanned.values() for t in targets) == sorted(TARGETS)
+    for replica_id, targets in scanned.items():
+        assert all(agents[0]._shard_router.owner(t) == replica_id for t in targets)
+    ostorlab_owners = {
+        r for r, targets in scanned.items() for t in targets if "ostorlab.co" in t
+    }
+    assert len(ostorlab_owners) == 1
+    assert all(emit_mock.call_count == 0 for emit_mock in emit_mocks)
+
+    agents[2]._shard_router.stop()
+    bus.agents[2] = None
+    for agent in agents[:2]:
+        agent._shard_router.refresh()
+    scanned.clear()
+    for target in TARGETS:
+        bus.publish("v3.asset.link", {"url": target, "method": "GET"})
+    bus.drain()
+
+    assert sorted(t for targets in scanned.values() for t in targets) == sorted(TARGETS)
+    assert "replica-2" not in scanned
+
+
+def testZapAgent_withSkipShardMode_skipsTargetsOwnedByOtherReplicas(
+    tmp_path: pathlib.Path, mocker: plugin.MockerFixture
+) -> None:
+    """Validates replicas each getting every message only scan the targets they own."""
+    agents = [_agent(tmp_path, f"replica-{i}", shard_mode="skip") for i in range(2)]
+    scan_mocks = [mocker.patch.object(agent, "_scan") for agent in agents]
+    for agent in agents + agents:
+        agent._shard_router.refresh()
+
+    for target in TARGETS:
+        for agent in agents:
+            agent.process(
+                m.Message.from_data("v3.asset.link", {"url": target, "method": "GET"})
+            )
+
+    assert sum(scan_mock.call_count for scan_mock in scan_mocks) == len(TARGETS)
+    assert (tmp_path / zap_agent.SHARD_INBOX_DIR_NAME).exists() is False
+
+
+def testZapAgentInit_withUnknownShardMode_raisesValueError(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates an unknown shard mode is rejected instead of falling back to another mode."""
+    with pytest.raises(ValueError):
+        _agent(tmp_path, "replica-0", shard_mode="broadcast")
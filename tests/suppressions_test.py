@@ -0,0 +1,48 @@
+"""Unit tests for the index of the known false positives."""
+
+import pathlib
+
+import pytest
+
+from agent import suppressions
+
+
+def testHostTrieMatch_withExactAndWildcardPatterns_matchesHostsAndSubdomains() -> None:
+    """Validates exact hosts, subdomain wildcards and the any-host pattern are matched."""
+    trie = suppressions.HostTrie()
+    trie.insert("example.com", "exact")
+    trie.insert("*.example.com", "subdomains")
+    trie.insert("*", "any")
+
+    assert sorted(trie.match("example.com")) == ["any", "exact"]
+    assert sorted(trie.match("api.Example.com")) == ["any", "subdomains"]
+    assert trie.match("example.org") == ["any"]
+
+
+def testSuppressionIndex_withRules_suppressesByPluginHostAndPath() -> None:
+    """Validates a rule only suppresses the alerts of its plugin on its host and path."""
+    index = suppressions.SuppressionIndex(
+        [
+            {"plugin_id": 10038, "host": "*.example.com", "path": "^/static/"},
+            {"plugin_id": "10021", "host": "cdn.example.com"},
+        ]
+    )
+
+    assert index.is_suppressed("10038", "www.example.com", "/static/app.js") is True
+    assert index.is_suppressed("10038", "www.example.com", "/login") is False
+    assert index.is_suppressed("10038", "example.com", "/static/app.js") is False
+    assert index.is_suppressed("40012", "www.example.com", "/static/app.js") is False
+    assert index.is_suppressed("10021", "cdn.example.com", "/any") is True
+    assert index.suppressed_plugins("cdn.example.com") == ["10021"]
+    assert index.suppressed_plugins("www.example.com") == []
+
+
+def testSuppressionIndexFromFile_withInvalidRegex_raisesInvalidSuppressionRuleError(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates malformed rules are rejected when the file is loaded."""
+    path = tmp_path / "suppressions.yaml"
+    path.write_text('- plugin_id: 10038\n  path: "(unclosed"\n')
+
+    with pytest.raises(suppressions.InvalidSuppressionRuleError):
+        suppressions.SuppressionIndex.from_file(str(path))
@@ -0,0 +1,74 @@
+"""Unit tests for the work directories garbage collector."""
+
+import datetime
+import os
+import pathlib
+import time
+
+from agent import metrics, work_dir
+
+
+def testWorkDirGarbageCollectorCollect_whenOverBudget_removesOldestEntries(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates the oldest entries are removed first and recent ones are kept."""
+    now = time.time()
+    for name, age in [("scan-old", 7200), ("scan-older", 10800), ("scan-new", 0)]:
+        scan_dir = tmp_path / name
+        scan_dir.mkdir()
+        (scan_dir / "report.json").write_bytes(b"x" * 100)
+        os.utime(scan_dir, (now - age, now - age))
+    collector = work_dir.WorkDirGarbageCollector(
+        directories=[str(tmp_path), str(tmp_path / "missing")],
+        prefix="scan-",
+        budget_bytes=250,
+        min_age=datetime.timedelta(hours=1),
+        interval=datetime.timedelta(minutes=1),
+    )
+
+    usage = collector.collect()
+
+    assert usage == 200
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["scan-new", "scan-old"]
+    assert metrics.get("zap_work_dir_disk_usage_bytes") == 200
+
+
+def testWorkDirGarbageCollectorCollect_whenOnlyRecentEntries_keepsThem(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates entries that may be used by a running scan are never removed."""
+    (tmp_path / "scan-running").mkdir()
+    (tmp_path / "scan-running" / "session.data").write_bytes(b"x" * 100)
+    collector = work_dir.WorkDirGarbageCollector(
+        directories=[str(tmp_path)],
+        prefix="scan-",
+        budget_bytes=10,
+        min_age=datetime.timedelta(hours=1),
+        interval=datetime.timedelta(minutes=1),
+    )
+
+    assert collector.collect() == 100
+    assert (tmp_path / "scan-running").exists() is True
+
+
+def testWorkDirGarbageCollectorCollect_whenOtherEntries_keepsThem(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates only the per-scan work directories are collected, user mounted files are left alone."""
+    now = time.time()
+    (tmp_path / "policy.policy").write_bytes(b"x" * 100)
+    (tmp_path / "profiles").mkdir()
+    (tmp_path / "scan-old").mkdir()
+    (tmp_path / "scan-old" / "report.json").write_bytes(b"x" * 100)
+    for path in tmp_path.iterdir():
+        os.utime(path, (now - 7200, now - 7200))
+    collector = work_dir.WorkDirGarbageCollector(
+        directories=[str(tmp_path)],
+        prefix="scan-",
+        budget_bytes=10,
+        min_age=datetime.timedelta(hours=1),
+        interval=datetime.timedelta(minutes=1),
+    )
+
+    assert collector.collect() == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["policy.policy", "profiles"]
@@ -3,13 +3,16 @@
 import io
 import json
 import pathlib
+import signal
 import subprocess
+import threading
 from unittest import mock
 
+import pytest
 from ostorlab.agent.message import message
 from pytest_mock import plugin
 
-from agent import zap_agent
+from agent import zap_agent, zap_wrapper
 
 VPN_CONFIG = """[Interface]
 # NetShield = 1
@@ -250,6 +253,29 @@ def testAgentZap_whenProxyIsProvided_RunScanWithProxyArguments(
     ]
 
 
+def testAgentZap_withSessionInWorkDir_createsSessionInScanDirWithoutDiskBudget(
+    scan_message_2: message.Message,
+    test_agent_with_session_in_work_dir: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message,],
+    tmp_path: pathlib.Path,
+) -> None:
+    """Tests the ZAP session goes to the per-scan work directory when asked, independently of the disk budget."""
+    del agent_mock
+    mocker.patch("agent.zap_wrapper.OUTPUT_DIR", str(tmp_path))
+    mock_subprocess = mocker.patch("subprocess.run", return_value=None)
+
+    test_agent_with_session_in_work_dir.start()
+    test_agent_with_session_in_work_dir.process(scan_message_2)
+
+    command = mock_subprocess.call_args[0][0]
+    session = pathlib.Path(
+        command[command.index("-z") + 1].removeprefix("-newsession ")
+    )
+    assert session.name == zap_wrapper.SESSION_FILE_NAME
+    assert session.parent.parent == tmp_path
+
+
 def testAgentZap_whenResultsContainFindingsOutOfScope_onlyInScopeTargetsShouldBeReports(
     scan_message_2: message.Message,
     test_agent_with_url_scope: zap_agent.ZapAgent,
@@ -272,3 +298,205 @@ def testAgentZap_whenResultsContainFindingsOutOfScope_onlyInScopeTargetsShouldBe
         assert mock_scan.is_called_once_with("https://test.ostorlab.co")
         assert len(agent_mock) == 1
         assert agent_mock[0].selector == "v3.report.vulnerability"
+
+
+def testAgentZap_withDnaIndex_whenOverlappingTargets_doesNotReportDuplicateVulnerabilities(
+    scan_message: message.Message,
+    scan_message_link: message.Message,
+    test_agent_with_dna_index: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message],
+) -> None:
+    """Ensure vulnerabilities already emitted for a previous message are not reported again."""
+    with (pathlib.Path(__file__).parent / "zap-test-output.json").open(
+        "r", encoding="utf-8"
+    ) as o:
+        mocker.patch("agent.zap_wrapper.ZapWrapper.scan", return_value=json.load(o))
+        mocker.patch("subprocess.run", return_value=EXEC_COMMAND_OUTPUT)
+        mocker.patch("builtins.open", new_callable=mock.mock_open())
+        test_agent_with_dna_index.start()
+
+        test_agent_with_dna_index.process(scan_message)
+        emitted_count = len(agent_mock)
+        test_agent_with_dna_index.process(scan_message_link)
+
+        assert emitted_count > 0
+        assert len(agent_mock) == emitted_count
+        dnas = [a.data.get("dna") for a in agent_mock]
+        assert len(dnas) == len(set(dnas))
+
+
+def testAgentZap_withDnaIndex_whenEmissionFails_reportsVulnerabilitiesAgain(
+    scan_message: message.Message,
+    test_agent_with_dna_index: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message],
+) -> None:
+    """Ensure the DNA of a vulnerability whose report failed is not recorded, the next scan reports it."""
+    with (pathlib.Path(__file__).parent / "zap-test-output.json").open(
+        "r", encoding="utf-8"
+    ) as o:
+        mocker.patch("agent.zap_wrapper.ZapWrapper.scan", return_value=json.load(o))
+    mocker.patch("subprocess.run", return_value=EXEC_COMMAND_OUTPUT)
+    mocker.patch("builtins.open", new_callable=mock.mock_open())
+    test_agent_with_dna_index.start()
+    report_mock = mocker.patch.object(
+        test_agent_with_dna_index,
+        "report_vulnerability",
+        side_effect=ConnectionError,
+    )
+
+    with pytest.raises(ConnectionError):
+        test_agent_with_dna_index.process(scan_message)
+    report_mock.side_effect = None
+    test_agent_with_dna_index.process(scan_message)
+
+    assert report_mock.call_count > 1
+    assert report_mock.call_args_list[0] == report_mock.call_args_list[1]
+
+
+def testAgentZap_withoutDnaIndex_whenTargetRescanned_reportsVulnerabilitiesAgain(
+    scan_message: message.Message,
+    test_agent: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message],
+) -> None:
+    """Ensure a rescan reports its vulnerabilities again when the emitted vulnerabilities index is not enabled."""
+    with (pathlib.Path(__file__).parent / "zap-test-output.json").open(
+        "r", encoding="utf-8"
+    ) as o:
+        mocker.patch("agent.zap_wrapper.ZapWrapper.scan", return_value=json.load(o))
+        mocker.patch("subprocess.run", return_value=EXEC_COMMAND_OUTPUT)
+        mocker.patch("builtins.open", new_callable=mock.mock_open())
+        test_agent.start()
+
+        test_agent.process(scan_message)
+        emitted_count = len(agent_mock)
+        test_agent.process(scan_message)
+
+        assert emitted_count > 0
+        assert len(agent_mock) == 2 * emitted_count
+
+
+def testAgentZap_withFindingsStore_onlyEmitsNewFindingsOnRescan(
+    scan_message: message.Message,
+    test_agent_with_findings_store: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message],
+) -> None:
+    """Ensure a rescan of a target only emits the findings that were not found by the previous scan."""
+    with (pathlib.Path(__file__).parent / "zap-test-output.json").open(
+        "r", encoding="utf-8"
+    ) as o:
+        results = json.load(o)
+    first_results = json.loads(json.dumps(results))
+    first_results["site"][0]["alerts"] = first_results["site"][0]["alerts"][1:]
+    mocker.patch(
+        "agent.zap_wrapper.ZapWrapper.scan", side_effect=[first_results, results]
+    )
+    mocker.patch("subprocess.run", return_value=EXEC_COMMAND_OUTPUT)
+    mocker.patch("builtins.open", new_callable=mock.mock_open())
+    test_agent_with_findings_store.start()
+
+    test_agent_with_findings_store.process(scan_message)
+    first_titles = {a.data.get("title") for a in agent_mock}
+    emitted_count = len(agent_mock)
+    test_agent_with_findings_store.process(scan_message)
+
+    new_titles = {a.data.get("title") for a in agent_mock[emitted_count:]}
+    assert emitted_count > 0
+    assert new_titles == {results["site"][0]["alerts"][0]["name"]}
+    assert new_titles.isdisjoint(first_titles) is True
+
+
+def testAgentZap_withFindingsStore_whenScanFails_keepsPreviousFindings(
+    scan_message: message.Message,
+    test_agent_with_findings_store: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message],
+) -> None:
+    """Ensure a failed scan does not resolve the previous findings, which are not emitted again on the next scan."""
+    with (pathlib.Path(__file__).parent / "zap-test-output.json").open(
+        "r", encoding="utf-8"
+    ) as o:
+        results = json.load(o)
+    mocker.patch(
+        "agent.zap_wrapper.ZapWrapper.scan", side_effect=[results, {}, results]
+    )
+    mocker.patch("subprocess.run", return_value=EXEC_COMMAND_OUTPUT)
+    mocker.patch("builtins.open", new_callable=mock.mock_open())
+    test_agent_with_findings_store.start()
+
+    test_agent_with_findings_store.process(scan_message)
+    emitted_count = len(agent_mock)
+    test_agent_with_findings_store.process(scan_message)
+    test_agent_with_findings_store.process(scan_message)
+
+    assert emitted_count > 0
+    assert len(agent_mock) == emitted_count
+
+
+def testAgentZap_withFindingsStore_whenEmissionFails_emitsFindingsAgain(
+    scan_message: message.Message,
+    test_agent_with_findings_store: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message],
+) -> None:
+    """Ensure the findings of a scan whose emission failed are not stored, the next scan emits them."""
+    with (pathlib.Path(__file__).parent / "zap-test-output.json").open(
+        "r", encoding="utf-8"
+    ) as o:
+        mocker.patch("agent.zap_wrapper.ZapWrapper.scan", return_value=json.load(o))
+    mocker.patch("subprocess.run", return_value=EXEC_COMMAND_OUTPUT)
+    mocker.patch("builtins.open", new_callable=mock.mock_open())
+    test_agent_with_findings_store.start()
+    report_mock = mocker.patch.object(
+        test_agent_with_findings_store,
+        "report_vulnerability",
+        side_effect=ConnectionError,
+    )
+
+    with pytest.raises(ConnectionError):
+        test_agent_with_findings_store.process(scan_message)
+    report_mock.side_effect = None
+    test_agent_with_findings_store.process(scan_message)
+
+    assert report_mock.call_count > 1
+
+
+def testAgentZap_whenProfilingSignal_profilesNextScan(
+    scan_message: message.Message,
+    test_agent: zap_agent.ZapAgent,
+    mocker: plugin.MockerFixture,
+    agent_mock: list[message.Message],
+    tmp_path: pathlib.Path,
+) -> None:
+    """Ensure the profiling signal profiles the next scan only, with a JFR recording of ZAP."""
+    mock_scan = mocker.patch("agent.zap_wrapper.ZapWrapper.scan", return_value={})
+    mocker.patch("agent.zap_agent.PROFILING_DIR", str(tmp_path))
+    test_agent.start()
+
+    test_agent._on_profiling_signal(zap_agent.PROFILING_SIGNAL, None)
+    test_agent.process(scan_message)
+    test_agent.process(scan_message)
+
+    profile_dirs = list(tmp_path.iterdir())
+    assert len(profile_dirs) == 1
+    assert (profile_dirs[0] / zap_agent.PYTHON_PROFILE_FILE_NAME).exists() is True
+    assert mock_scan.call_args_list[0].kwargs["jfr_recording_path"] == (
+        profile_dirs[0] / zap_agent.JFR_RECORDING_FILE_NAME
+    )
+    assert mock_scan.call_args_list[1].kwargs["jfr_recording_path"] is None
+
+
+def testAgentZap_whenStartedInWorkerThread_installsProfilingSignalHandler(
+    test_agent: zap_agent.ZapAgent,
+) -> None:
+    """Ensure the profiling signal is handled when the agent is started outside of the main thread, as in `run`."""
+    thread = threading.Thread(target=test_agent.start)
+    thread.start()
+    thread.join()
+
+    assert (
+        signal.getsignal(zap_agent.PROFILING_SIGNAL) == test_agent._on_profiling_signal
+    )
@@ -0,0 +1,301 @@
+"""Unit tests for the ZAP scan script hooks."""
+
+import json
+import pathlib
+from unittest import mock
+
+import pytest
+
+from agent import zap_hooks
+
+
+@pytest.fixture(autouse=True)
+def reset_hooks_state(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Drop the state kept by the hooks between runs."""
+    monkeypatch.setattr(zap_hooks, "_spider_urls_limiter", None)
+    monkeypatch.setattr(zap_hooks, "_proxy_follower", None)
+    monkeypatch.setattr(zap_hooks, "_history_pruner", None)
+
+
+def testZapPreShutdownHook_withActiveScans_dumpsRuleStats(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Validates the per-rule statistics are collected from the active scan progress."""
+    output_path = tmp_path / "rule_stats.json"
+    monkeypatch.setenv(zap_hooks.RULE_STATS_OUTPUT_ENV, str(output_path))
+    zap = mock.MagicMock()
+    zap.ascan.scans = [{"id": "0"}]
+    zap.ascan.scan_progress.return_value = [
+        "https://dummy.com",
+        {
+            "HostProcess": [
+                {
+                    "Plugin": [
+                        "Path Traversal",
+                        "6",
+                        "release",
+                        "Complete",
+                        "1200",
+                        "300",
+                        "1",
+                    ]
+                },
+                {
+                    "Plugin": [
+                        "SQL Injection",
+                        "40018",
+                        "release",
+                        "Skipped",
+                        "",
+                        "",
+                        "",
+                    ]
+                },
+            ]
+        },
+    ]
+
+    zap_hooks.zap_pre_shutdown(zap)
+
+    assert json.loads(output_path.read_text()) == [
+        {
+            "id": "6",
+            "name": "Path Traversal",
+            "status": "Complete",
+            "time_ms": 1200,
+            "request_count": 300,
+            "alert_count": 1,
+        },
+        {
+            "id": "40018",
+            "name": "SQL Injection",
+            "status": "Skipped",
+            "time_ms": 0,
+            "request_count": 0,
+            "alert_count": 0,
+        },
+    ]
+
+
+def testZapActiveScanHook_withRuleBudget_disablesSlowRulesAndCapsDuration(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Validates the slow rules are disabled in the scan policy and the rule duration is capped."""
+    monkeypatch.setenv(zap_hooks.DISABLED_RULES_ENV, "40018,6")
+    monkeypatch.setenv(zap_hooks.MAX_RULE_DURATION_ENV, "5")
+    zap = mock.MagicMock()
+
+    zap_hooks.zap_active_scan(zap, "https://dummy.com", "Default Policy")
+
+    zap.ascan.disable_scanners.assert_called_once_with(
+        "40018,6", scanpolicyname="Default Policy"
+    )
+    zap.ascan.set_option_max_rule_duration_in_mins.assert_called_once_with(5)
+
+
+def testSpiderHooks_withLimits_excludesUrlsStopsSpiderAndDumpsStats(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Validates the spider exclusions and max URLs are enforced and the URLs pruned by the limits are counted."""
+    output_path = tmp_path / "spider_stats.json"
+    monkeypatch.setenv(zap_hooks.SPIDER_EXCLUDE_ENV, json.dumps([".*/calendar/.*"]))
+    monkeypatch.setenv(zap_hooks.SPIDER_MAX_URLS_ENV, "2")
+    monkeypatch.setenv(zap_hooks.SPIDER_STATS_OUTPUT_ENV, str(output_path))
+    monkeypatch.setattr(zap_hooks, "SPIDER_POLL_INTERVAL_SECONDS", 0.01)
+    zap = mock.MagicMock()
+    zap.spider.scans = [{"id": "1", "state": "RUNNING"}]
+    zap.spider.results.return_value = ["https://dummy.com/a", "https://dummy.com/b"]
+    zap.spider.full_results.return_value = [
+        {
+            "urlsInScope": [
+                {"url": "https://dummy.com/a"},
+                {"url": "https://dummy.com/b"},
+            ]
+        },
+        {
+            "urlsOutOfScope": [
+                "https://dummy.com/calendar/2020",
+                "https://dummy.com/calendar/2021",
+                "https://dummy.com/a/b/c/d/e/f",
+                "https://other.com/",
+            ]
+        },
+    ]
+
+    zap_hooks.zap_spider(zap, "https://dummy.com")
+    zap_hooks._spider_urls_limiter.check()
+    zap_hooks.zap_pre_shutdown(zap)
+
+    zap.spider.exclude_from_scan.assert_called_once_with(".*/calendar/.*")
+    zap.spider.stop.assert_called_with(scanid="1")
+    assert json.loads(output_path.read_text()) == {
+        "urls_in_scope": 2,
+        "excluded_urls": 2,
+        "limited_urls": 1,
+        "max_urls_reached": True,
+    }
+
+
+def testProxyFollowerCheck_whenProxyFileChanges_switchesZapUpstreamProxy(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Validates ZAP is switched to the proxy the wrapper failed over to, and only once."""
+    proxy_file = tmp_path / "proxy"
+    proxy_file.write_text("http://proxy1:8080")
+    zap = mock.MagicMock()
+    follower = zap_hooks.ProxyFollower(zap, str(proxy_file))
+
+    follower.check()
+    proxy_file.write_text("http://proxy2:3128")
+    follower.check()
+    follower.check()
+
+    zap.network.set_http_proxy.assert_called_once_with("proxy2", "3128")
+
+
+def testScanEndpoints_withParallelism_scansEachEndpointInItsOwnContext(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Validates the endpoints are scanned in parallel contexts matching their URLs and are timed."""
+    monkeypatch.setattr(zap_hooks, "API_SCAN_POLL_INTERVAL_SECONDS", 0)
+    zap = mock.MagicMock()
+    zap.context.new_context.side_effect = ["1", "2", "3"]
+    zap.ascan.scan.side_effect = ["10", "11", "12"]
+    zap.ascan.status.return_value = "100"
+    endpoints = [
+        {"path": "/users", "methods": ["GET"]},
+        {"path": "/users/{id}", "methods": ["GET", "DELETE"]},
+        {"path": "/orders", "methods": ["POST"]},
+    ]
+
+    stats = zap_hooks.scan_endpoints(
+        zap, "https://dummy.com/v1", endpoints, "API-Minimal", parallelism=2
+    )
+
+    assert [s["path"] for s in stats] == ["/users", "/users/{id}", "/orders"]
+    assert all(s["time_ms"] >= 0 for s in stats)
+    zap.context.include_in_context.assert_any_call(
+        "agent-api-endpoint-1", r"https://dummy\.com/v1/users/[^/?]+(?:\?.*)?$"
+    )
+    zap.ascan.scan.assert_any_call(
+        contextid="3", recurse=True, scanpolicyname="API-Minimal"
+    )
+    assert zap.context.remove_context.call_count == 3
+
+
+def testApiSessionHooks_withSessionCopy_loadsItAndDoesNotSnapshotIt(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Validates the copy of the site tree of a previous import is loaded and kept as is."""
+    session_path = tmp_path / "api.session"
+    session_path.write_text("")
+    monkeypatch.setenv(zap_hooks.API_SESSION_ENV, str(session_path))
+    zap = mock.MagicMock()
+
+    zap_hooks.zap_started(zap, "/zap/wrk/empty-definition.json")
+    zap_hooks.zap_active_scan(zap, "https://dummy.com", None)
+
+    zap.core.load_session.assert_called_once_with(str(session_path))
+    zap.core.snapshot_session.assert_not_called()
+
+
+def testApiSessionHooks_withoutSessionCopy_snapshotsImportedSiteTree(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Validates the site tree imported from the definition is saved before the active scan."""
+    session_path = tmp_path / "api.session"
+    monkeypatch.setenv(zap_hooks.API_SESSION_ENV, str(session_path))
+    zap = mock.MagicMock()
+
+    zap_hooks.zap_started(zap, "/zap/wrk/definition")
+    zap_hooks.zap_active_scan(zap, "https://dummy.com", None)
+
+    zap.core.load_session.assert_not_called()
+    zap.core.snapshot_session.assert_called_once_with(
+        name=str(session_path), overwrite=True
+    )
+
+
+def testZapHooks_withSuppressedRules_disablesOnlyActiveScanRules(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Validates the fully suppressed active rules are disabled and the passive ones keep running on other hosts."""
+    monkeypatch.setenv(zap_hooks.SUPPRESSED_RULES_ENV, "10021,40018")
+    zap = mock.MagicMock()
+    zap.ascan.scanners.return_value = [{"id": "40018"}, {"id": "40012"}]
+    zap.ascan.disable_scanners.return_value = "OK"
+
+    zap_hooks.zap_started(zap, "https://dummy.com")
+    zap_hooks.zap_active_scan(zap, "https://dummy.com", "Default Policy")
+
+    zap.pscan.disable_scanners.assert_not_called()
+    zap.ascan.disable_scanners.assert_called_once_with(
+        "40018", scanpolicyname="Default Policy"
+    )
+
+
+def testZapActiveScanHook_whenDisablingSuppressedRulesFails_logsWarning(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Validates the errors returned by the ZAP API are reported."""
+    monkeypatch.setenv(zap_hooks.SUPPRESSED_RULES_ENV, "40018")
+    zap = mock.MagicMock()
+    zap.ascan.scanners.return_value = [{"id": "40018"}]
+    zap.ascan.disable_scanners.return_value = "Does Not Exist"
+
+    zap_hooks.zap_active_scan(zap, "https://dummy.com", "Missing Policy")
+
+    assert "could not disable the suppressed active scan rules" in caplog.text
+
+
+def testZapAjaxSpiderHook_withMaxDuration_overridesScriptMaxTime(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Validates the AJAX spider max duration replaces the -m value the scripts set it to."""
+    zap = mock.MagicMock()
+
+    assert zap_hooks.zap_ajax_spider(zap, "https://dummy.com", 10) == (
+        zap,
+        "https://dummy.com",
+        10,
+    )
+    monkeypatch.setenv(zap_hooks.AJAX_SPIDER_MAX_DURATION_ENV, "3")
+    assert zap_hooks.zap_ajax_spider(zap, "https://dummy.com", 10) == (
+        zap,
+        "https://dummy.com",
+        3,
+    )
+
+
+def testHistoryPrunerPrune_withThirdPartySites_deletesOnlyTheirHistory() -> None:
+    """Validates the history of the out-of-scope sites is pruned and the kept sites are left alone."""
+    zap = mock.MagicMock()
+    zap.core.sites = [
+        "https://dummy.com",
+        "https://www.dummy.com",
+        "https://partner.com",
+        "https://cdn.thirdparty.com",
+    ]
+    pruner = zap_hooks.HistoryPruner(
+        zap,
+        "https://dummy.com/app",
+        interval=60,
+        kept_sites=[
+            r"^[a-z]+://([^/]+\.)?dummy\.com(:\d+)?/?$",
+            r"https://partner\.com",
+        ],
+    )
+
+    pruner.prune()
+
+    zap.core.delete_site_node.assert_called_once_with("https://cdn.thirdparty.com")
+    assert pruner.pruned_sites == 1
+
+
+def testZapStartedHook_afterPreviousRun_dropsItsState() -> None:
+    """Validates the state of a previous hooks run does not leak into the next one."""
+    zap_hooks._spider_urls_limiter = zap_hooks.SpiderUrlsLimiter(mock.MagicMock(), 1)
+
+    zap_hooks.zap_started(mock.MagicMock(), "https://dummy.com")
+
+    assert zap_hooks._spider_urls_limiter is None
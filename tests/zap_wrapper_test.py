@@ -1,5 +1,8 @@
 """Unit test for the Zap wrapper class."""
 
+import json
+import pathlib
+import re
 import subprocess
 from unittest import mock
 
@@ -7,7 +10,7 @@ import pytest
 import tenacity
 from pytest_mock import plugin
 
-from agent import zap_wrapper
+from agent import metrics, proxy_pool, suppressions, zap_wrapper
 
 
 def testZapWrapperInit_withIncorrectProfile_raisesValueError():
@@ -58,3 +61,449 @@ def testZapWrapperScan_whenProxyNoSchema_shouldNotCallWithProxy(
         "-J",
         mock.ANY,
     ]
+
+
+def testZapWrapperScan_withAjaxSpiderOptions_callsWithAjaxSpiderConfig(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates wrapper passes the AJAX spider options to ZAP."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="baseline",
+        ajax_spider_browsers=2,
+        ajax_spider_headless=True,
+        ajax_spider_max_crawl_states=100,
+        ajax_spider_max_crawl_depth=5,
+        ajax_spider_max_duration=3,
+    )
+
+    zap.scan(target="https://dummy.com")
+
+    assert run_mock.call_args[0][0] == [
+        "/zap/zap-baseline.py",
+        "-d",
+        "-t",
+        "https://dummy.com",
+        "-z",
+        (
+            "-config ajaxSpider.browserId=firefox-headless "
+            "-config ajaxSpider.numberOfBrowsers=2 "
+            "-config ajaxSpider.maxCrawlStates=100 "
+            "-config ajaxSpider.maxCrawlDepth=5"
+        ),
+        f"--hook={zap_wrapper.ZAP_HOOKS_PATH}",
+        "-j",
+        "-J",
+        mock.ANY,
+    ]
+    assert run_mock.call_args.kwargs["env"]["ZAP_AGENT_AJAX_SPIDER_MAX_DURATION"] == "3"
+
+
+def testZapWrapperScan_withApiProfile_doesNotSampleAjaxSpiderBrowsers(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates the browsers memory is not sampled for the api profile, which never starts the AJAX spider."""
+    mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    rss_mock = mocker.patch("agent.zap_wrapper._browsers_rss_bytes", return_value=0)
+    zap = zap_wrapper.ZapWrapper(scan_profile="api")
+
+    zap.scan(target="https://dummy.com/openapi.json")
+
+    rss_mock.assert_not_called()
+
+
+def testBrowsersRssBytes_withBrowserProcesses_sumsBrowsersMemoryOnly(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates only the browser processes are accounted for in the memory usage."""
+    for pid, name, rss in [("1", "firefox-esr", 1000), ("2", "java", 5000)]:
+        (tmp_path / pid).mkdir()
+        (tmp_path / pid / "status").write_text(
+            f"Name:\t{name}\nVmRSS:\t  {rss} kB\n", encoding="utf-8"
+        )
+    mocker.patch.object(zap_wrapper, "PROC_DIR", str(tmp_path))
+
+    assert zap_wrapper._browsers_rss_bytes() == 1000 * 1024
+
+
+def testZapWrapperInit_withJvmHeapRatio_writesJvmOptionsAndPicksDatabaseMode(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the JVM is sized from the container memory limit and the database options are passed to ZAP."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    mocker.patch(
+        "agent.jvm.container_memory_limit_bytes", return_value=1024 * 1024 * 1024
+    )
+    jvm_properties = tmp_path / ".ZAP_JVM.properties"
+    mocker.patch("agent.jvm.ZAP_JVM_PROPERTIES_PATH", str(jvm_properties))
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="baseline",
+        jvm_heap_ratio=0.5,
+        database_mode="auto",
+        database_recovery_log=False,
+        history_prune_interval=60,
+    )
+
+    zap.scan(target="https://dummy.com")
+
+    assert jvm_properties.read_text() == "-Xmx512m -XX:+UseSerialGC\n"
+    assert run_mock.call_args[0][0][5] == "-lowmem -config database.recoverylog=false"
+    assert run_mock.call_args.kwargs["env"]["ZAP_AGENT_HISTORY_PRUNE_INTERVAL"] == "60"
+
+
+def testZapWrapperScan_withHistoryPruning_keepsSubdomainsAndScopeSites(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates the hooks keep the history of the target subdomains and of the in-scope sites."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="full",
+        history_prune_interval=60,
+        scope_urls_regex=r".*partner\.com.*",
+    )
+
+    zap.scan(target="https://example.co.uk")
+
+    kept_sites = [
+        re.compile(k)
+        for k in json.loads(
+            run_mock.call_args.kwargs["env"]["ZAP_AGENT_HISTORY_KEEP_SITES"]
+        )
+    ]
+
+    def _kept(site: str) -> bool:
+        return any(k.match(site) is not None for k in kept_sites)
+
+    assert _kept("https://example.co.uk") is True
+    assert _kept("https://www.example.co.uk") is True
+    assert _kept("http://api.example.co.uk:8080") is True
+    assert _kept("https://api.partner.com") is True
+    assert _kept("https://notexample.co.uk") is False
+    assert _kept("https://cdn.thirdparty.com") is False
+
+
+def testZapWrapperScan_always_removesScanWorkDirectory(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the report is read from the per-scan work directory, which is removed once the scan is done."""
+
+    def _write_report(command: list[str], **kwargs) -> None:
+        (tmp_path / command[-1]).write_text('{"site": []}', encoding="utf-8")
+
+    run_mock = mocker.patch("subprocess.run", side_effect=_write_report)
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", str(tmp_path))
+    zap = zap_wrapper.ZapWrapper(scan_profile="baseline")
+
+    results = zap.scan(target="https://dummy.com")
+
+    assert results == {"site": []}
+    assert run_mock.call_args[0][0][-1].startswith("scan-") is True
+    assert list(tmp_path.iterdir()) == []
+
+
+def testZapWrapperScan_withIncrementalIndex_carriesForwardUnchangedFindings(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the incremental scan runs the hooks and carries forward the findings on unchanged URLs."""
+    reports = [
+        {
+            "site": [
+                {
+                    "@name": "https://dummy.com",
+                    "alerts": [
+                        {
+                            "pluginid": "1",
+                            "instances": [{"uri": "https://dummy.com/stable"}],
+                        }
+                    ],
+                }
+            ]
+        },
+        {"site": [{"@name": "https://dummy.com", "alerts": []}]},
+    ]
+    output_dir = tmp_path / "wrk"
+    output_dir.mkdir()
+
+    def _run(command: list[str], env: dict[str, str], **kwargs) -> None:
+        report_path = output_dir / command[-1]
+        report_path.write_text(json.dumps(reports.pop(0)), encoding="utf-8")
+        pathlib.Path(env["ZAP_AGENT_INCREMENTAL_OUTPUT"]).write_text(
+            json.dumps(
+                {
+                    "fingerprints": {"https://dummy.com/stable": {"hash": "x"}},
+                    "unchanged_urls": ["https://dummy.com/stable"],
+                }
+            ),
+            encoding="utf-8",
+        )
+
+    run_mock = mocker.patch("subprocess.run", side_effect=_run)
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", str(output_dir))
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="full", incremental_index_dir=str(tmp_path / "index")
+    )
+
+    zap.scan(target="https://dummy.com")
+    results = zap.scan(target="https://dummy.com")
+
+    assert f"--hook={zap_wrapper.ZAP_HOOKS_PATH}" in run_mock.call_args[0][0]
+    assert results["site"][0]["alerts"][0]["instances"] == [
+        {"uri": "https://dummy.com/stable"}
+    ]
+
+
+def testZapWrapperScan_withRuleTimeBudget_passesBudgetToHooks(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates the rule budget and the slow rules are passed to the scan script hooks."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    mocker.patch(
+        "agent.rule_stats.RuleStatsStore.rules_to_skip", return_value=["40018", "6"]
+    )
+    zap = zap_wrapper.ZapWrapper(scan_profile="full", rule_time_budget=5)
+
+    zap.scan(target="https://dummy.com")
+
+    env = run_mock.call_args.kwargs["env"]
+    assert env["ZAP_AGENT_MAX_RULE_DURATION"] == "10"
+    assert env["ZAP_AGENT_DISABLED_RULES"] == "40018,6"
+    assert "ZAP_AGENT_RULE_STATS_OUTPUT" in env
+    assert f"--hook={zap_wrapper.ZAP_HOOKS_PATH}" in run_mock.call_args[0][0]
+
+
+def testZapWrapperScan_withSpiderLimits_passesLimitsToZapAndHooks(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates the spider crawl-shape limits are passed to ZAP and to the scan script hooks."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="baseline",
+        spider_max_depth=5,
+        spider_max_children=20,
+        spider_max_urls=1000,
+        spider_normalize_query=True,
+        spider_exclude_urls_regex=[".*/calendar/.*"],
+    )
+
+    zap.scan(target="https://dummy.com")
+
+    command = run_mock.call_args[0][0]
+    assert command[5] == (
+        "-config spider.maxDepth=5 -config spider.maxChildren=20 "
+        "-config spider.handleParameters=IGNORE_VALUE"
+    )
+    assert f"--hook={zap_wrapper.ZAP_HOOKS_PATH}" in command
+    env = run_mock.call_args.kwargs["env"]
+    assert env["ZAP_AGENT_SPIDER_MAX_URLS"] == "1000"
+    assert json.loads(env["ZAP_AGENT_SPIDER_EXCLUDE"]) == [".*/calendar/.*"]
+
+
+def testZapWrapperScan_withProxyPool_usesAssignedProxyAndReleasesIt(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates the scan goes through the proxy assigned by the pool, which the hooks follow on failover."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    pool = proxy_pool.ProxyPool(["http://proxy1:8080"])
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="baseline", proxy="http://ignored:1", proxy_pool=pool
+    )
+
+    zap.scan(target="https://dummy.com")
+
+    command = run_mock.call_args[0][0]
+    assert command[5] == (
+        "-config network.connection.httpProxy.enabled=true -config "
+        "network.connection.httpProxy.host=proxy1 -config "
+        "network.connection.httpProxy.port=8080"
+    )
+    assert f"--hook={zap_wrapper.ZAP_HOOKS_PATH}" in command
+    env = run_mock.call_args.kwargs["env"]
+    assert env["ZAP_AGENT_PROXY_FILE"].endswith(zap_wrapper.PROXY_FILE_NAME)
+    assert pool.proxies[0].active_scans == 0
+
+
+def testZapWrapperScan_withApiDefinitionCache_importsCachedDefinitionAndScansEndpoints(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the api script imports the cached definition and the hooks get the endpoints to scan."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", str(tmp_path / "wrk"))
+    (tmp_path / "wrk").mkdir()
+    mocker.patch(
+        "agent.api_definitions.fetch",
+        return_value=b'{"openapi": "3.0.0", "paths": {"/users": {"get": {}}}}',
+    )
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="api",
+        crawl_timeout=10,
+        api_definition_cache_dir=str(tmp_path / "cache"),
+        api_scan_parallelism=4,
+    )
+
+    zap.scan(target="https://dummy.com:8443/openapi.json")
+
+    command = run_mock.call_args[0][0]
+    assert command[:8] == [
+        "/zap/zap-api-scan.py",
+        "-d",
+        "-t",
+        mock.ANY,
+        "-f",
+        "openapi",
+        "-O",
+        "dummy.com:8443",
+    ]
+    # The script reads the definition relative to its output directory.
+    definition_path = (tmp_path / "wrk" / command[3]).resolve()
+    assert definition_path.parent == tmp_path / "cache"
+    assert definition_path.read_bytes().startswith(b'{"openapi"')
+    assert "-j" not in command and "-m" not in command
+    env = run_mock.call_args.kwargs["env"]
+    assert env["ZAP_AGENT_API_BASE_URL"] == "https://dummy.com:8443/"
+    assert env["ZAP_AGENT_API_SCAN_PARALLELISM"] == "4"
+    session_path = pathlib.Path(env["ZAP_AGENT_API_SESSION"])
+    assert session_path.name == zap_wrapper.API_SESSION_FILE_NAME
+    assert session_path.parent.name.startswith(zap_wrapper.WORK_DIR_PREFIX)
+
+
+def testZapWrapperScan_withApiDefinitionCacheAndProxy_fetchesDefinitionThroughProxy(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the API definition is fetched through the proxy of the scan, files relative to the output dir."""
+    mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", str(tmp_path))
+    fetch_mock = mocker.patch(
+        "agent.api_definitions.fetch",
+        return_value=b'{"openapi": "3.0.0", "paths": {"/users": {"get": {}}}}',
+    )
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="api",
+        proxy="http://proxy.dummy.com:8080",
+        api_definition_cache_dir=str(tmp_path / "cache"),
+    )
+
+    zap.scan(target="https://dummy.com/openapi.json")
+
+    fetch_mock.assert_called_once_with(
+        "https://dummy.com/openapi.json",
+        proxy="http://proxy.dummy.com:8080",
+        local_dir=str(tmp_path),
+    )
+
+
+def testZapWrapperScan_withCachedApiSession_loadsACopyAndImportsAnEmptyDefinition(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the session snapshot of a scan is cached and the next scan loads a copy instead of importing."""
+    (tmp_path / "wrk").mkdir()
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", str(tmp_path / "wrk"))
+    mocker.patch(
+        "agent.api_definitions.fetch",
+        return_value=b'{"openapi": "3.0.0", "paths": {"/users": {"get": {}}}}',
+    )
+    imported_definitions = []
+
+    def _run(command: list[str], env: dict[str, str], **kwargs) -> None:
+        del kwargs
+        imported_definitions.append(
+            json.loads((tmp_path / "wrk" / command[3]).read_text())
+        )
+        session_path = pathlib.Path(env["ZAP_AGENT_API_SESSION"])
+        if session_path.exists() is False:
+            # Snapshot taken by the active scan hook.
+            session_path.write_text("imported site tree")
+        else:
+            session_path.write_text("scan history")
+
+    mocker.patch("subprocess.run", side_effect=_run)
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="api", api_definition_cache_dir=str(tmp_path / "cache")
+    )
+
+    zap.scan(target="https://dummy.com/openapi.json")
+    zap.scan(target="https://dummy.com/openapi.json")
+
+    assert imported_definitions[0]["paths"] == {"/users": {"get": {}}}
+    assert imported_definitions[1]["paths"] == {}
+    cached_sessions = list((tmp_path / "cache").glob("*.session"))
+    assert len(cached_sessions) == 1
+    assert cached_sessions[0].read_text() == "imported site tree"
+
+
+def testZapWrapperScan_withSuppressionIndex_disablesRulesSuppressedOnTargetHost(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates only the rules suppressed on all the paths of the target host are passed to the hooks."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    index = suppressions.SuppressionIndex(
+        [
+            {"plugin_id": "10021", "host": "*.dummy.com"},
+            {"plugin_id": "40018", "host": "www.dummy.com", "path": "^/static/"},
+            {"plugin_id": "10038", "host": "other.com"},
+        ]
+    )
+    zap = zap_wrapper.ZapWrapper(scan_profile="full", suppression_index=index)
+
+    zap.scan(target="https://www.dummy.com")
+
+    assert run_mock.call_args.kwargs["env"]["ZAP_AGENT_SUPPRESSED_RULES"] == "10021"
+
+
+def testZapWrapperScan_withScanSession_keepsSessionInScanDir(
+    mocker: plugin.MockerFixture, tmp_path: pathlib.Path
+) -> None:
+    """Validates the ZAP session is created in the per-scan work directory, removed with it after the scan."""
+    run_mock = mocker.patch("subprocess.run")
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", str(tmp_path))
+    zap = zap_wrapper.ZapWrapper(
+        scan_profile="baseline", work_dir=str(tmp_path), scan_session=True
+    )
+
+    zap.scan(target="https://dummy.com")
+
+    command = run_mock.call_args[0][0]
+    session = pathlib.Path(command[5].removeprefix("-newsession "))
+    assert session.name == zap_wrapper.SESSION_FILE_NAME
+    assert session.parent.name.startswith(zap_wrapper.WORK_DIR_PREFIX)
+    assert session.parent.parent == tmp_path
+    assert list(tmp_path.iterdir()) == []
+
+
+def testZapWrapperScan_withSpiderDepthLimit_reportsUrlsPrunedByTheLimits(
+    mocker: plugin.MockerFixture,
+) -> None:
+    """Validates the URLs pruned by the spider max depth and children, counted by the hooks, are reported."""
+
+    def _run(command: list[str], env: dict[str, str], **kwargs) -> None:
+        del command, kwargs
+        pathlib.Path(env["ZAP_AGENT_SPIDER_STATS_OUTPUT"]).write_text(
+            json.dumps(
+                {
+                    "urls_in_scope": 10,
+                    "excluded_urls": 0,
+                    "limited_urls": 4,
+                    "max_urls_reached": False,
+                }
+            )
+        )
+
+    mocker.patch("subprocess.run", side_effect=_run)
+    mocker.patch.object(zap_wrapper, "OUTPUT_DIR", "/tmp")
+    zap = zap_wrapper.ZapWrapper(scan_profile="baseline", spider_max_depth=2)
+
+    zap.scan(target="https://dummy.com")
+
+    assert (
+        metrics.get("zap_spider_pruned_urls", {"limit": "max_depth_or_children"}) == 4
+    )
+    assert (
+        metrics.get("zap_spider_urls_in_scope", {"target": "https://dummy.com"}) == 10
+    )